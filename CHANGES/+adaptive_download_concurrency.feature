@@ -0,0 +1,5 @@
+The number of concurrent downloads from each upstream host is now lowered when the host is slow,
+returns error responses or asks to wait with a ``Retry-After`` header, and recovers afterwards. It
+never grows beyond the ``download_concurrency`` of the remote, which still restricts the downloads
+from all the hosts of the remote. The current limits are shown in the suffix of the download
+progress reports.
@@ -0,0 +1 @@
+Improved the performance of sync by saving new content units in bulk in ``ContentSaver``.
@@ -0,0 +1 @@
+Reduced the memory usage of mirrored syncs. ``ContentAssociation`` stages the received content in a temporary table and computes the content to remove in the database, instead of keeping the content of the whole repository in memory.
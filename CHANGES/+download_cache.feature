@@ -0,0 +1,3 @@
+Added the ``DOWNLOAD_CACHE_DIR`` setting to cache remote metadata on disk and revalidate it with
+conditional requests instead of downloading it again on every sync. The cache is pruned down to
+the ``DOWNLOAD_CACHE_MAX_SIZE`` setting.
@@ -0,0 +1,3 @@
+Added the ``DOWNLOAD_DEDUPLICATION`` setting. With it, sync tasks running at the same time no longer
+download the same artifacts twice: the download of an artifact is claimed cluster-wide by its
+sha256, and other tasks wait for it to be saved and reuse it.
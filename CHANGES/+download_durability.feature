@@ -0,0 +1,3 @@
+Added the ``DOWNLOAD_DURABILITY`` setting. Setting it to ``"batch"`` flushes the artifact files
+downloaded by a sync to disk once per batch of saved artifacts instead of fsyncing every file, which
+speeds up syncing many small files. Other downloads, e.g. of metadata, are still fsynced one by one.
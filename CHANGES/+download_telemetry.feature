@@ -0,0 +1,3 @@
+Added per-remote and per-host download statistics: the time to first byte, duration, size, retries
+and final status of each download are exported as OpenTelemetry metrics, and summed up per task
+into the new ``download_stats`` field of the task.
@@ -0,0 +1,3 @@
+Syncs into domains using S3, Azure or Google Cloud Storage now upload the files of the artifacts in
+parallel, up to the new ``ARTIFACT_UPLOAD_CONCURRENCY`` setting, before inserting them into the
+database.
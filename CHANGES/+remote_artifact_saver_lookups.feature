@@ -0,0 +1 @@
+Improved the performance of ``RemoteArtifactSaver`` by matching the prefetched content artifacts and remote artifacts with dictionary lookups.
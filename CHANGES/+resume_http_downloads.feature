@@ -0,0 +1,2 @@
+Retried HTTP downloads now resume where the previous attempt stopped when the server supports range
+requests, instead of starting over.
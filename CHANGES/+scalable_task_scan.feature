@@ -0,0 +1,2 @@
+Workers now only lock the waiting tasks whose resources are free when looking for a task to run,
+and scan the incomplete tasks through a partial index, so large task backlogs drain faster.
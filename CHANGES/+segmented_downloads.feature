@@ -0,0 +1,2 @@
+Added the ``DOWNLOAD_SEGMENTS`` setting to download large files from HTTP servers supporting range
+requests as several byte ranges in parallel.
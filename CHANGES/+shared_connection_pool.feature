@@ -0,0 +1,3 @@
+Remotes with the same TLS configuration now share their connection pool within a process, reusing
+connections, TLS sessions and DNS lookups to the same hosts. The pool can be tuned with the new
+``DOWNLOAD_CONNECTION_POOL`` setting.
@@ -0,0 +1,2 @@
+Added the ``DOWNLOAD_SHARED_LIMITS`` setting, which makes all the workers and content apps share the
+``rate_limit`` and ``download_concurrency`` of a remote through the database.
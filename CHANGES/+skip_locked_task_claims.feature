@@ -0,0 +1,2 @@
+Workers now claim their tasks with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers
+pick different tasks instead of contending for the oldest one.
@@ -0,0 +1,2 @@
+Tasks and uploads now stage their files in ``MEDIA_ROOT/tmp/staging`` when the ``WORKING_DIRECTORY``
+is on another filesystem, so saving artifacts moves the files instead of copying them.
@@ -0,0 +1,3 @@
+Workers fork their task executor processes ahead of the tasks and connect them to the database,
+and can reuse them for several tasks with the new ``TASK_EXECUTOR_MAX_TASKS`` and
+``TASK_EXECUTOR_MAX_MEMORY`` settings, cutting the startup time of small tasks.
@@ -0,0 +1,2 @@
+Added the ``--slots N`` option to ``pulpcore-worker``, which runs up to *N* tasks at a time in one
+worker, sharing its heartbeat and database connection.
@@ -0,0 +1,3 @@
+Files saved into a filesystem storage from outside of the working directory, e.g. downloaded in place
+from file:// remotes, are now cloned or copied by the kernel where the filesystems support it. Pulp
+no longer deletes files outside of its staging directories after saving them.
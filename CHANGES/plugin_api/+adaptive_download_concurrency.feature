@@ -0,0 +1,2 @@
+Added ``AdaptiveSemaphore``, which the ``DownloaderFactory`` uses to restrict the concurrent
+HTTP downloads per host, and ``DownloaderFactory.limits()`` returning their current limits.
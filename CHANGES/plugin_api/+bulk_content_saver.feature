@@ -0,0 +1,3 @@
+Added support for Master/Detail content models to ``ContentManager.bulk_get_or_create()``. The
+``ContentSaver`` stage uses it to save new content in bulk, unless the content model overrides
+``save()`` or uses lifecycle hooks.
@@ -0,0 +1 @@
+Added the ``artifact_attributes`` argument to ``DeclarativeArtifact``. It holds the size and digests of the artifact, and the unsaved ``Artifact`` is only built when it is needed, lowering the memory usage of the sync pipeline.
@@ -0,0 +1,2 @@
+Added ``DownloadCache`` and the ``use_cache`` option of ``Remote.get_downloader`` to revalidate
+previously downloaded metadata with conditional HTTP requests.
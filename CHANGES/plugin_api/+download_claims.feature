@@ -0,0 +1,3 @@
+Added ``DeclarativeArtifact.download_claimed``, set by the ``ArtifactDownloader`` while it holds the
+cluster-wide claim on the download of an artifact with ``DOWNLOAD_DEDUPLICATION``, which the
+``ArtifactSaver`` releases.
@@ -0,0 +1,2 @@
+The downloaders now write and hash the downloaded data on a thread pool instead of the event loop,
+so the download throughput is no longer limited to one CPU core.
@@ -0,0 +1,3 @@
+Added a size-aware scheduling of the downloads to ``GenericDownloader``. Large downloads run in a
+separate lane limited by ``max_concurrent_large_downloads``, and ``max_bytes_in_flight`` caps the
+total size of the downloads in flight, starting the smallest ones first.
@@ -0,0 +1,4 @@
+Added the ``in_place`` option of ``FileDownloader``, which hashes the file in place and returns the
+path of the file itself as the ``DownloadResult.path``, so it is not copied through Pulp. Whoever
+uses such a result must not delete or modify the file. Without it, the ``DownloadResult.path`` is
+now the copy written by the downloader instead of the source file.
@@ -0,0 +1,3 @@
+Added the ``resumable`` option to ``DeclarativeVersion``. A failed sync keeps its incomplete
+repository version, and a retried sync resumes it, skipping the content already associated by the
+failed run with the new ``QueryAssociatedContents`` stage.
@@ -0,0 +1,2 @@
+Added the ``segments`` and ``min_segment_size`` options to ``HttpDownloader`` to download large files
+as several byte ranges in parallel.
@@ -0,0 +1,2 @@
+Added the ``shards`` option to ``DeclarativeVersion`` and the ``ShardedStages`` stage, which run
+the stages of a sync pipeline in several subprocesses to use more than one CPU core.
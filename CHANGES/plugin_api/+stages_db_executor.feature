@@ -0,0 +1,3 @@
+Added ``sync_to_db`` to run the database work of stages on a pipeline-scoped pool of threads, each
+with its own database connection. The size of the pool is set by the new ``db_workers`` argument of
+``create_pipeline``. The builtin stages use it, so their database work can run in parallel.
@@ -0,0 +1,3 @@
+Added ``pulpcore.plugin.util.sync_filesystems`` to flush downloaded files to disk before saving them
+as artifacts, and the ``defer_fsync`` attribute of the downloaders, which ``DeclarativeArtifact``
+sets when ``DOWNLOAD_DURABILITY`` is set to ``"batch"``.
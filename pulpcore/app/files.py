@@ -1,24 +1,37 @@
 import os
+import tempfile
 from gettext import gettext as _
 
-from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
 from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from pygtrie import StringTrie
 
 from pulpcore.app import models
 from pulpcore.app import pulp_hashlib
+from pulpcore.app.models.storage import get_staging_directory
+from pulpcore.app.util import get_domain
 
 
 class PulpTemporaryUploadedFile(TemporaryUploadedFile):
     """
     A file uploaded to a temporary location in Pulp.
+
+    The file is created in the ``FILE_UPLOAD_TEMP_DIR``, or in the staging directory of the storage
+    of the domain if they are on different filesystems, so it is moved into the storage when saved.
     """
 
     def __init__(self, name, content_type, size, charset, content_type_extra=None):
         self.hashers = {}
         for hasher in models.Artifact.DIGEST_FIELDS:
             self.hashers[hasher] = pulp_hashlib.new(hasher)
-        super().__init__(name, content_type, size, charset, content_type_extra)
+        staging_directory = get_staging_directory(get_domain())
+        if staging_directory is None:
+            super().__init__(name, content_type, size, charset, content_type_extra)
+            return
+        os.makedirs(staging_directory, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=staging_directory)
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
 
     @classmethod
     def from_file(cls, file):
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0112_alter_upstreampulp_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RemoteRateLimit",
+            fields=[
+                (
+                    "remote",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="core.remote",
+                    ),
+                ),
+                ("theoretical_arrival_time", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0113_remoteratelimit"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("state__in", ("waiting", "running", "canceling"))),
+                fields=["pulp_created"],
+                name="core_task_incomplete_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0114_task_incomplete_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="download_stats",
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -61,6 +61,7 @@ from .publication import (
 
 from .repository import (
     Remote,
+    RemoteRateLimit,
     Repository,
     RepositoryContent,
     RepositoryVersion,
@@ -17,6 +17,7 @@ from itertools import chain
 from django.conf import settings
 from django.core import validators
 from django.db import IntegrityError, models, transaction
+from django.db.models.constants import OnConflict
 from django.forms.models import model_to_dict
 from django.utils.timezone import now
 from django_guid import get_guid
@@ -503,6 +504,87 @@ class ContentManager(BulkCreateManager):
             timestamp_of_interest__lt=expiration,
         )
 
+    def bulk_get_or_create(self, objs, batch_size=None):
+        """
+        Insert the list of content units into the database and get existing ones from the database.
+
+        In contrast to :meth:`BulkCreateManager.bulk_get_or_create` this supports the Master/Detail
+        content models. The detail rows are inserted first using ``INSERT ... ON CONFLICT DO NOTHING
+        RETURNING``, and the master rows are inserted only for the units actually created. This is
+        safe because the foreign key of the detail table is only checked when the transaction
+        commits. The units conflicting with already existing ones are then fetched in a single
+        query by their natural key and replace their unsaved counterparts in the returned list.
+
+        Like `bulk_create()`, this does *not* call save() on the instances and does not run any
+        signals or lifecycle hooks.
+
+        Args:
+            objs (iterable of :class:`~pulpcore.plugin.models.Content`): an iterable of unsaved
+                instances of the content model of this manager
+            batch_size (int): how many are created in a single query
+
+        Returns:
+            List of instances that were inserted into or retrieved from the database.
+
+        Raises:
+            IntegrityError: When a unit conflicts with a row that cannot be found by its natural
+                key.
+        """
+        objs = list(objs)
+        parent_link = self.model._meta.pk
+        if not objs or parent_link.remote_field is None:
+            # Nothing to do, or this is the master model itself.
+            return super().bulk_get_or_create(objs, batch_size=batch_size)
+
+        master_model = parent_link.related_model
+        for obj in objs:
+            if not obj.pulp_type:
+                obj.pulp_type = obj.get_pulp_type()
+            setattr(obj, parent_link.attname, getattr(obj, parent_link.target_field.attname))
+
+        batch_size = batch_size or len(objs)
+        created_pks = set()
+        with transaction.atomic(using=self.db, savepoint=False):
+            for i in range(0, len(objs), batch_size):
+                batch = objs[i : i + batch_size]
+                rows = self._insert(
+                    batch,
+                    fields=self.model._meta.local_concrete_fields,
+                    returning_fields=[parent_link],
+                    using=self.db,
+                    on_conflict=OnConflict.IGNORE,
+                )
+                # A single row insert returns `None` instead of a row on conflict.
+                batch_created_pks = {row[0] for row in rows if row}
+                created = [obj for obj in batch if obj.pk in batch_created_pks]
+                if created:
+                    master_model._base_manager._insert(
+                        created, fields=master_model._meta.local_concrete_fields, using=self.db
+                    )
+                created_pks.update(batch_created_pks)
+
+        existing_q = models.Q(pk__in=[])
+        for obj in objs:
+            if obj.pk in created_pks:
+                obj._state.adding = False
+                obj._state.db = self.db
+            else:
+                existing_q |= obj.q()
+
+        if len(created_pks) < len(objs):
+            existing = {content.natural_key(): content for content in self.filter(existing_q)}
+            for i, obj in enumerate(objs):
+                if obj._state.adding:
+                    try:
+                        objs[i] = existing[obj.natural_key()]
+                    except KeyError:
+                        raise IntegrityError(
+                            _("Could neither create nor find {}: {}").format(
+                                self.model.__name__, obj.natural_key_dict()
+                            )
+                        )
+        return objs
+
 
 ContentManager = ContentManager.from_queryset(BulkTouchQuerySet)
 
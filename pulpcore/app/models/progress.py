@@ -119,6 +119,9 @@ class ProgressReport(BaseModel):
 
     _using_context_manager = False
     _last_save_time = None
+    # A callable receiving the progress reports instead of saving them, set in the subprocesses of
+    # pulpcore.plugin.stages.ShardedStages to forward their progress to the parent process
+    _forward = None
 
     def save(self, *args, **kwargs):
         """
@@ -132,16 +135,16 @@ class ProgressReport(BaseModel):
         """
         now = timezone.now()
 
-        if not self.task_id:
-            self.task = Task.current()
-
         if self._using_context_manager and self._last_save_time:
-            if now - self._last_save_time >= datetime.timedelta(milliseconds=self.BATCH_INTERVAL):
-                super().save(*args, **kwargs)
-                self._last_save_time = now
+            if now - self._last_save_time < datetime.timedelta(milliseconds=self.BATCH_INTERVAL):
+                return
+        if self._forward is not None:
+            self._forward(self)
         else:
+            if not self.task_id:
+                self.task = Task.current()
             super().save(*args, **kwargs)
-            self._last_save_time = now
+        self._last_save_time = now
 
     async def asave(self, *args, **kwargs):
         """
@@ -155,16 +158,16 @@ class ProgressReport(BaseModel):
         """
         now = timezone.now()
 
-        if not self.task_id:
-            self.task = Task.current()
-
         if self._using_context_manager and self._last_save_time:
-            if now - self._last_save_time >= datetime.timedelta(milliseconds=self.BATCH_INTERVAL):
-                await super().asave(*args, **kwargs)
-                self._last_save_time = now
+            if now - self._last_save_time < datetime.timedelta(milliseconds=self.BATCH_INTERVAL):
+                return
+        if self._forward is not None:
+            self._forward(self)
         else:
+            if not self.task_id:
+                self.task = Task.current()
             await super().asave(*args, **kwargs)
-            self._last_save_time = now
+        self._last_save_time = now
 
     def __enter__(self):
         """
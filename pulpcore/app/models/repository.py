@@ -28,6 +28,7 @@ from pulpcore.app.util import (
 )
 from pulpcore.constants import ALL_KNOWN_CONTENT_CHECKSUMS
 from pulpcore.download.factory import DownloaderFactory
+from pulpcore.download.shared_limits import SharedThrottler
 from pulpcore.exceptions import ResourceImmutableError
 
 from pulpcore.cache import Cache
@@ -132,7 +133,7 @@ class Repository(MasterModel):
         self.save()
         version.save()
 
-    def new_version(self, base_version=None):
+    def new_version(self, base_version=None, resume=False):
         """
         Create a new RepositoryVersion for this Repository
 
@@ -142,25 +143,31 @@ class Repository(MasterModel):
             repository (pulpcore.app.models.Repository): to create a new version of
             base_version (pulpcore.app.models.RepositoryVersion): an optional repository version
                 whose content will be used as the set of content for the new version
+            resume (bool): When set to 'True', an incomplete latest version left behind by an
+                interrupted task with the same `base_version` is returned instead of being deleted,
+                and the returned version is not deleted if it fails again.
 
         Returns:
             pulpcore.app.models.RepositoryVersion: The Created RepositoryVersion
         """
         with transaction.atomic():
-            latest_version = self.versions.latest()
-            if not latest_version.complete:
-                latest_version.delete()
-
-            version = RepositoryVersion(
-                repository=self, number=int(self.next_version), base_version=base_version
-            )
-            version.save()
+            version = self.versions.latest()
+            resumable = resume and version.base_version_id == getattr(base_version, "pk", None)
+            if version.complete or not resumable:
+                if not version.complete:
+                    version.delete()
+
+                version = RepositoryVersion(
+                    repository=self, number=int(self.next_version), base_version=base_version
+                )
+                version.save()
 
-            if base_version:
-                # first remove the content that isn't in the base version
-                version.remove_content(version.content.exclude(pk__in=base_version.content))
-                # now add any content that's in the base_version but not in version
-                version.add_content(base_version.content.exclude(pk__in=version.content))
+                if base_version:
+                    # first remove the content that isn't in the base version
+                    version.remove_content(version.content.exclude(pk__in=base_version.content))
+                    # now add any content that's in the base_version but not in version
+                    version.add_content(base_version.content.exclude(pk__in=version.content))
+            version._resumable = resume
 
             if Task.current() and not self.user_hidden:
                 resource = CreatedResource(content_object=version)
@@ -421,6 +428,13 @@ class Remote(MasterModel):
 
     pulp_domain = models.ForeignKey("Domain", default=get_domain_pk, on_delete=models.PROTECT)
 
+    def __getstate__(self):
+        # The downloader factory and the throttler are bound to the event loop of this process.
+        state = super().__getstate__()
+        state.pop("_download_factory", None)
+        state.pop("_download_throttler", None)
+        return state
+
     @property
     def download_factory(self):
         """
@@ -446,7 +460,8 @@ class Remote(MasterModel):
         """
         Return the Throttler which can be used to rate limit downloaders.
 
-        Upon first access, the Throttler is instantiated and saved internally.
+        Upon first access, the Throttler is instantiated and saved internally. With the
+        ``DOWNLOAD_SHARED_LIMITS`` setting, the rate limit is shared by all Pulp processes.
         Plugin writers are expected to override when additional configuration of the
         DownloaderFactory is needed.
 
@@ -458,7 +473,10 @@ class Remote(MasterModel):
             return self._download_throttler
         except AttributeError:
             if self.rate_limit:
-                self._download_throttler = Throttler(rate_limit=self.rate_limit)
+                if settings.DOWNLOAD_SHARED_LIMITS:
+                    self._download_throttler = SharedThrottler(self.pk, self.rate_limit)
+                else:
+                    self._download_throttler = Throttler(rate_limit=self.rate_limit)
                 return self._download_throttler
 
     def get_downloader(self, remote_artifact=None, url=None, download_factory=None, **kwargs):
@@ -557,6 +575,29 @@ class Remote(MasterModel):
         unique_together = ("name", "pulp_domain")
 
 
+class RemoteRateLimit(models.Model):
+    """
+    The state of the rate limit of a remote shared by all Pulp processes.
+
+    It is used by :class:`~pulpcore.download.shared_limits.SharedThrottler` when the
+    ``DOWNLOAD_SHARED_LIMITS`` setting is enabled.
+
+    Fields:
+
+        theoretical_arrival_time (models.DateTimeField): The time the next request to the remote
+            is scheduled at if the rate limit is reached, see the generic cell rate algorithm.
+
+    Relations:
+
+        remote (models.OneToOneField): The remote being rate limited.
+    """
+
+    remote = models.OneToOneField(
+        Remote, primary_key=True, on_delete=models.CASCADE, related_name="+"
+    )
+    theoretical_arrival_time = models.DateTimeField()
+
+
 class RepositoryContent(BaseModel):
     """
     Association between a repository and its contained content.
@@ -661,6 +702,9 @@ class RepositoryVersion(BaseModel):
 
     objects = RepositoryVersionQuerySet.as_manager()
 
+    # Set by Repository.new_version(resume=True) to keep the version around on failures.
+    _resumable = False
+
     repository = models.ForeignKey(Repository, on_delete=models.CASCADE)
     number = models.PositiveIntegerField(db_index=True)
     complete = models.BooleanField(db_index=True, default=False)
@@ -886,7 +930,7 @@ class RepositoryVersion(BaseModel):
         if self.complete:
             raise ResourceImmutableError(self)
 
-        if not content or not content.count():
+        if content is None or not content.exists():
             return
 
         # Normalize representation if content has already been added in this version.
@@ -1094,9 +1138,12 @@ class RepositoryVersion(BaseModel):
     def __exit__(self, exc_type, exc_value, traceback):
         """
         Finalize and save the RepositoryVersion if no errors are raised, delete it if not
+
+        A version created with `resume=True` is kept on errors, so a retried task can resume it.
         """
         if exc_value:
-            self.delete()
+            if not self._resumable:
+                self.delete()
         else:
             try:
                 repository = self.repository.cast()
@@ -1,3 +1,5 @@
+import errno
+import fcntl
 import os
 from uuid import uuid4
 
@@ -9,16 +11,75 @@ from django.core.files.storage import Storage, FileSystemStorage
 from pulpcore.app.util import get_domain
 
 
+# The ioctl(2) request cloning a file on Linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+#: The directory of a FileSystem storage which files are staged in, see get_staging_directory()
+STAGING_DIRECTORY = os.path.join("tmp", "staging")
+
+
+def _copy_file_in_kernel(source_path, fd):
+    """
+    Copy a file into an empty file without passing its data through this process.
+
+    A copy-on-write clone (reflink) is tried first, which shares the data on filesystems like
+    Btrfs and XFS, then copy_file_range(2), which can copy on the server side of NFS 4.2.
+
+    Args:
+        source_path (str): The path of the file to copy.
+        fd (int): The file descriptor of the empty file to copy into.
+
+    Returns:
+        bool: False if neither is supported for these files, in which case nothing was copied.
+    """
+    with open(source_path, "rb") as source:
+        try:
+            fcntl.ioctl(fd, FICLONE, source.fileno())
+            return True
+        except OSError:
+            pass
+        if not hasattr(os, "copy_file_range"):
+            return False
+        remaining = os.fstat(source.fileno()).st_size
+        copied = 0
+        try:
+            while remaining > 0:
+                count = os.copy_file_range(source.fileno(), fd, remaining)
+                if count == 0:
+                    break
+                copied += count
+                remaining -= count
+        except OSError as e:
+            if copied == 0 and e.errno in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EOPNOTSUPP,
+                errno.EINVAL,
+            ):
+                return False
+            raise
+        return True
+
+
 class FileSystem(FileSystemStorage):
     """
     Django's FileSystemStorage with modified _save() and get_available_name behaviors
 
-    The _save() will check if the file is saved in WORKING_DIRECTORY first. If it is, a move is
-    used. This will move all files created by the Downloaders and uploaded files from the user. If
-    it is saved in-memory or outside of WORKING_DIRECTORY, the data is written/copied in chunks to
-    the new location.
+    The _save() will check if the file is saved in WORKING_DIRECTORY or in the STAGING_DIRECTORY
+    of the storage first. If it is, a move is used. This will move all files created by the
+    Downloaders and uploaded files from the user. A file outside of them, e.g. synced from a file://
+    remote, is cloned or copied by the kernel where the filesystems support it. Otherwise, the data
+    is written/copied in chunks to the new location.
     """
 
+    def _is_staged(self, path):
+        """
+        Whether the file at `path` is a temporary file to be moved into the storage.
+        """
+        return path.startswith(str(settings.WORKING_DIRECTORY)) or path.startswith(
+            os.path.join(self.location, STAGING_DIRECTORY, "")
+        )
+
     def get_available_name(self, name, max_length=None):
         """
         Returns a filename for the file even if it already exists.
@@ -65,8 +126,8 @@ class FileSystem(FileSystemStorage):
             raise FileExistsError("%s exists and is not a directory." % directory)
 
         try:
-            if hasattr(content, "temporary_file_path") and content.temporary_file_path().startswith(
-                str(settings.WORKING_DIRECTORY)
+            if hasattr(content, "temporary_file_path") and self._is_staged(
+                content.temporary_file_path()
             ):
                 file_move_safe(content.temporary_file_path(), full_path)
             else:
@@ -77,11 +138,16 @@ class FileSystem(FileSystemStorage):
                 _file = None
                 try:
                     locks.lock(fd, locks.LOCK_EX)
-                    for chunk in content.chunks():
-                        if _file is None:
-                            mode = "wb" if isinstance(chunk, bytes) else "wt"
-                            _file = os.fdopen(fd, mode)
-                        _file.write(chunk)
+                    if hasattr(content, "temporary_file_path") and _copy_file_in_kernel(
+                        content.temporary_file_path(), fd
+                    ):
+                        pass
+                    else:
+                        for chunk in content.chunks():
+                            if _file is None:
+                                mode = "wb" if isinstance(chunk, bytes) else "wt"
+                                _file = os.fdopen(fd, mode)
+                            _file.write(chunk)
                 finally:
                     locks.unlock(fd)
                     if _file is not None:
@@ -135,6 +201,56 @@ class DomainStorage:
     __class__ = Storage
 
 
+def get_staging_directory(domain):
+    """
+    Determine the directory to stage the files to be saved into the storage of a domain in.
+
+    A file can only be moved into a :class:`FileSystem` storage, instead of copied, from the same
+    filesystem. If the ``WORKING_DIRECTORY`` is on another filesystem than the storage of the
+    domain, the files are staged in the STAGING_DIRECTORY of the storage instead.
+
+    Args:
+        domain (:class:`~pulpcore.app.models.Domain`): The domain the files are saved to.
+
+    Returns:
+        str: The absolute path of the directory, or None if the files are staged in the
+            ``WORKING_DIRECTORY``.
+    """
+    storage = domain.get_storage()
+    if not isinstance(storage, FileSystem):
+        return None
+    try:
+        if os.stat(storage.location).st_dev == os.stat(settings.WORKING_DIRECTORY).st_dev:
+            return None
+    except OSError:
+        return None
+    return os.path.join(storage.location, STAGING_DIRECTORY)
+
+
+def is_staged_path(path, domain):
+    """
+    Check whether a file was staged by Pulp to be saved into the storage of a domain.
+
+    Only staged files may be deleted once saved, any other file, e.g. the source file of a
+    file:// remote downloaded in place, belongs to the user.
+
+    Args:
+        path (str): The path of the file.
+        domain (:class:`~pulpcore.app.models.Domain`): The domain the file is saved to.
+
+    Returns:
+        bool: True if the file is in the ``WORKING_DIRECTORY`` or the staging directory of the
+            storage of the domain.
+    """
+    path = os.path.abspath(path)
+    for directory in (settings.WORKING_DIRECTORY, get_staging_directory(domain)):
+        if directory:
+            directory = os.path.abspath(directory)
+            if os.path.commonpath([path, directory]) == directory:
+                return True
+    return False
+
+
 def get_artifact_path(sha256digest):
     """
     Determine the relative path where a file backing the Artifact should be stored.
@@ -66,6 +66,8 @@ class Task(BaseModel, AutoAddObjPermsMixin):
             the task
         reserved_resources_record (django.contrib.postgres.fields.ArrayField): The reserved
             resources required for the task.
+        download_stats (models.JSONField): The statistics of the downloads of the task per remote
+            and host, see :func:`pulpcore.download.telemetry.summary`.
 
     Relations:
 
@@ -103,6 +105,7 @@ class Task(BaseModel, AutoAddObjPermsMixin):
     reserved_resources_record = ArrayField(models.TextField(), null=True)
     pulp_domain = models.ForeignKey("Domain", default=get_domain_pk, on_delete=models.CASCADE)
     versions = HStoreField(default=dict)
+    download_stats = models.JSONField(null=True)
 
     def __str__(self):
         return "Task: {name} [{state}]".format(name=self.name, state=self.state)
@@ -276,7 +279,15 @@ class Task(BaseModel, AutoAddObjPermsMixin):
         super().refresh_from_db(using, fields, **kwargs)
 
     class Meta:
-        indexes = [models.Index(fields=["pulp_created"])]
+        indexes = [
+            models.Index(fields=["pulp_created"]),
+            # The workers scan the incomplete tasks in the order they were dispatched
+            models.Index(
+                fields=["pulp_created"],
+                name="core_task_incomplete_idx",
+                condition=models.Q(state__in=TASK_INCOMPLETE_STATES),
+            ),
+        ]
         permissions = [
             ("manage_roles_task", "Can manage role assignments on task"),
         ]
@@ -87,6 +87,15 @@ class TaskSerializer(ModelSerializer):
         help_text=_("A list of resources required by that task."),
         read_only=True,
     )
+    download_stats = serializers.ListField(
+        child=serializers.DictField(child=serializers.JSONField()),
+        help_text=_(
+            "The statistics of the downloads of this task per remote and host: the number of"
+            " downloads, responses, failures and retries, the bytes downloaded, the total duration"
+            " and the mean and maximum time to first byte in seconds."
+        ),
+        read_only=True,
+    )
 
     def get_created_by(self, obj):
         if task_user_map := self.context.get("task_user_mapping"):
@@ -114,6 +123,7 @@ class TaskSerializer(ModelSerializer):
             "progress_reports",
             "created_resources",
             "reserved_resources_record",
+            "download_stats",
         )
 
 
@@ -297,6 +297,13 @@ DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 TASK_DIAGNOSTICS = False
 
+# The number of tasks run by a task executor process of a worker before it is replaced
+TASK_EXECUTOR_MAX_TASKS = 1
+
+# The memory usage in megabytes above which a task executor process is replaced after its task,
+# None does not limit it
+TASK_EXECUTOR_MAX_MEMORY = None
+
 ANALYTICS = True
 
 HIDE_GUARDED_DISTRIBUTIONS = False
@@ -312,6 +319,38 @@ SHELL_PLUS_IMPORTS = [
 # By default, use all available workers.
 IMPORT_WORKERS_PERCENT = 100
 
+# How the downloaded artifact files of a sync are made durable: "file" fsyncs each file once it is
+# downloaded, "batch" flushes the filesystem once for every batch of artifacts before they are
+# saved.
+DOWNLOAD_DURABILITY = "file"
+
+# The maximum number of byte ranges to download a large file from an HTTP server in parallel
+DOWNLOAD_SEGMENTS = 1
+
+# The directory to cache the downloads of remote metadata in, to revalidate them with conditional
+# requests. None disables the cache.
+DOWNLOAD_CACHE_DIR = None
+
+# The size in bytes which the least recently used files of DOWNLOAD_CACHE_DIR are pruned down to
+DOWNLOAD_CACHE_MAX_SIZE = 1024 * 1024 * 1024  # 1 GiB
+
+# The options of the connection pools shared by the remotes of a process, see aiohttp.TCPConnector
+DOWNLOAD_CONNECTION_POOL = {
+    "limit": 0,
+    "limit_per_host": 100,
+    "keepalive_timeout": 15,
+    "ttl_dns_cache": 300,
+}
+
+# Whether the rate limit and download concurrency of the remotes are shared by all Pulp processes
+DOWNLOAD_SHARED_LIMITS = False
+
+# Whether the syncs running at the same time claim the downloads of artifacts to only download once
+DOWNLOAD_DEDUPLICATION = False
+
+# The maximum number of artifact files uploaded to object storage in parallel by each sync
+ARTIFACT_UPLOAD_CONCURRENCY = 10
+
 # HERE STARTS DYNACONF EXTENSION LOAD (Keep at the very bottom of settings.py)
 # Read more at https://dynaconf.readthedocs.io/en/latest/guides/django.html
 from dynaconf import DjangoDynaconf, Validator  # noqa
@@ -379,6 +418,24 @@ api_root_validator = Validator(
     },
 )
 
+download_durability_validator = Validator(
+    "DOWNLOAD_DURABILITY",
+    is_in=["file", "batch"],
+    messages={
+        "operations": (
+            "DOWNLOAD_DURABILITY must be one of 'file' or 'batch', currently it is '{value}'"
+        )
+    },
+)
+
+task_executor_max_tasks_validator = Validator(
+    "TASK_EXECUTOR_MAX_TASKS",
+    gte=1,
+    messages={
+        "operations": ("TASK_EXECUTOR_MAX_TASKS must be at least 1, currently it is '{value}'")
+    },
+)
+
 
 settings = DjangoDynaconf(
     __name__,
@@ -393,8 +450,10 @@ settings = DjangoDynaconf(
         api_root_validator,
         cache_validator,
         content_origin_validator,
+        download_durability_validator,
         sha256_validator,
         storage_validator,
+        task_executor_max_tasks_validator,
         unknown_algs_validator,
     ],
 )
@@ -1,3 +1,4 @@
+import ctypes
 import hashlib
 from functools import lru_cache
 from gettext import gettext as _
@@ -309,6 +310,42 @@ def compute_file_hash(filename, hasher=None, cumulative_hash=None, blocksize=819
         return hasher.hexdigest()
 
 
+@lru_cache(maxsize=1)
+def _syncfs():
+    return getattr(ctypes.CDLL(None, use_errno=True), "syncfs", None)
+
+
+def sync_filesystems(paths):
+    """
+    Flush the data of the filesystems holding the files at `paths` to disk.
+
+    Each filesystem is flushed once with syncfs(2), or the whole system with sync(2) if syncfs is
+    not available. This must be called on the files of downloaders with ``defer_fsync`` set before
+    they are saved as artifacts.
+
+    Args:
+        paths (iterable): The paths of the files to flush to disk.
+    """
+    syncfs = _syncfs()
+    devices = set()
+    for path in paths:
+        directory = os.path.dirname(os.path.abspath(path))
+        device = os.stat(directory).st_dev
+        if device in devices:
+            continue
+        devices.add(device)
+        if syncfs is None:
+            os.sync()
+            return
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            if syncfs(fd) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), directory)
+        finally:
+            os.close(fd)
+
+
 def configure_analytics():
     task_name = "pulpcore.app.tasks.analytics.post_analytics"
     dispatch_interval = timedelta(days=1)
@@ -48,6 +48,7 @@ from pulpcore.app.models import (  # noqa: E402: module level not at top of file
     RemoteArtifact,
 )
 from pulpcore.app import mime_types  # noqa: E402: module level not at top of file
+from pulpcore.app.models.storage import is_staged_path  # noqa: E402
 from pulpcore.app.util import get_domain, cache_key  # noqa: E402: module level not at top of file
 
 from pulpcore.exceptions import UnsupportedDigestValidationError  # noqa: E402
@@ -820,8 +821,9 @@ class Handler:
                 else:
                     # The file needs to be unlinked because it was not used to create an artifact.
                     # The artifact must have already been saved while servicing another request for
-                    # the same artifact.
-                    os.unlink(download_result.path)
+                    # the same artifact. The source file of a file:// remote is left alone.
+                    if is_staged_path(download_result.path, get_domain()):
+                        os.unlink(download_result.path)
 
             if content_artifact._state.adding:
                 # This is the first time pull-through content was requested.
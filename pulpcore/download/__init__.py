@@ -1,4 +1,6 @@
 from .base import BaseDownloader, DownloadResult
+from .cache import DownloadCache
+from .concurrency import AdaptiveSemaphore
 from .factory import DownloaderFactory
 from .file import FileDownloader
 from .http import HttpDownloader
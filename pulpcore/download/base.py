@@ -2,6 +2,7 @@ from gettext import gettext as _
 
 import asyncio
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 import tempfile
@@ -33,6 +34,26 @@ Args:
 """
 
 
+_data_executor = None
+_data_executor_pid = None
+
+
+def _get_data_executor():
+    """
+    The thread pool writing and hashing the downloaded data of this process.
+
+    The pool is created on first use, and again in forked children, which lack its threads.
+    """
+    global _data_executor, _data_executor_pid
+    if _data_executor_pid != os.getpid():
+        _data_executor = ThreadPoolExecutor(
+            max_workers=BaseDownloader.DATA_HANDLING_WORKERS,
+            thread_name_prefix="pulp-download-data",
+        )
+        _data_executor_pid = os.getpid()
+    return _data_executor
+
+
 class BaseDownloader:
     """
     The base class of all downloaders, providing digest calculation, validation, and file handling.
@@ -53,7 +74,9 @@ class BaseDownloader:
     data later.
 
     The :meth:`~pulpcore.plugin.download.BaseDownloader.handle_data` method by default
-    writes to a random file in the current working directory.
+    writes to a random file in the current working directory. The writing and hashing of the data
+    run on a thread pool shared by all downloaders of the process, so they don't block the event
+    loop. The chunks of a download are handled in order, each one while the next one is downloaded.
 
     The call to :meth:`~pulpcore.plugin.download.BaseDownloader.finalize` ensures that all
     data written to the file-like object is quiesced to disk before the file-like object has
@@ -65,8 +88,14 @@ class BaseDownloader:
             value of the expected digest. e.g. {'md5': '912ec803b2ce49e4a541068d495ab570'}
         expected_size (int): The number of bytes the download is expected to have.
         path (str): The full path to the file containing the downloaded data.
+        defer_fsync (bool): If True, :meth:`~pulpcore.plugin.download.BaseDownloader.finalize`
+            doesn't fsync the file, which is then left to whoever saves it, see
+            :func:`~pulpcore.plugin.util.sync_filesystems`. Defaults to False.
     """
 
+    #: The number of threads writing and hashing the downloaded data.
+    DATA_HANDLING_WORKERS = min(8, os.cpu_count() or 1)
+
     def __init__(
         self,
         url,
@@ -90,7 +119,9 @@ class BaseDownloader:
 
         self.url = url
         self._writer = None
+        self._pending_data = None
         self.path = None
+        self.defer_fsync = False
         self.expected_digests = expected_digests
         self.expected_size = expected_size
         if semaphore:
@@ -144,10 +175,40 @@ class BaseDownloader:
         Args:
             data (bytes): The data to be handled by the downloader.
         """
+        await self._wait_for_pending_data()
         self._ensure_writer_has_open_file()
-        self._writer.write(data)
+        self._pending_data = asyncio.get_running_loop().run_in_executor(
+            _get_data_executor(), self._write_data, self._writer, data
+        )
+
+    def _write_data(self, writer, data):
+        """
+        Write a chunk of data to the file object and compute its digests. Runs on the thread pool.
+
+        Args:
+            writer (file object): The file object to write to.
+            data (bytes): The data to be handled by the downloader.
+        """
+        writer.write(data)
         self._record_size_and_digests_for_data(data)
 
+    async def _wait_for_pending_data(self):
+        """
+        Wait for the previous chunk of data to be written and hashed.
+
+        If its file was discarded in the meantime, e.g. to retry the download, it is only waited
+        for so that it doesn't write into the digests of the next file.
+        """
+        pending_data, self._pending_data = self._pending_data, None
+        if pending_data is None:
+            return
+        if self._writer is None:
+            await asyncio.wait([pending_data])
+            if not pending_data.cancelled():
+                pending_data.exception()
+        else:
+            await pending_data
+
     async def finalize(self):
         """
         A coroutine to flush downloaded data, close the file writer, and validate the data.
@@ -163,11 +224,12 @@ class BaseDownloader:
                 doesn't match the size of the data passed to
                 :meth:`~pulpcore.plugin.download.BaseDownloader.handle_data`.
         """
+        await self._wait_for_pending_data()
         self._ensure_writer_has_open_file()
-        self._writer.flush()
-        os.fsync(self._writer.fileno())
-        self._writer.close()
-        self._writer = None
+        writer, self._writer = self._writer, None
+        await asyncio.get_running_loop().run_in_executor(
+            _get_data_executor(), self._close_writer, writer, not self.defer_fsync
+        )
         self.validate_digests()
         self.validate_size()
         log.debug(f"Downloaded file from {self.url}")
@@ -185,6 +247,20 @@ class BaseDownloader:
         result = asyncio.get_event_loop().run_until_complete(self.run(extra_data=extra_data))
         return result
 
+    @staticmethod
+    def _close_writer(writer, fsync):
+        """
+        Flush the file object to disk and close it. Runs on the thread pool.
+
+        Args:
+            writer (file object): The file object to close.
+            fsync (bool): Whether to fsync the file before closing it.
+        """
+        writer.flush()
+        if fsync:
+            os.fsync(writer.fileno())
+        writer.close()
+
     def _record_size_and_digests_for_data(self, data):
         """
         Record the size and digest for an available chunk of data.
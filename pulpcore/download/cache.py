@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from pulpcore.app.models.storage import _copy_file_in_kernel
+
+# The number of bytes stored in each cache directory by this process since it was last pruned
+_stored_since_prune = defaultdict(int)
+
+
+class DownloadCache:
+    """
+    An on-disk cache of downloaded files, revalidated with conditional HTTP requests.
+
+    For each cached URL, the cache stores the downloaded file along with its ``ETag`` and
+    ``Last-Modified`` headers and its size and digests. The
+    :class:`~pulpcore.plugin.download.HttpDownloader` sends them back in the ``If-None-Match``
+    and ``If-Modified-Since`` headers, and if the server answers with ``304 Not Modified``, the
+    cached file is used instead of downloading it again.
+
+    The files are copied into and out of the cache, as a copy-on-write clone where the filesystem
+    supports it, so the files handed out are never shared with the cache. Each cached file gets a
+    unique name, referenced by the JSON entry of its URL, so replacing the entry switches to the
+    new file and headers at once. The cache directory is pruned to `max_size` every time this
+    process stored a tenth of `max_size` in it, deleting the least recently used files.
+
+    Args:
+        directory (str): The directory to store the cached files in.
+        namespace (str): Separates the cached files of different users of the directory, e.g. the
+            primary key of a remote.
+        max_size (int): The maximum size in bytes of the cached files of the directory, or None.
+    """
+
+    #: The number of seconds after which a temporary file is deemed left over by a crash.
+    STALE_TEMPORARY_FILE_AGE = 3600
+    #: The fraction of `max_size` to store before pruning the cache directory again.
+    PRUNE_FRACTION = 0.1
+
+    def __init__(self, directory, namespace="", max_size=None):
+        self.directory = str(directory)
+        self.namespace = namespace
+        self.max_size = max_size
+
+    def _path(self, url):
+        key = hashlib.sha256("{}\n{}".format(self.namespace, url).encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def _data_path(self, entry):
+        return os.path.join(os.path.dirname(self._path(entry["url"])), entry["data_file"])
+
+    def lookup(self, url):
+        """
+        Get the cache entry of a URL.
+
+        Args:
+            url (str): The URL of the download.
+
+        Returns:
+            dict: The entry with the "etag", "last_modified" and "artifact_attributes" keys, or
+                None if the URL is not cached.
+        """
+        path = self._path(url) + ".json"
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url or "data_file" not in entry:
+            return None
+        # Record the use of the entry for pruning
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        The headers to revalidate a cache entry with.
+
+        Args:
+            entry (dict): The cache entry.
+
+        Returns:
+            dict: The ``If-None-Match`` and ``If-Modified-Since`` headers.
+        """
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, headers, path, artifact_attributes):
+        """
+        Cache a downloaded file if the server sent the headers needed to revalidate it.
+
+        Args:
+            url (str): The URL of the download.
+            headers (multidict.CIMultiDictProxy): The headers of the response.
+            path (str): The path of the downloaded file, which is copied into the cache.
+            artifact_attributes (dict): The size and digests of the downloaded file.
+        """
+        entry = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "artifact_attributes": artifact_attributes,
+        }
+        if not entry["etag"] and not entry["last_modified"]:
+            return
+        cache_path = self._path(url)
+        directory = os.path.dirname(cache_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, data_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(cache_path) + ".", suffix=".data"
+        )
+        try:
+            with os.fdopen(fd, "wb") as data_file:
+                self._copy(path, data_file)
+            entry["data_file"] = os.path.basename(data_path)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=directory, suffix=".tmp", delete=False
+            ) as entry_file:
+                json.dump(entry, entry_file)
+        except BaseException:
+            os.unlink(data_path)
+            raise
+        previous_entry = self.lookup(url)
+        os.replace(entry_file.name, cache_path + ".json")
+        if previous_entry is not None:
+            try:
+                os.unlink(self._data_path(previous_entry))
+            except FileNotFoundError:
+                pass
+        if self.max_size is not None:
+            _stored_since_prune[self.directory] += os.path.getsize(data_path)
+            if _stored_since_prune[self.directory] >= self.max_size * self.PRUNE_FRACTION:
+                _stored_since_prune[self.directory] = 0
+                self.prune()
+
+    def restore(self, entry, path):
+        """
+        Replace a file with a copy of the cached file of an entry.
+
+        Args:
+            entry (dict): The cache entry, as returned by :meth:`lookup`.
+            path (str): The path of the file to replace.
+
+        Raises:
+            FileNotFoundError: If the cached file was pruned or replaced in the meantime.
+        """
+        self._replace(self._data_path(entry), path)
+
+    def prune(self):
+        """
+        Delete the least recently used cached files of the directory until they fit `max_size`.
+
+        The temporary files and the cached files no entry refers to, left over by crashed
+        processes, are deleted as well.
+        """
+        stale = time.time() - self.STALE_TEMPORARY_FILE_AGE
+        entries = []
+        total_size = 0
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            data_paths = set()
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if filename.endswith(".json"):
+                        with open(path) as entry_file:
+                            data_path = os.path.join(dirpath, json.load(entry_file)["data_file"])
+                        size = os.stat(data_path).st_size
+                        entries.append((os.stat(path).st_mtime, size, path, data_path))
+                        data_paths.add(data_path)
+                        total_size += size
+                except (OSError, ValueError, KeyError):
+                    # Pruned or replaced by another process
+                    continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.endswith((".tmp", ".data")) and path not in data_paths:
+                    try:
+                        if os.stat(path).st_mtime < stale:
+                            os.unlink(path)
+                    except FileNotFoundError:
+                        continue
+        entries.sort()
+        for _last_used, size, entry_path, data_path in entries:
+            if total_size <= self.max_size:
+                break
+            for path in (entry_path, data_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
+
+    @staticmethod
+    def _copy(source, destination_file):
+        if not _copy_file_in_kernel(source, destination_file.fileno()):
+            with open(source, "rb") as source_file:
+                shutil.copyfileobj(source_file, destination_file)
+
+    @classmethod
+    def _replace(cls, source, destination):
+        """
+        Atomically replace `destination` with a copy of `source`.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                cls._copy(source, temp_file)
+            os.replace(temp_path, destination)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -0,0 +1,175 @@
+import asyncio
+from collections import deque
+
+
+class AdaptiveSemaphore:
+    """
+    A semaphore whose limit adapts to how an upstream host copes with the requests sent to it.
+
+    This is used by the :class:`~pulpcore.plugin.download.DownloaderFactory` to restrict the number
+    of concurrent downloads per host. The limit follows an AIMD (additive increase, multiplicative
+    decrease) scheme driven by the downloaders:
+
+    * Each successful request increases the limit by ``1 / limit``, so by one after a full window
+      of successful requests, up to `maximum`.
+    * A failed request, e.g. an HTTP 429 or 5xx response or a connection error, halves the limit.
+      A response time far above the fastest one observed, and above ``SLOW_RESPONSE_FLOOR``
+      seconds, decreases it slightly. Requests started before the last decrease are ignored, so a
+      burst of failures only counts once.
+    * A ``Retry-After`` header pauses all new requests to the host, including retries, for the
+      time requested.
+
+    It is used like an :class:`asyncio.Semaphore`::
+
+        async with semaphore:
+            started = semaphore.loop_time()
+            ...  # send the request
+            semaphore.record_success(started)
+
+    Args:
+        host (str): The host whose requests are restricted, used for reporting.
+        initial (int): The initial limit.
+        maximum (int): The maximum limit.
+        parent (asyncio.Semaphore): A semaphore acquired along with this one, e.g. restricting the
+            downloads from all the hosts of a remote. (optional)
+    """
+
+    #: The factor the limit is multiplied with on a failure.
+    DECREASE_FACTOR = 0.5
+    #: The factor the limit is multiplied with on a slow response.
+    SLOW_DECREASE_FACTOR = 0.9
+    #: How many times the fastest response time a response may take before it is deemed slow.
+    SLOW_RESPONSE_RATIO = 4
+    #: The number of seconds below which a response is never deemed slow.
+    SLOW_RESPONSE_FLOOR = 1.0
+
+    def __init__(self, host, initial, maximum, parent=None):
+        self.host = host
+        self.maximum = maximum
+        self.parent = parent
+        self.limit = float(min(initial, maximum))
+        self._in_flight = 0
+        self._waiters = deque()
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._min_latency = None
+
+    @staticmethod
+    def loop_time():
+        """
+        The time of the running event loop, used to time the requests.
+        """
+        return asyncio.get_running_loop().time()
+
+    def locked(self):
+        """
+        Returns True if the semaphore can not be acquired immediately.
+        """
+        return (
+            self._in_flight >= int(self.limit)
+            or self._paused_until > self.loop_time()
+            or (self.parent is not None and self.parent.locked())
+        )
+
+    async def wait_if_paused(self):
+        """
+        Wait until the pause requested by the host with a ``Retry-After`` header is over.
+        """
+        pause = self._paused_until - self.loop_time()
+        while pause > 0:
+            await asyncio.sleep(pause)
+            pause = self._paused_until - self.loop_time()
+
+    async def acquire(self):
+        """
+        Wait until the number of requests in flight is below the limit and acquire the semaphore,
+        then acquire the parent semaphore.
+        """
+        await self._acquire()
+        if self.parent is not None:
+            try:
+                await self.parent.acquire()
+            except BaseException:
+                self._release()
+                raise
+        return True
+
+    async def _acquire(self):
+        while True:
+            await self.wait_if_paused()
+            if self._in_flight < int(self.limit):
+                self._in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass the wakeup on to the next waiter.
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_up()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self):
+        """
+        Release the semaphore and wake up as many waiters as the limit allows.
+        """
+        if self.parent is not None:
+            self.parent.release()
+        self._release()
+
+    def _release(self):
+        self._in_flight -= 1
+        self._wake_up()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        self.release()
+
+    def _wake_up(self):
+        free = int(self.limit) - self._in_flight
+        for waiter in self._waiters:
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _decrease(self, factor):
+        self.limit = max(1.0, self.limit * factor)
+        self._last_decrease = self.loop_time()
+
+    def record_success(self, started):
+        """
+        Record a successful request to the host.
+
+        Args:
+            started (float): The :meth:`loop_time` the request was sent at.
+        """
+        latency = self.loop_time() - started
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        if latency > max(self._min_latency * self.SLOW_RESPONSE_RATIO, self.SLOW_RESPONSE_FLOOR):
+            if started > self._last_decrease:
+                self._decrease(self.SLOW_DECREASE_FACTOR)
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._wake_up()
+
+    def record_failure(self, started, retry_after=None):
+        """
+        Record a failed request to the host.
+
+        Args:
+            started (float): The :meth:`loop_time` the request was sent at.
+            retry_after (float): The number of seconds the host asked to wait before retrying.
+        """
+        if retry_after:
+            self._paused_until = max(self._paused_until, self.loop_time() + retry_after)
+        if started > self._last_decrease:
+            self._decrease(self.DECREASE_FACTOR)
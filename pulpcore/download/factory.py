@@ -3,18 +3,26 @@ import asyncio
 import atexit
 import copy
 from gettext import gettext as _
+import hashlib
 from multidict import MultiDict
+import os
 import platform
 from pkg_resources import get_distribution
 import ssl
 import sys
 from tempfile import NamedTemporaryFile
 from urllib.parse import urlparse
+from weakref import WeakKeyDictionary
 
 import aiohttp
+from django.conf import settings
 
+from .cache import DownloadCache
+from .concurrency import AdaptiveSemaphore
 from .http import HttpDownloader
 from .file import FileDownloader
+from .shared_limits import SharedSemaphore
+from .telemetry import DownloadTelemetry
 
 
 PROTOCOL_MAP = {
@@ -24,6 +32,61 @@ PROTOCOL_MAP = {
 }
 
 
+_connectors = WeakKeyDictionary()
+_connectors_pid = None
+
+
+def _get_connector(tls_config, ssl_context):
+    """
+    Get the connector shared by the remotes of this process with the same TLS configuration.
+
+    The connectors pool the connections per host, port, TLS context and proxy, and cache the DNS
+    lookups, as configured by the ``DOWNLOAD_CONNECTION_POOL`` setting. They are bound to the event
+    loop they were created for, and a forked child process creates its own.
+
+    Args:
+        tls_config (tuple): The TLS configuration of the remote, which keys the connector.
+        ssl_context (ssl.SSLContext): The SSL context built from `tls_config`, or None.
+
+    Returns:
+        aiohttp.TCPConnector: The shared connector.
+    """
+    global _connectors, _connectors_pid
+    if _connectors_pid != os.getpid():
+        _connectors = WeakKeyDictionary()
+        _connectors_pid = os.getpid()
+    key = hashlib.sha256(repr(tls_config).encode()).hexdigest()
+    loop_connectors = _connectors.setdefault(asyncio.get_event_loop(), {})
+    connector = loop_connectors.get(key)
+    if connector is None or connector.closed:
+        options = dict(settings.DOWNLOAD_CONNECTION_POOL)
+        if ssl_context:
+            options["ssl_context"] = ssl_context
+        connector = aiohttp.TCPConnector(**options)
+        loop_connectors[key] = connector
+    return connector
+
+
+def close_connectors(loop):
+    """
+    Close the connectors created for an event loop of this process, before the loop is closed.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): The event loop, which must not be running.
+    """
+    if _connectors_pid == os.getpid():
+        for connector in _connectors.pop(loop, {}).values():
+            loop.run_until_complete(connector.close())
+
+
+@atexit.register
+def _close_connectors():
+    if _connectors_pid == os.getpid():
+        for loop in list(_connectors):
+            if not loop.is_closed() and not loop.is_running():
+                close_connectors(loop)
+
+
 class DownloaderFactory:
     """
     A factory for creating downloader objects that are configured from with remote settings.
@@ -42,6 +105,13 @@ class DownloaderFactory:
         downloader = the_factory.build(url_a)
         result = downloader.fetch()  # 'result' is a DownloadResult
 
+    For http and https urls, the number of concurrent downloads is restricted per host by an
+    :class:`~pulpcore.plugin.download.AdaptiveSemaphore`. Its limit starts at the
+    `download_concurrency` of the remote, is lowered when the host is slow or failing, and recovers
+    up to the `download_concurrency` again, but never grows beyond it. The `download_concurrency`
+    still restricts the downloads from all the hosts of the remote. The current limits are returned
+    by :meth:`limits`.
+
     For http and https urls, in addition to the remote settings, non-default timing values are used.
     Specifically, the "total" timeout is set to None and the "sock_connect" and "sock_read" are both
     5 minutes. For more info on these settings, see the aiohttp docs:
@@ -73,6 +143,11 @@ class DownloaderFactory:
         }
         self._session = self._make_aiohttp_session_from_remote()
         self._semaphore = asyncio.Semaphore(value=download_concurrency)
+        self._host_semaphores = {}
+        self._shared_semaphore = None
+        if settings.DOWNLOAD_SHARED_LIMITS and remote.download_concurrency:
+            self._shared_semaphore = SharedSemaphore(remote.pk, remote.download_concurrency)
+        self._telemetry = DownloadTelemetry(remote.name)
         atexit.register(self._session_cleanup)
 
     @staticmethod
@@ -93,13 +168,12 @@ class DownloaderFactory:
         """
         Build a :class:`aiohttp.ClientSession` from the remote's settings and timing settings.
 
-        This method is what provides the force_close of the TCP connection with each request.
+        The connector of the session is shared with the other remotes of this process using the
+        same TLS configuration, so they reuse each other's connections to the same hosts.
 
         Returns:
             :class:`aiohttp.ClientSession`
         """
-        tcp_conn_opts = {}
-
         sslcontext = None
         if self._remote.ca_cert:
             sslcontext = ssl.create_default_context(cadata=self._remote.ca_cert)
@@ -118,8 +192,12 @@ class DownloaderFactory:
                 sslcontext = ssl.create_default_context()
             sslcontext.check_hostname = False
             sslcontext.verify_mode = ssl.CERT_NONE
-        if sslcontext:
-            tcp_conn_opts["ssl_context"] = sslcontext
+        tls_config = (
+            self._remote.ca_cert,
+            self._remote.client_cert,
+            self._remote.client_key,
+            self._remote.tls_validation,
+        )
 
         headers = MultiDict({"User-Agent": DownloaderFactory.user_agent()})
         if self._remote.headers is not None:
@@ -136,7 +214,8 @@ class DownloaderFactory:
             connect=self._remote.connect_timeout,
         )
         return aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(**tcp_conn_opts),
+            connector=_get_connector(tls_config, sslcontext),
+            connector_owner=False,
             timeout=timeout,
             headers=headers,
             requote_redirect_url=False,
@@ -151,18 +230,26 @@ class DownloaderFactory:
         Args:
             url (str): The download URL.
             kwargs (dict): All kwargs are passed along to the downloader. At a minimum, these
-                include the :class:`~pulpcore.plugin.download.BaseDownloader` parameters.
+                include the :class:`~pulpcore.plugin.download.BaseDownloader` parameters. If
+                `use_cache` is True and the ``DOWNLOAD_CACHE_DIR`` setting is set, an HTTP
+                download is revalidated in a :class:`~pulpcore.plugin.download.DownloadCache`
+                instead of being downloaded again if it didn't change, which suits metadata.
 
         Returns:
             subclass of :class:`~pulpcore.plugin.download.BaseDownloader`: A downloader that
             is configured with the remote settings.
         """
-        kwargs["semaphore"] = self._semaphore
         kwargs["max_retries"] = (
             kwargs.get("max_retries")
             or self._remote.max_retries
             or self._remote.DEFAULT_MAX_RETRIES
         )
+        if kwargs.pop("use_cache", False) and settings.DOWNLOAD_CACHE_DIR:
+            kwargs["cache"] = DownloadCache(
+                settings.DOWNLOAD_CACHE_DIR,
+                namespace=str(self._remote.pk),
+                max_size=settings.DOWNLOAD_CACHE_MAX_SIZE,
+            )
 
         scheme = urlparse(url).scheme.lower()
         try:
@@ -188,6 +275,7 @@ class DownloaderFactory:
             :class:`~pulpcore.plugin.download.HttpDownloader`: A downloader that
             is configured with the remote settings.
         """
+        kwargs["semaphore"] = self._host_semaphore(url)
         options = {"session": self._session}
         if self._remote.proxy_url:
             options["proxy"] = self._remote.proxy_url
@@ -202,6 +290,11 @@ class DownloaderFactory:
             )
 
         kwargs["throttler"] = self._remote.download_throttler if self._remote.rate_limit else None
+        if self._shared_semaphore:
+            kwargs["shared_semaphore"] = self._shared_semaphore
+        kwargs["telemetry"] = self._telemetry
+        if settings.DOWNLOAD_SEGMENTS > 1:
+            kwargs.setdefault("segments", settings.DOWNLOAD_SEGMENTS)
 
         return download_class(url, **options, **kwargs)
 
@@ -220,4 +313,35 @@ class DownloaderFactory:
             subclass of :class:`~pulpcore.plugin.download.BaseDownloader`: A downloader that
             is configured with the remote settings.
         """
+        kwargs["semaphore"] = self._semaphore
         return download_class(url, **kwargs)
+
+    def _host_semaphore(self, url):
+        """
+        Get the adaptive semaphore restricting the concurrent downloads from the host of a url.
+
+        Args:
+            url (str): The download URL.
+
+        Returns:
+            :class:`~pulpcore.plugin.download.AdaptiveSemaphore`: The semaphore of the host.
+        """
+        host = urlparse(url).netloc
+        try:
+            return self._host_semaphores[host]
+        except KeyError:
+            limit = self._remote.download_concurrency or self._remote.DEFAULT_DOWNLOAD_CONCURRENCY
+            semaphore = AdaptiveSemaphore(
+                host, initial=limit, maximum=limit, parent=self._semaphore
+            )
+            self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def limits(self):
+        """
+        The current limits of the concurrent HTTP downloads per host.
+
+        Returns:
+            dict: The current limit keyed by host, for the hosts downloaded from so far.
+        """
+        return {host: int(semaphore.limit) for host, semaphore in self._host_semaphores.items()}
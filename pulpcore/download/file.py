@@ -1,10 +1,15 @@
+import asyncio
+import mmap
 import os
 
 from urllib.parse import urlparse
 
 import aiofiles
 
-from .base import BaseDownloader, DownloadResult
+from pulpcore.app import pulp_hashlib
+from pulpcore.app.models import Artifact
+
+from .base import BaseDownloader, DownloadResult, _get_data_executor
 
 
 class FileDownloader(BaseDownloader):
@@ -13,18 +18,22 @@ class FileDownloader(BaseDownloader):
 
     It provides digest and size validation along with computation of the digests needed to save the
     file as an Artifact. It writes a new file to the disk and the return path is included in the
-    :class:`~pulpcore.plugin.download.DownloadResult`.
+    :class:`~pulpcore.plugin.download.DownloadResult`. With `in_place`, the file is not copied,
+    it is hashed in place and the path of the file itself is included instead.
 
     This downloader has all of the attributes of
     :class:`~pulpcore.plugin.download.BaseDownloader`
     """
 
-    def __init__(self, url, *args, **kwargs):
+    def __init__(self, url, *args, in_place=False, **kwargs):
         """
         Download files from a url that starts with `file://`
 
         Args:
             url (str): The url to the file. This is expected to begin with `file://`
+            in_place (bool): Whether to hash the file in place and return its own path instead of
+                a copy. The file must then not be deleted or modified by whoever uses the result.
+                Defaults to False.
             kwargs (dict): This accepts the parameters of
                 :class:`~pulpcore.plugin.download.BaseDownloader`.
 
@@ -37,18 +46,54 @@ class FileDownloader(BaseDownloader):
         RemoteSerializer().validate_url(url)
         p = urlparse(url)
         self._path = os.path.abspath(os.path.join(p.netloc, p.path))
+        self.in_place = in_place
         super().__init__(url, *args, **kwargs)
 
     async def _run(self, extra_data=None):
         """
         Read, validate, and compute digests on the `url`. This is a coroutine.
 
+        With `in_place`, the file is hashed in place, every digest in parallel on the thread pool
+        of the downloaders, and no copy of it is written unless `handle_data()` is overridden. The
+        `path` of the returned :class:`~pulpcore.plugin.download.DownloadResult` is then the path
+        of the file itself.
+
         This method provides the same return object type and documented in
         :meth:`~pulpcore.plugin.download.BaseDownloader._run`.
 
         Args:
             extra_data (dict): Extra data passed to the downloader.
         """
+        if (
+            not self.in_place
+            or "handle_data" in vars(self)
+            or type(self).handle_data is not BaseDownloader.handle_data
+        ):
+            # The data is copied, or expected to be passed to handle_data(), e.g. to stream it
+            return await self._run_through_handle_data()
+        loop = asyncio.get_running_loop()
+        executor = _get_data_executor()
+        self._digests = {n: pulp_hashlib.new(n) for n in Artifact.DIGEST_FIELDS}
+        with await loop.run_in_executor(executor, open, self._path, "rb") as f_handle:
+            self._size = os.fstat(f_handle.fileno()).st_size
+            if self._size:
+                with mmap.mmap(f_handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    await asyncio.gather(
+                        *(
+                            loop.run_in_executor(executor, algorithm.update, data)
+                            for algorithm in self._digests.values()
+                        )
+                    )
+        self.validate_digests()
+        self.validate_size()
+        return DownloadResult(
+            path=self._path,
+            artifact_attributes=self.artifact_attributes,
+            url=self.url,
+            headers=None,
+        )
+
+    async def _run_through_handle_data(self):
         async with aiofiles.open(self._path, "rb") as f_handle:
             while True:
                 chunk = await f_handle.read(1048576)  # 1 megabyte
@@ -57,7 +102,8 @@ class FileDownloader(BaseDownloader):
                     break  # the reading is done
                 await self.handle_data(chunk)
             return DownloadResult(
-                path=self._path,
+                # The copy written by handle_data(), unless it was overridden not to write one
+                path=self.path or self._path,
                 artifact_attributes=self.artifact_attributes,
                 url=self.url,
                 headers=None,
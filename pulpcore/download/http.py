@@ -1,10 +1,18 @@
+from contextlib import AsyncExitStack
+from email.utils import parsedate_to_datetime
 import logging
+import os
+import re
+from urllib.parse import urlsplit
 
 import aiohttp
 import asyncio
 import backoff
+from django.utils import timezone
 
-from .base import BaseDownloader, DownloadResult
+from .base import BaseDownloader, DownloadResult, _get_data_executor
+from .concurrency import AdaptiveSemaphore
+from .telemetry import DownloadStats
 from pulpcore.exceptions import (
     DigestValidationError,
     SizeValidationError,
@@ -18,6 +26,64 @@ log = logging.getLogger(__name__)
 logging.getLogger("backoff").addHandler(logging.StreamHandler())
 
 
+def parse_retry_after(value):
+    """
+    Parse the value of a ``Retry-After`` header.
+
+    Args:
+        value (str): The header value, either a number of seconds or an HTTP date.
+
+    Returns:
+        The number of seconds to wait, or None if the value can't be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+def parse_content_range(value):
+    """
+    Parse the value of a ``Content-Range`` header.
+
+    Args:
+        value (str): The header value, e.g. ``bytes 0-1023/4096``.
+
+    Returns:
+        A tuple of the first and last byte positions and the complete length, which is None if
+        the server doesn't know it, or None if the value can't be parsed.
+    """
+    match = _CONTENT_RANGE.fullmatch((value or "").strip())
+    if match is None:
+        return None
+    start, end, length = match.groups()
+    return int(start), int(end), None if length == "*" else int(length)
+
+
+async def _run_on_data_executor(func, *args):
+    """
+    Run a function writing or reading a file on the data thread pool.
+
+    If cancelled, this still waits for the function to return, so the file isn't closed while it
+    runs.
+    """
+    future = asyncio.get_running_loop().run_in_executor(_get_data_executor(), func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
 def http_giveup_handler(exc):
     """
     Inspect a raised exception and determine if we should give up.
@@ -109,6 +175,28 @@ class HttpDownloader(BaseDownloader):
     The coroutine will automatically retry 10 times with exponential backoff before allowing a
     final exception to be raised.
 
+    A retry resumes the download where the previous attempt stopped, by requesting the rest of the
+    file with a ``Range`` header validated by ``If-Range`` against the ``ETag`` or
+    ``Last-Modified`` header of the first response. If the server sends the whole file instead,
+    the download starts over. Downloads with a `headers_ready_callback` always start over.
+
+    Conditional Download:
+
+    If a :class:`~pulpcore.plugin.download.DownloadCache` is passed as `cache`, the downloaded file
+    is stored in it, and the next download of the same URL is a conditional request. If the server
+    answers with ``304 Not Modified``, the cached file is used with its known size and digests.
+
+    Segmented Download:
+
+    If `segments` is greater than one and the `expected_size` is known, a large file is downloaded
+    as up to `segments` byte ranges in parallel, each of at least `min_segment_size` bytes, over
+    separate connections. The first range is requested like a regular download; if the server
+    answers with the whole file instead of the range, it is downloaded as usual. The ranges are
+    written into a preallocated file and the digests are computed over the ranges in order, while
+    the later ones are still downloading. Segmented downloads are not used with a
+    `headers_ready_callback` or an overridden
+    :meth:`~pulpcore.plugin.download.BaseDownloader.handle_data`, which expect the data in order.
+
     Attributes:
         session (aiohttp.ClientSession): The session to be used by the downloader.
         auth (aiohttp.BasicAuth): An object that represents HTTP Basic Authorization or None
@@ -135,6 +223,11 @@ class HttpDownloader(BaseDownloader):
         headers=None,
         throttler=None,
         max_retries=0,
+        segments=1,
+        min_segment_size=16 * 1024 * 1024,
+        cache=None,
+        shared_semaphore=None,
+        telemetry=None,
         **kwargs,
     ):
         """
@@ -153,6 +246,15 @@ class HttpDownloader(BaseDownloader):
             headers (dict): Headers to be submitted with the request.
             throttler (asyncio_throttle.Throttler): Throttler for asyncio.
             max_retries (int): The maximum number of times to retry a download upon failure.
+            segments (int): The maximum number of byte ranges to download a file in parallel.
+            min_segment_size (int): The minimum size in bytes of a byte range.
+            cache (:class:`~pulpcore.plugin.download.DownloadCache`): A cache to revalidate the
+                file in with a conditional request instead of downloading it again. (optional)
+            shared_semaphore (:class:`~pulpcore.download.shared_limits.SharedSemaphore`): A limit
+                of the concurrent downloads shared by all Pulp processes, held in addition to
+                `semaphore`. (optional)
+            telemetry (:class:`~pulpcore.download.telemetry.DownloadTelemetry`): Records the
+                :attr:`stats` of the download once it finishes. (optional)
             kwargs (dict): This accepts the parameters of
                 :class:`~pulpcore.plugin.download.BaseDownloader`.
         """
@@ -172,6 +274,15 @@ class HttpDownloader(BaseDownloader):
         self.headers_ready_callback = headers_ready_callback
         self.download_throttler = throttler
         self.max_retries = max_retries
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.cache = cache
+        self.shared_semaphore = shared_semaphore
+        self.telemetry = telemetry
+        self.stats = None
+        self._request_started = None
+        self._resume_validator = None
+        self._resume_from = 0
         super().__init__(url, **kwargs)
 
     def raise_for_status(self, response):
@@ -197,6 +308,22 @@ class HttpDownloader(BaseDownloader):
              DownloadResult: Contains information about the result. See the DownloadResult docs for
                  more information.
         """
+        if self._resume_from:
+            content_range = parse_content_range(response.headers.get("Content-Range"))
+            if response.status != 206:
+                # The server sent the whole file instead of the rest of it
+                self._ensure_no_broken_file()
+            elif content_range is None or content_range[0] != self._resume_from:
+                self._ensure_no_broken_file()
+                raise aiohttp.ClientPayloadError(
+                    "Unexpected Content-Range {!r}".format(response.headers.get("Content-Range"))
+                )
+        if response.status == 200:
+            etag = response.headers.get("ETag")
+            if etag and not etag.startswith("W/"):
+                self._resume_validator = etag
+            else:
+                self._resume_validator = response.headers.get("Last-Modified")
         if self.headers_ready_callback:
             await self.headers_ready_callback(response.headers)
         while True:
@@ -216,9 +343,11 @@ class HttpDownloader(BaseDownloader):
         """
         Run the downloader with concurrency restriction and retry logic.
 
-        This method acquires `self.semaphore` before calling the actual download implementation
-        contained in `_run()`. This ensures that the semaphore stays acquired even as the `backoff`
-        wrapper around `_run()`, handles backoff-and-retry logic.
+        This method acquires `self.semaphore`, and then `self.shared_semaphore` if set, before
+        calling the actual download implementation contained in `_run()`. This ensures that the
+        semaphores stay acquired even as the `backoff` wrapper around `_run()`, handles
+        backoff-and-retry logic. The time to first byte, duration, size, retries and final status of
+        the download are kept in `self.stats`, and recorded by `self.telemetry` if set.
 
         Args:
             extra_data (dict): Extra data passed to the downloader.
@@ -240,33 +369,57 @@ class HttpDownloader(BaseDownloader):
             SizeValidationError,
         )
 
-        async with self.semaphore:
-
-            @backoff.on_exception(
-                backoff.expo,
-                retryable_errors,
-                max_tries=self.max_retries + 1,
-                giveup=http_giveup_handler,
-            )
-            async def download_wrapper():
-                self._ensure_no_broken_file()
-                try:
-                    return await self._run(extra_data=extra_data)
-                except asyncio.TimeoutError:
-                    raise TimeoutException(self.url)
-                except aiohttp.ClientHttpProxyError as e:
-                    log.error(
-                        "Proxy {!r} rejected connection request during a request to "
-                        "{!r}, status={}, message={!r}".format(
-                            e.request_info.real_url,
-                            e.request_info.url,
-                            e.status,
-                            e.message,
+        def count_retry(details):
+            self.stats.retries += 1
+
+        self.stats = DownloadStats(urlsplit(self.url).hostname)
+        try:
+            async with AsyncExitStack() as stack:
+                await stack.enter_async_context(self.semaphore)
+                if self.shared_semaphore:
+                    await stack.enter_async_context(self.shared_semaphore.lease())
+
+                @backoff.on_exception(
+                    backoff.expo,
+                    retryable_errors,
+                    max_tries=self.max_retries + 1,
+                    giveup=http_giveup_handler,
+                    on_backoff=count_retry,
+                )
+                async def download_wrapper():
+                    if not await self._can_resume():
+                        self._ensure_no_broken_file()
+                    try:
+                        return await self._run(extra_data=extra_data)
+                    except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                        self._record_request_failure()
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise TimeoutException(self.url)
+                        raise
+                    except aiohttp.ClientHttpProxyError as e:
+                        log.error(
+                            "Proxy {!r} rejected connection request during a request to "
+                            "{!r}, status={}, message={!r}".format(
+                                e.request_info.real_url,
+                                e.request_info.url,
+                                e.status,
+                                e.message,
+                            )
                         )
-                    )
-                    raise e
-
-            return await download_wrapper()
+                        raise e
+
+                return await download_wrapper()
+        except aiohttp.ClientResponseError as e:
+            self.stats.status = e.status
+            raise
+        except Exception as e:
+            self.stats.status = type(e).__name__
+            raise
+        finally:
+            self.stats.duration = self.stats.elapsed()
+            self.stats.size = self._size
+            if self.telemetry:
+                self.telemetry.record(self.stats)
 
     async def _run(self, extra_data=None):
         """
@@ -284,18 +437,318 @@ class HttpDownloader(BaseDownloader):
         """
         if self.download_throttler:
             await self.download_throttler.acquire()
-        async with self.session.get(
-            self.url, proxy=self.proxy, proxy_auth=self.proxy_auth, auth=self.auth
+        await self._record_request_start()
+        ranges = None
+        cache_entry = None
+        segment_slots = AsyncExitStack()
+        if self._resume_from:
+            headers = {
+                "Range": "bytes={}-".format(self._resume_from),
+                "If-Range": self._resume_validator,
+            }
+        elif self.cache is not None:
+            cache_entry = await _run_on_data_executor(self.cache.lookup, self.url)
+            headers = self.cache.conditional_headers(cache_entry) if cache_entry else None
+        else:
+            ranges = await self._acquire_segment_slots(segment_slots)
+            headers = {"Range": "bytes={}-{}".format(*ranges[0])} if ranges else None
+        async with segment_slots, self.session.get(
+            self.url, proxy=self.proxy, proxy_auth=self.proxy_auth, auth=self.auth, headers=headers
         ) as response:
+            self._record_response(response)
+            if self._resume_from and response.status == 416:
+                self._ensure_no_broken_file()
+                raise aiohttp.ClientPayloadError(
+                    "The server did not accept resuming the download of {}".format(self.url)
+                )
             self.raise_for_status(response)
-            to_return = await self._handle_response(response)
+            if ranges and response.status == 206:
+                to_return = await self._handle_segmented_response(response, ranges)
+            elif cache_entry and response.status == 304:
+                to_return = await self._handle_not_modified_response(response, cache_entry)
+            else:
+                to_return = await self._handle_response(response)
+                if self.cache is not None and response.status == 200:
+                    await _run_on_data_executor(
+                        self.cache.store,
+                        self.url,
+                        response.headers,
+                        to_return.path,
+                        to_return.artifact_attributes,
+                    )
             await response.release()
         if self._close_session_on_finalize:
             await self.session.close()
         return to_return
 
+    async def _handle_not_modified_response(self, response, cache_entry):
+        """
+        Handle a ``304 Not Modified`` response by using the cached file.
+
+        Args:
+            response (aiohttp.ClientResponse): The response to handle.
+            cache_entry (dict): The entry of the URL in `self.cache`.
+
+        Returns:
+             DownloadResult: Contains information about the result. See the DownloadResult docs for
+                 more information.
+        """
+        self._ensure_writer_has_open_file()
+        writer, self._writer = self._writer, None
+        writer.close()
+        try:
+            await _run_on_data_executor(self.cache.restore, cache_entry, self.path)
+        except FileNotFoundError:
+            # The cached file was pruned since the lookup, download the file again on retry
+            self.cache = None
+            raise aiohttp.ClientPayloadError("The cached file of {} was removed.".format(self.url))
+        attributes = cache_entry["artifact_attributes"]
+        try:
+            for algorithm, expected_digest in (self.expected_digests or {}).items():
+                if attributes.get(algorithm) != expected_digest:
+                    raise DigestValidationError(
+                        attributes.get(algorithm), expected_digest, url=self.url
+                    )
+            if self.expected_size and attributes["size"] != self.expected_size:
+                raise SizeValidationError(attributes["size"], self.expected_size, url=self.url)
+        except (DigestValidationError, SizeValidationError):
+            # Download the file again on retry
+            self.cache = None
+            raise
+        return DownloadResult(
+            path=self.path,
+            artifact_attributes=attributes,
+            url=self.url,
+            headers=response.headers,
+        )
+
+    async def _acquire_segment_slots(self, segment_slots):
+        """
+        Acquire the download slots of the byte ranges of a segmented download.
+
+        The first range uses the slot of the download. Every other range holds a slot of
+        `self.semaphore` and of `self.shared_semaphore` if set, which are only taken if they are
+        free, so a download never waits for slots while holding one.
+
+        Args:
+            segment_slots (contextlib.AsyncExitStack): Holds the slots acquired.
+
+        Returns:
+            A list of the first and last byte positions of each range, or None if the file is
+            not to be downloaded in segments.
+        """
+        if (
+            self.segments <= 1
+            or not self.expected_size
+            or self.headers_ready_callback is not None
+            or "handle_data" in vars(self)
+            or type(self).handle_data is not BaseDownloader.handle_data
+        ):
+            return None
+        count = 1
+        while (
+            count < min(self.segments, self.expected_size // self.min_segment_size)
+            and not self.semaphore.locked()
+        ):
+            slot = AsyncExitStack()
+            await slot.enter_async_context(self.semaphore)
+            if self.shared_semaphore and not await slot.enter_async_context(
+                self.shared_semaphore.lease(blocking=False)
+            ):
+                await slot.aclose()
+                break
+            segment_slots.push_async_exit(slot)
+            count += 1
+        if count <= 1:
+            return None
+        return self._segment_ranges(count)
+
+    def _segment_ranges(self, count):
+        """
+        Split the file into `count` byte ranges.
+
+        Returns:
+            A list of the first and last byte positions of each range.
+        """
+        length = -(-self.expected_size // count)
+        return [
+            (start, min(start + length, self.expected_size) - 1)
+            for start in range(0, self.expected_size, length)
+        ]
+
+    async def _handle_segmented_response(self, response, ranges):
+        """
+        Handle the response to the first range of a segmented download and download the others.
+
+        Args:
+            response (aiohttp.ClientResponse): The response to the request of the first range.
+            ranges (list): The first and last byte positions of each range.
+
+        Returns:
+             DownloadResult: Contains information about the result. See the DownloadResult docs for
+                 more information.
+        """
+        content_range = parse_content_range(response.headers.get("Content-Range"))
+        if content_range is None or content_range[:2] != ranges[0]:
+            raise aiohttp.ClientPayloadError(
+                "Unexpected Content-Range {!r}".format(response.headers.get("Content-Range"))
+            )
+        if content_range[2] not in (None, self.expected_size):
+            raise SizeValidationError(content_range[2], self.expected_size, url=self.url)
+
+        self._ensure_writer_has_open_file()
+        fd = self._writer.fileno()
+        await _run_on_data_executor(os.ftruncate, fd, self.expected_size)
+        segments = [
+            asyncio.ensure_future(self._download_segment(fd, start, end))
+            for start, end in ranges[1:]
+        ]
+        try:
+            # The first range is written and hashed as a regular download
+            while True:
+                chunk = await response.content.read(1048576)  # 1 megabyte
+                if not chunk:
+                    break
+                await self.handle_data(chunk)
+            await self._wait_for_pending_data()
+            if self._size != ranges[0][1] + 1:
+                raise aiohttp.ClientPayloadError(
+                    "The byte range {}-{} is incomplete".format(*ranges[0])
+                )
+            # The others are hashed in order, each one once it is complete
+            for segment, (start, end) in zip(segments, ranges[1:]):
+                await segment
+                await _run_on_data_executor(self._record_size_and_digests_for_range, fd, start, end)
+        finally:
+            for segment in segments:
+                segment.cancel()
+            await asyncio.gather(*segments, return_exceptions=True)
+        await self.finalize()
+        return DownloadResult(
+            path=self.path,
+            artifact_attributes=self.artifact_attributes,
+            url=self.url,
+            headers=response.headers,
+        )
+
+    async def _download_segment(self, fd, start, end):
+        """
+        Download a byte range of a segmented download into the preallocated file.
+
+        Args:
+            fd (int): The file descriptor of the preallocated file.
+            start (int): The position of the first byte of the range.
+            end (int): The position of the last byte of the range.
+        """
+        if self.download_throttler:
+            await self.download_throttler.acquire()
+        async with self.session.get(
+            self.url,
+            proxy=self.proxy,
+            proxy_auth=self.proxy_auth,
+            auth=self.auth,
+            headers={"Range": "bytes={}-{}".format(start, end)},
+        ) as response:
+            self.raise_for_status(response)
+            content_range = parse_content_range(response.headers.get("Content-Range"))
+            if response.status != 206 or content_range is None or content_range[:2] != (start, end):
+                raise aiohttp.ClientPayloadError(
+                    "The server did not return the byte range {}-{}".format(start, end)
+                )
+            position = start
+            while True:
+                chunk = await response.content.read(1048576)  # 1 megabyte
+                if not chunk:
+                    break
+                if position + len(chunk) > end + 1:
+                    raise aiohttp.ClientPayloadError(
+                        "The byte range {}-{} is too long".format(start, end)
+                    )
+                await _run_on_data_executor(os.pwrite, fd, chunk, position)
+                position += len(chunk)
+            if position != end + 1:
+                raise aiohttp.ClientPayloadError(
+                    "The byte range {}-{} is incomplete".format(start, end)
+                )
+
+    def _record_size_and_digests_for_range(self, fd, start, end):
+        """
+        Record the size and digests for a byte range read back from the file. Runs on the thread
+        pool.
+
+        Args:
+            fd (int): The file descriptor of the file.
+            start (int): The position of the first byte of the range.
+            end (int): The position of the last byte of the range.
+        """
+        position = start
+        while position <= end:
+            data = os.pread(fd, min(1048576, end + 1 - position), position)
+            if not data:
+                raise aiohttp.ClientPayloadError(
+                    "The byte range {}-{} is incomplete".format(start, end)
+                )
+            self._record_size_and_digests_for_data(data)
+            position += len(data)
+
+    async def _record_request_start(self):
+        """
+        Honor a pause requested by the host and remember when the request was sent, to report it
+        to an adaptive semaphore.
+        """
+        if isinstance(self.semaphore, AdaptiveSemaphore):
+            await self.semaphore.wait_if_paused()
+            self._request_started = self.semaphore.loop_time()
+
+    def _record_request_failure(self, retry_after=None):
+        """Report a failed request to an adaptive semaphore."""
+        if self._request_started is not None:
+            self.semaphore.record_failure(self._request_started, retry_after=retry_after)
+            self._request_started = None
+
+    def _record_response(self, response):
+        """
+        Report the response to a request to an adaptive semaphore and to the stats.
+
+        Args:
+            response (aiohttp.ClientResponse): The response to report.
+        """
+        if self.stats is not None:
+            if self.stats.time_to_first_byte is None:
+                self.stats.time_to_first_byte = self.stats.elapsed()
+            self.stats.status = response.status
+        if self._request_started is None:
+            return
+        if response.status == 429 or response.status >= 500:
+            self._record_request_failure(parse_retry_after(response.headers.get("Retry-After")))
+        else:
+            self.semaphore.record_success(self._request_started)
+            self._request_started = None
+
+    async def _can_resume(self):
+        """
+        Check whether a retry can resume the download from the file of the previous attempt.
+
+        Returns:
+            bool: True if the download is resumed from `self._resume_from`.
+        """
+        if (
+            self._writer is None
+            or self._resume_validator is None
+            or self.headers_ready_callback is not None
+        ):
+            return False
+        try:
+            await self._wait_for_pending_data()
+        except OSError:
+            return False
+        self._resume_from = self._size
+        return self._resume_from > 0
+
     def _ensure_no_broken_file(self):
         """Upon retry reset writer back to None to get a fresh file."""
+        self._resume_from = 0
+        self._resume_validator = None
         if self._writer is not None:
             self._writer.delete = True
             self._writer.close()
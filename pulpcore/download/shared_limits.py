@@ -0,0 +1,301 @@
+from gettext import gettext as _
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+import hashlib
+import logging
+import os
+import random
+
+from asyncio_throttle import Throttler
+from django.db import connection, DatabaseError
+
+log = logging.getLogger(__name__)
+
+#: The group of the postgres advisory locks of the concurrency slots of the remotes
+SHARED_SEMAPHORE_LOCK_GROUP = 44
+
+_limits_executor = None
+_limits_executor_pid = None
+# The slots held by this process, only accessed from the thread of the executor
+_held_slots = set()
+
+
+def _get_limits_executor():
+    """
+    The thread running the database work of the shared limits of this process.
+
+    All the work runs on a single thread, so the advisory locks of the slots are taken and released
+    on the same database connection. The thread is created on first use, and again in forked
+    children, which lack it.
+    """
+    global _limits_executor, _limits_executor_pid, _held_slots
+    if _limits_executor_pid != os.getpid():
+        _limits_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pulp-download-limits"
+        )
+        _limits_executor_pid = os.getpid()
+        _held_slots = set()
+    return _limits_executor
+
+
+def _submit_to_limits_thread(func, *args):
+    return asyncio.get_running_loop().run_in_executor(
+        _get_limits_executor(), _close_connection_on_error, func, *args
+    )
+
+
+async def _run_in_limits_thread(func, *args):
+    # Once submitted, the work must complete to keep the locks of this process consistent
+    return await asyncio.shield(_submit_to_limits_thread(func, *args))
+
+
+def _close_connection_on_error(func, *args):
+    try:
+        return func(*args)
+    except DatabaseError:
+        # Reconnect on the next attempt. The locks of the slots are gone with the connection.
+        connection.close()
+        _held_slots.clear()
+        raise
+
+
+def _reserve_request(remote_pk, interval):
+    """
+    Reserve the next request to a remote, see :class:`SharedThrottler`.
+
+    Returns:
+        float: The number of seconds to wait before sending the request.
+    """
+    from pulpcore.app.models import RemoteRateLimit
+
+    table = RemoteRateLimit._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {table} (remote_id, theoretical_arrival_time) "
+            "VALUES (%s, clock_timestamp() + %s * interval '1 second') "
+            "ON CONFLICT (remote_id) DO UPDATE SET theoretical_arrival_time = "
+            "greatest({table}.theoretical_arrival_time, clock_timestamp()) "
+            "+ %s * interval '1 second' "
+            "RETURNING extract(epoch from theoretical_arrival_time - clock_timestamp())".format(
+                table=table
+            ),
+            [remote_pk, interval, interval],
+        )
+        (scheduled_in,) = cursor.fetchone()
+    # Requests may be sent up to a second ahead of their schedule, which allows bursts of up to
+    # the rate limit like the asyncio_throttle.Throttler
+    return max(float(scheduled_in) - 1.0, 0.0)
+
+
+def _try_lock_slot(slots):
+    """
+    Lock the first free slot of `slots`.
+
+    The slots are probed in order with a single statement, which stops at the first one locked.
+
+    Returns:
+        int: The slot locked, or None if all of them are held.
+    """
+    slots = [slot for slot in slots if slot not in _held_slots]
+    if not slots:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT slot FROM unnest(%s::integer[]) AS slot "
+            "WHERE pg_try_advisory_lock(%s, slot) LIMIT 1",
+            [slots, SHARED_SEMAPHORE_LOCK_GROUP],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    _held_slots.add(row[0])
+    return row[0]
+
+
+def _unlock_slot(slot):
+    if slot not in _held_slots:
+        return
+    _held_slots.discard(slot)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [SHARED_SEMAPHORE_LOCK_GROUP, slot])
+
+
+def _unlock_held_slots():
+    with connection.cursor() as cursor:
+        for slot in _held_slots:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [SHARED_SEMAPHORE_LOCK_GROUP, slot])
+    _held_slots.clear()
+
+
+def release_held_slots():
+    """
+    Release the slots still held by this process, e.g. by the downloads of an aborted task.
+    """
+    if _limits_executor_pid == os.getpid():
+        # On a database error, the locks of the slots are gone with the connection
+        with suppress(DatabaseError):
+            _limits_executor.submit(_close_connection_on_error, _unlock_held_slots).result()
+
+
+def _unlock_slot_of_attempt(attempt):
+    """
+    Unlock the slot locked by an attempt whose caller was cancelled in the meantime.
+    """
+    if not attempt.cancelled() and attempt.exception() is None and attempt.result() is not None:
+        _get_limits_executor().submit(_close_connection_on_error, _unlock_slot, attempt.result())
+
+
+class SharedThrottler:
+    """
+    A rate limit of the requests to a remote shared by all Pulp processes.
+
+    It is a drop-in replacement for :class:`asyncio_throttle.Throttler`, used by
+    :attr:`~pulpcore.plugin.models.Remote.download_throttler` when the ``DOWNLOAD_SHARED_LIMITS``
+    setting is enabled. The limit follows the generic cell rate algorithm: each request reserves
+    the next slot of the remote in the database and waits until its turn, allowing bursts of up to
+    `rate_limit` requests. If the database can't be reached, the limit falls back to this process.
+
+    Args:
+        remote_pk (uuid.UUID): The primary key of the remote.
+        rate_limit (int): The maximum number of requests per second.
+    """
+
+    def __init__(self, remote_pk, rate_limit):
+        self.remote_pk = remote_pk
+        self.rate_limit = rate_limit
+        self._local = Throttler(rate_limit=rate_limit)
+
+    async def acquire(self):
+        """
+        Wait until a request to the remote may be sent.
+        """
+        try:
+            wait = await _run_in_limits_thread(
+                _reserve_request, self.remote_pk, 1.0 / self.rate_limit
+            )
+        except DatabaseError as e:
+            log.warning(_("Falling back to the local rate limit of the remote: {}").format(e))
+            await self._local.acquire()
+            return
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class SharedSemaphore:
+    """
+    A limit of the concurrent downloads from a remote shared by all Pulp processes.
+
+    It is used by the :class:`~pulpcore.plugin.download.DownloaderFactory` when the
+    ``DOWNLOAD_SHARED_LIMITS`` setting is enabled and the remote sets a ``download_concurrency``.
+    Each download holds one of `limit` postgres advisory locks for the remote, which are released
+    along with the database connection if the process dies. The downloads waiting for a slot are
+    woken up when a download of this process releases one, and poll the database for the slots
+    released by other processes. If the database can't be reached, the downloads are only
+    restricted by the limits of this process.
+
+    Args:
+        remote_pk (uuid.UUID): The primary key of the remote.
+        limit (int): The maximum number of concurrent downloads.
+    """
+
+    #: The minimum and maximum number of seconds between two attempts to take a slot held by
+    #: another process.
+    POLL_INTERVAL = (0.1, 2.0)
+
+    def __init__(self, remote_pk, limit):
+        self.remote_pk = remote_pk
+        self.limit = limit
+        self._slots = [
+            int.from_bytes(
+                hashlib.sha256("{}:{}".format(remote_pk, slot).encode()).digest()[:4],
+                "big",
+                signed=True,
+            )
+            for slot in range(limit)
+        ]
+        # The number of slots leased in this process, and the leases waiting for one of them
+        self._held = 0
+        self._waiters = deque()
+
+    async def _wait_for_release(self, timeout):
+        """
+        Wait until a slot leased in this process is released, or for `timeout` seconds.
+
+        If all the slots are leased in this process, only a release here can free one, so there is
+        no timeout. Otherwise another process may release one in the meantime.
+        """
+        if self._held >= self.limit:
+            timeout = None
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait([waiter], timeout=timeout)
+        except asyncio.CancelledError:
+            # Pass the wakeup on to the next waiter.
+            if waiter.done():
+                self._wake_up()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waiter.cancel()
+
+    def _wake_up(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def lease(self, blocking=True):
+        """
+        Hold one of the slots of the remote, waiting for one to be free.
+
+        Args:
+            blocking (bool): If False, don't wait for a slot to be free.
+
+        Yields:
+            bool: Whether the lease is held, which is only False if `blocking` is False and all
+                the slots were held.
+        """
+        interval, max_interval = self.POLL_INTERVAL
+        slot = None
+        held = True
+        try:
+            while slot is None:
+                # Start at a random slot, so the processes don't all contend for the first ones
+                start = random.randrange(self.limit)
+                attempt = _submit_to_limits_thread(
+                    _try_lock_slot, self._slots[start:] + self._slots[:start]
+                )
+                try:
+                    slot = await asyncio.shield(attempt)
+                except asyncio.CancelledError:
+                    attempt.add_done_callback(_unlock_slot_of_attempt)
+                    raise
+                if slot is None:
+                    if not blocking:
+                        held = False
+                        break
+                    await self._wait_for_release(interval)
+                    interval = min(interval * 2, max_interval)
+        except DatabaseError as e:
+            log.warning(
+                _("Falling back to the local concurrency limit of the remote: {}").format(e)
+            )
+        if slot is not None:
+            self._held += 1
+        try:
+            yield held
+        finally:
+            if slot is not None:
+                try:
+                    with suppress(DatabaseError):
+                        await _run_in_limits_thread(_unlock_slot, slot)
+                finally:
+                    self._held -= 1
+                    self._wake_up()
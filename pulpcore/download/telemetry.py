@@ -0,0 +1,184 @@
+import asyncio
+from collections import defaultdict
+
+from opentelemetry import metrics
+
+from pulpcore.app.util import current_task
+
+_meter = metrics.get_meter("pulpcore.download")
+_duration_histogram = _meter.create_histogram(
+    "pulp.download.duration", unit="s", description="The duration of the downloads."
+)
+_time_to_first_byte_histogram = _meter.create_histogram(
+    "pulp.download.time_to_first_byte",
+    unit="s",
+    description="The time from the start of the downloads to their first response.",
+)
+_bytes_counter = _meter.create_counter(
+    "pulp.download.bytes", unit="By", description="The size of the downloaded files."
+)
+_retries_counter = _meter.create_counter(
+    "pulp.download.retries", description="The number of retried download attempts."
+)
+
+_FIELDS = (
+    "downloads",
+    "responses",
+    "failures",
+    "retries",
+    "bytes",
+    "duration",
+    "time_to_first_byte",
+    "max_time_to_first_byte",
+)
+# The totals of the downloads of this process, keyed by task id, remote and host
+_totals = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(_FIELDS, 0)))
+
+
+def current_task_id():
+    """
+    The id of the task the downloads of this context are summed up for, or None outside of tasks.
+    """
+    task = current_task.get()
+    return task.pk if task is not None else None
+
+
+class DownloadStats:
+    """
+    The statistics of a single download, including all its attempts.
+
+    Attributes:
+        host (str): The host downloaded from.
+        started (float): The event loop time the download started at.
+        time_to_first_byte (float): The number of seconds until the first response arrived, or None
+            if no response did.
+        duration (float): The number of seconds the download took.
+        size (int): The size in bytes of the downloaded file.
+        retries (int): The number of failed attempts that were retried.
+        status (int or str): The HTTP status of the last response, or the name of the exception the
+            download failed with.
+    """
+
+    __slots__ = ("host", "started", "time_to_first_byte", "duration", "size", "retries", "status")
+
+    def __init__(self, host):
+        self.host = host
+        self.started = asyncio.get_running_loop().time()
+        self.time_to_first_byte = None
+        self.duration = None
+        self.size = 0
+        self.retries = 0
+        self.status = None
+
+    def elapsed(self):
+        """
+        The number of seconds since the download started.
+        """
+        return asyncio.get_running_loop().time() - self.started
+
+
+class DownloadTelemetry:
+    """
+    Records the statistics of the downloads of a remote.
+
+    The statistics are summed up per task, remote and host, see :func:`summary`, and recorded as
+    OpenTelemetry metrics, which are exported if the process is run with OpenTelemetry
+    instrumentation, e.g. the content app serving on-demand content.
+
+    Args:
+        remote_name (str): The name of the remote.
+    """
+
+    def __init__(self, remote_name):
+        self.remote_name = remote_name
+
+    def record(self, stats):
+        """
+        Record the statistics of a finished download.
+
+        Args:
+            stats (:class:`DownloadStats`): The statistics of the download.
+        """
+        failed = not isinstance(stats.status, int) or stats.status >= 400
+        totals = _totals[current_task_id()][(self.remote_name, stats.host)]
+        totals["downloads"] += 1
+        totals["failures"] += failed
+        totals["retries"] += stats.retries
+        totals["bytes"] += stats.size
+        totals["duration"] += stats.duration
+        if stats.time_to_first_byte is not None:
+            totals["responses"] += 1
+            totals["time_to_first_byte"] += stats.time_to_first_byte
+            totals["max_time_to_first_byte"] = max(
+                totals["max_time_to_first_byte"], stats.time_to_first_byte
+            )
+
+        attributes = {"remote": self.remote_name, "host": stats.host, "status": str(stats.status)}
+        _duration_histogram.record(stats.duration, attributes)
+        if stats.time_to_first_byte is not None:
+            _time_to_first_byte_histogram.record(stats.time_to_first_byte, attributes)
+        _bytes_counter.add(stats.size, attributes)
+        if stats.retries:
+            _retries_counter.add(stats.retries, attributes)
+
+
+def summary(task_id=None):
+    """
+    Summarize the downloads of a task.
+
+    Args:
+        task_id (uuid.UUID): The id of the task, or None for the downloads outside of tasks.
+
+    Returns:
+        list: A dict per remote and host with the number of "downloads", of downloads which got
+            a "responses", of "failures" and of "retries", the total "bytes" and "duration" in
+            seconds, and the mean and maximum "time_to_first_byte" in seconds.
+    """
+    result = []
+    for (remote_name, host), totals in sorted(_totals.get(task_id, {}).items()):
+        entry = {"remote": remote_name, "host": host, **totals}
+        if totals["responses"]:
+            entry["time_to_first_byte"] = totals["time_to_first_byte"] / totals["responses"]
+        result.append(entry)
+    return result
+
+
+def reset(task_id=None):
+    """
+    Forget the downloads of a task.
+
+    Args:
+        task_id (uuid.UUID): The id of the task, or None for the downloads outside of tasks.
+    """
+    _totals.pop(task_id, None)
+
+
+def take(task_id=None):
+    """
+    Take the totals of the downloads of a task out of this process, e.g. to pass them on to the
+    process running the task, see :func:`merge`.
+
+    Args:
+        task_id (uuid.UUID): The id of the task, or None for the downloads outside of tasks.
+
+    Returns:
+        dict: The totals of the downloads, keyed by remote and host.
+    """
+    return {key: dict(totals) for key, totals in _totals.pop(task_id, {}).items()}
+
+
+def merge(totals, task_id=None):
+    """
+    Add the totals of downloads taken out of another process to those of a task.
+
+    Args:
+        totals (dict): The totals of the downloads, keyed by remote and host, see :func:`take`.
+        task_id (uuid.UUID): The id of the task, or None for the downloads outside of tasks.
+    """
+    for key, other in totals.items():
+        task_totals = _totals[task_id][key]
+        for field, value in other.items():
+            if field.startswith("max_"):
+                task_totals[field] = max(task_totals[field], value)
+            else:
+                task_totals[field] += value
@@ -1,5 +1,7 @@
 from pulpcore.download import (
+    AdaptiveSemaphore,
     BaseDownloader,
+    DownloadCache,
     DownloadResult,
     DownloaderFactory,
     FileDownloader,
@@ -1,4 +1,4 @@
-from .api import create_pipeline, EndStage, Stage
+from .api import create_pipeline, EndStage, Stage, sync_to_db
 from .artifact_stages import (
     ACSArtifactHandler,
     ArtifactDownloader,
@@ -10,8 +10,10 @@ from .artifact_stages import (
 from .content_stages import (
     ContentAssociation,
     ContentSaver,
+    QueryAssociatedContents,
     QueryExistingContents,
     ResolveContentFutures,
 )
 from .declarative_version import DeclarativeVersion
 from .models import DeclarativeArtifact, DeclarativeContent
+from .shard_stages import ShardedStages
@@ -1,12 +1,105 @@
 import asyncio
+import contextvars
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
+from django.db import connections
 from gettext import gettext as _
 
 from pulpcore.app.util import get_domain
 
 log = logging.getLogger(__name__)
 
+_db_executor = contextvars.ContextVar("db_executor", default=None)
+
+
+class DatabaseExecutor:
+    """
+    A pool of threads running the database work of the stages of a pipeline.
+
+    Each thread uses its own database connection, so the database work of different stages can
+    run in parallel instead of taking turns on the single thread used by ``sync_to_async``. Work is
+    submitted to the thread with the least pending work, unless a `key` is given. All work with the
+    same `key` runs on the same thread and connection in the order it was submitted, e.g. to keep
+    using a temporary table.
+
+    Args:
+        workers (int): The number of threads, and database connections, of the pool.
+    """
+
+    def __init__(self, workers):
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="pulp-stages-db")
+            for _i in range(workers)
+        ]
+        self._pending = [0] * workers
+
+    async def run(self, func, *args, key=None, **kwargs):
+        """
+        Run `func` in one of the threads of the pool and return its result.
+
+        Args:
+            func (callable): The synchronous function doing database work.
+            args: positional arguments passed along to `func`.
+            key (hashable): An optional key selecting the thread to run `func` in.
+            kwargs: keyword arguments passed along to `func`.
+
+        Returns:
+            The result of `func`.
+        """
+        if key is None:
+            index = min(range(len(self._executors)), key=self._pending.__getitem__)
+        else:
+            index = hash(key) % len(self._executors)
+        context = contextvars.copy_context()
+        self._pending[index] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executors[index], functools.partial(context.run, func, *args, **kwargs)
+            )
+        finally:
+            self._pending[index] -= 1
+
+    def shutdown(self):
+        """
+        Close the database connections and stop the threads of the pool.
+        """
+        for executor in self._executors:
+            executor.submit(connections.close_all)
+            executor.shutdown(wait=True)
+
+
+def sync_to_db(func, key=None):
+    """
+    Wrap a synchronous function doing database work to run it in the database threads of the
+    current pipeline.
+
+    This is used by the stages like ``sync_to_async``, which it falls back to outside of a pipeline
+    with a :class:`DatabaseExecutor`::
+
+        await sync_to_db(Artifact.objects.bulk_get_or_create)(artifacts)
+
+    Args:
+        func (callable): The synchronous function doing database work.
+        key (hashable): Run all work with this key on the same thread and database connection,
+            in the order it was submitted. Work needing the same transaction or session, like a
+            temporary table, must use the same key.
+
+    Returns:
+        A coroutine function running `func`.
+    """
+    db_executor = _db_executor.get()
+    if db_executor is None:
+        return sync_to_async(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, key=key, **kwargs)
+
+    return wrapper
+
 
 class Stage:
     """
@@ -177,7 +270,7 @@ class Stage:
         return "[{id}] {name}".format(id=id(self), name=self.__class__.__name__)
 
 
-async def create_pipeline(stages, maxsize=1):
+async def create_pipeline(stages, maxsize=1, db_workers=3):
     """
     A coroutine that builds a Stages API linear pipeline from the list `stages` and runs it.
 
@@ -195,6 +288,9 @@ async def create_pipeline(stages, maxsize=1):
         stages (list of coroutines): A list of Stages API compatible coroutines.
         maxsize (int): The maximum amount of items a queue between two stages should hold. Optional
             and defaults to 1.
+        db_workers (int): The number of threads, each with its own database connection, running
+            the database work the stages submit with :func:`sync_to_db`. Optional and defaults
+            to 3. With 0, the database work runs on the single thread of ``sync_to_async``.
 
     Returns:
         A single coroutine that can be used to run, wait, or cancel the entire pipeline with.
@@ -204,17 +300,23 @@ async def create_pipeline(stages, maxsize=1):
     futures = []
     history = set()
     in_q = None
-    for i, stage in enumerate(stages):
-        if stage in history:
-            raise ValueError(_("Each stage instance must be unique."))
-        history.add(stage)
-        if i < len(stages) - 1:
-            out_q = asyncio.Queue(maxsize=maxsize)
-        else:
-            out_q = None
-        stage._connect(in_q, out_q)
-        futures.append(asyncio.ensure_future(stage()))
-        in_q = out_q
+    db_executor = DatabaseExecutor(db_workers) if db_workers else None
+    # The stages are run in tasks, which inherit the executor from the current context.
+    db_executor_token = _db_executor.set(db_executor)
+    try:
+        for i, stage in enumerate(stages):
+            if stage in history:
+                raise ValueError(_("Each stage instance must be unique."))
+            history.add(stage)
+            if i < len(stages) - 1:
+                out_q = asyncio.Queue(maxsize=maxsize)
+            else:
+                out_q = None
+            stage._connect(in_q, out_q)
+            futures.append(asyncio.ensure_future(stage()))
+            in_q = out_q
+    finally:
+        _db_executor.reset(db_executor_token)
 
     try:
         await asyncio.gather(*futures)
@@ -229,6 +331,9 @@ async def create_pipeline(stages, maxsize=1):
         if pending:
             await asyncio.wait(pending, timeout=60)
         raise
+    finally:
+        if db_executor is not None:
+            db_executor.shutdown()
 
 
 class EndStage(Stage):
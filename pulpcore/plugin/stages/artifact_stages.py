@@ -1,12 +1,22 @@
 import asyncio
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, AsyncExitStack
 from gettext import gettext as _
+import hashlib
+import heapq
+from itertools import count
 import logging
+import os
 
 from aiofiles import os as aos
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
 from django.db.models import Prefetch, prefetch_related_objects, Q
 
+from pulpcore.app.files import TemporaryDownloadedFile
+from pulpcore.app.models.storage import is_staged_path
 from pulpcore.plugin.exceptions import UnsupportedDigestValidationError
 from pulpcore.plugin.models import (
     AlternateContentSource,
@@ -15,21 +25,105 @@ from pulpcore.plugin.models import (
     ProgressReport,
     RemoteArtifact,
 )
-from pulpcore.plugin.sync import sync_to_async_iterable
+from pulpcore.plugin.util import get_domain, sync_filesystems
 
-from .api import Stage
+from .api import Stage, sync_to_db
 
 log = logging.getLogger(__name__)
 
+#: The namespace the keys of the postgres advisory locks claiming downloads are derived in
+_DOWNLOAD_CLAIM_LOCK_NAMESPACE = "pulpcore.download_claim"
+#: The key of the database thread holding the download claims of a pipeline
+_DOWNLOAD_CLAIMS_KEY = "download_claims"
+#: The minimum and maximum number of seconds between two attempts to claim a download
+_DOWNLOAD_CLAIM_POLL_INTERVAL = (0.5, 5.0)
+#: The number of seconds after which a task downloads the artifacts claimed by another one itself
+_DOWNLOAD_CLAIM_TIMEOUT = 300
+#: The storage backends the ArtifactSaver uploads the files of the artifacts to in parallel
+_OBJECT_STORAGE_CLASSES = (
+    "storages.backends.s3boto3.S3Boto3Storage",
+    "storages.backends.azure_storage.AzureStorage",
+    "storages.backends.gcloud.GoogleCloudStorage",
+)
+
+_upload_executor = None
+_upload_executor_pid = None
+
+
+def _get_upload_executor():
+    """
+    The thread pool uploading the files of the artifacts to object storage in this process.
+
+    The pool is created on first use, and again in forked children, which lack its threads.
+    """
+    global _upload_executor, _upload_executor_pid
+    if _upload_executor_pid != os.getpid():
+        _upload_executor = ThreadPoolExecutor(
+            max_workers=settings.ARTIFACT_UPLOAD_CONCURRENCY,
+            thread_name_prefix="pulp-artifact-upload",
+        )
+        _upload_executor_pid = os.getpid()
+    return _upload_executor
+
+
+def _upload_artifact_file(storage, path, name):
+    with open(path, "rb") as f:
+        return storage.save(name, TemporaryDownloadedFile(f))
+
+
+def _download_claim_lock(sha256):
+    # A 64 bit key, hashed in its own namespace so it doesn't collide with other advisory locks
+    digest = hashlib.sha256("{}:{}".format(_DOWNLOAD_CLAIM_LOCK_NAMESPACE, sha256).encode())
+    return int.from_bytes(digest.digest()[:8], "big", signed=True)
+
+
+def _try_claim_downloads(sha256s):
+    """
+    Claim the downloads of the artifacts with `sha256s` for this database session, all or none.
+
+    Args:
+        sha256s (list): The distinct sha256 of the artifacts.
+
+    Returns:
+        bool: Whether the downloads were claimed. If another session holds any of the claims,
+            none of them is held.
+    """
+    keys = [_download_claim_lock(sha256) for sha256 in sha256s]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT key FROM unnest(%s::bigint[]) AS key WHERE pg_try_advisory_lock(key)", [keys]
+        )
+        claimed = [key for key, in cursor.fetchall()]
+        if len(claimed) == len(keys):
+            return True
+        if claimed:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(key) FROM unnest(%s::bigint[]) AS key", [claimed]
+            )
+    return False
 
-def _check_for_forbidden_checksum_type(artifact):
+
+def _release_download_claims(sha256s):
+    keys = [_download_claim_lock(sha256) for sha256 in sha256s]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(key) FROM unnest(%s::bigint[]) AS key", [keys])
+
+
+def _saved_artifacts(sha256s, domain):
+    return {
+        artifact.sha256: artifact
+        for artifact in Artifact.objects.filter(sha256__in=sha256s, pulp_domain=domain)
+    }
+
+
+def _check_for_forbidden_checksum_type(d_artifact):
     """Check if content doesn't have forbidden checksum type.
 
     If contains forbidden checksum type it will raise ValueError,
     otherwise it passes without returning anything.
     """
     for digest_type in Artifact.FORBIDDEN_DIGESTS:
-        digest_value = getattr(artifact, digest_type)
+        digest_value = d_artifact.get_artifact_attribute(digest_type)
         if digest_value:
             # To use shared message constant when #7988 is merged
             raise UnsupportedDigestValidationError(
@@ -79,11 +173,11 @@ class QueryExistingArtifacts(Stage):
             # sufficient to identify the Artifact.
             for d_content in batch:
                 for d_artifact in d_content.d_artifacts:
-                    if d_artifact.artifact._state.adding:
+                    if not d_artifact.artifact_is_saved:
                         if not d_artifact.deferred_download:
-                            _check_for_forbidden_checksum_type(d_artifact.artifact)
+                            _check_for_forbidden_checksum_type(d_artifact)
                         for digest_type in Artifact.COMMON_DIGEST_FIELDS:
-                            digest_value = getattr(d_artifact.artifact, digest_type)
+                            digest_value = d_artifact.get_artifact_attribute(digest_type)
                             if digest_value:
                                 artifact_digests_by_type[digest_type].append(digest_value)
                                 break
@@ -98,27 +192,77 @@ class QueryExistingArtifacts(Stage):
                     "pulp_domain": self.domain,
                 }
                 existing_artifacts_qs = Artifact.objects.filter(**query_params)
-                existing_artifacts = sync_to_async_iterable(existing_artifacts_qs)
-                await sync_to_async(existing_artifacts_qs.touch)()
+                await sync_to_db(existing_artifacts_qs.touch)()
+                existing_artifacts = {
+                    getattr(result, digest_type): result
+                    for result in await sync_to_db(list)(existing_artifacts_qs)
+                }
                 for d_content in batch:
                     for d_artifact in d_content.d_artifacts:
-                        artifact_digest = getattr(d_artifact.artifact, digest_type)
-                        if artifact_digest:
-                            async for result in existing_artifacts:
-                                result_digest = getattr(result, digest_type)
-                                if result_digest == artifact_digest:
-                                    d_artifact.artifact = result
-                                    break
+                        artifact_digest = d_artifact.get_artifact_attribute(digest_type)
+                        if artifact_digest in existing_artifacts:
+                            d_artifact.artifact = existing_artifacts[artifact_digest]
             for d_content in batch:
                 await self.put(d_content)
 
 
+class _DownloadBudget:
+    """
+    Restricts the total size of the downloads in flight, granting the smallest waiting ones first.
+
+    A download is always granted when nothing else is in flight, so a single download larger than
+    the budget does not wait forever.
+
+    Args:
+        max_bytes (int): The maximum total size of the downloads in flight, or None for no limit.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._waiters = []
+        self._counter = count()
+
+    def _fits(self, size):
+        return (
+            self.max_bytes is None or not self.in_flight or self.in_flight + size <= self.max_bytes
+        )
+
+    async def acquire(self, size):
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (size, next(self._counter), waiter))
+        self._grant()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(size)
+            raise
+
+    def release(self, size):
+        self.in_flight -= size
+        self._grant()
+
+    def _grant(self):
+        while self._waiters:
+            size, _seq, waiter = self._waiters[0]
+            if waiter.cancelled():
+                heapq.heappop(self._waiters)
+            elif self._fits(size):
+                heapq.heappop(self._waiters)
+                self.in_flight += size
+                waiter.set_result(None)
+            else:
+                break
+
+
 class GenericDownloader(Stage):
     """
     A base Stages API stage to download files.
 
     This stage creates a ProgressReport named `PROGRESS_REPORTING_MESSAGE` that counts the number of
-    downloads completed. Since it's a stream the total count isn't known until it's finished.
+    downloads completed. Since it's a stream the total count isn't known until it's finished. The
+    suffix of the ProgressReport shows the current download concurrency limit of each host.
 
     This stage drains all available items from `self._in_q` and starts as many concurrent
     downloading tasks as possible, up to the limit defined by ``self.max_concurrent_content``.
@@ -128,20 +272,67 @@ class GenericDownloader(Stage):
     the downloads. After the downloads for that unit are complete the content should put into
     `self._out_q` to move onto the next stage.
 
+    Subclasses should run each download inside :meth:`download_slot`, which schedules the downloads
+    by their size. Downloads of at least `large_download_size` bytes run in a separate lane of at
+    most `max_concurrent_large_downloads`, so a few large files can't hold all the concurrency
+    slots while many small files wait. If `max_bytes_in_flight` is set, the total size of the
+    downloads in flight is kept below it, starting the smallest waiting downloads first, which also
+    caps the temporary disk space used by the downloads in flight.
+
     Args:
         max_concurrent_content (int): The maximum number of
             :class:`~pulpcore.plugin.stages.DeclarativeContent` instances to handle simultaneously.
             Default is 200.
         args: unused positional arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
+        large_download_size (int): The size in bytes from which a download is large. Default is
+            64 MiB.
+        max_concurrent_large_downloads (int): The maximum number of large downloads to run
+            simultaneously. Default is 5.
+        max_bytes_in_flight (int): The maximum total size in bytes of the downloads to run
+            simultaneously. Default is None, for no limit.
         kwargs: unused keyword arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
     """
 
     PROGRESS_REPORTING_MESSAGE = "Downloading"
     PROGRESS_REPORTING_CODE = "sync.downloading"
 
-    def __init__(self, max_concurrent_content=200, *args, **kwargs):
+    def __init__(
+        self,
+        max_concurrent_content=200,
+        *args,
+        large_download_size=64 * 1024 * 1024,
+        max_concurrent_large_downloads=5,
+        max_bytes_in_flight=None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.max_concurrent_content = max_concurrent_content
+        self.large_download_size = large_download_size
+        self.max_concurrent_large_downloads = max_concurrent_large_downloads
+        # Created in run(), since a semaphore binds to the current event loop on Python < 3.10,
+        # and the stage may run on another one, e.g. in a shard of ShardedStages
+        self._large_downloads = None
+        self._download_budget = _DownloadBudget(max_bytes_in_flight)
+        self._download_factories = set()
+
+    @asynccontextmanager
+    async def download_slot(self, size):
+        """
+        Wait for the scheduling policy to allow a download of `size` bytes.
+
+        Args:
+            size (int): The expected size of the download, or None if it is unknown, in which case
+                it is scheduled like a small download.
+        """
+        size = size or 0
+        async with AsyncExitStack() as stack:
+            if size >= self.large_download_size:
+                await stack.enter_async_context(self._large_downloads)
+            await self._download_budget.acquire(size)
+            try:
+                yield
+            finally:
+                self._download_budget.release(size)
 
     async def run(self):
         """
@@ -150,6 +341,7 @@ class GenericDownloader(Stage):
         Returns:
             The coroutine for this stage.
         """
+        self._large_downloads = asyncio.Semaphore(self.max_concurrent_large_downloads)
 
         def _add_to_pending(coro):
             nonlocal pending
@@ -184,6 +376,7 @@ class GenericDownloader(Stage):
                                 content_get_task = None
                         else:
                             pb.done += task.result()  # download_count
+                            pb.suffix = self._concurrency_suffix()
                             await pb.asave()
 
                     if content_get_task and content_get_task not in pending:  # not yet shutdown
@@ -195,6 +388,18 @@ class GenericDownloader(Stage):
                     future.cancel()
                 raise
 
+    def _concurrency_suffix(self):
+        limits = {}
+        for download_factory in self._download_factories:
+            for host, limit in download_factory.limits().items():
+                limits[host] = max(limits.get(host, 0), limit)
+        if not limits:
+            return None
+        return ", ".join(
+            _("{host}: {limit} concurrent").format(host=host, limit=limit)
+            for host, limit in sorted(limits.items())
+        )
+
     async def _handle_content_unit(self, d_content):
         """Handle one content unit.
 
@@ -217,6 +422,13 @@ class ArtifactDownloader(GenericDownloader):
     added to the :class:`~pulpcore.plugin.stages.DeclarativeArtifact` object, replacing the likely
     incomplete :class:`~pulpcore.plugin.models.Artifact`.
 
+    With the ``DOWNLOAD_DEDUPLICATION`` setting, the downloads of artifacts with a known sha256 are
+    claimed cluster-wide with postgres advisory locks, which are held until the
+    :class:`ArtifactSaver` has saved the artifacts. If another task is already downloading one of
+    the artifacts of a content unit, this stage waits for it to be saved and uses the saved
+    :class:`~pulpcore.plugin.models.Artifact` instead of downloading it again. The artifact is
+    downloaded anyway once the other task did not save it in time.
+
     Each :class:`~pulpcore.plugin.stages.DeclarativeContent` is sent to `self._out_q` after all of
     its :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects have been handled.
     """
@@ -230,17 +442,88 @@ class ArtifactDownloader(GenericDownloader):
         Returns:
             The number of downloads
         """
-        downloaders_for_content = [
-            d_artifact.download()
+        d_artifacts_to_download = [
+            d_artifact
             for d_artifact in d_content.d_artifacts
-            if d_artifact.artifact._state.adding
+            if not d_artifact.artifact_is_saved
             and not d_artifact.deferred_download
-            and not d_artifact.artifact.file
+            and not d_artifact.get_artifact_attribute("file")
         ]
-        if downloaders_for_content:
-            await asyncio.gather(*downloaders_for_content)
+        if d_artifacts_to_download and settings.DOWNLOAD_DEDUPLICATION:
+            await self._claim_downloads(d_artifacts_to_download)
+            d_artifacts_to_download = [
+                d_artifact
+                for d_artifact in d_artifacts_to_download
+                if not d_artifact.artifact_is_saved
+            ]
+        await asyncio.gather(*map(self._download, d_artifacts_to_download))
         await self.put(d_content)
-        return len(downloaders_for_content)
+        return len(d_artifacts_to_download)
+
+    async def _download(self, d_artifact):
+        # Report the concurrency limits of the remotes downloaded from
+        self._download_factories.add(d_artifact.remote.download_factory)
+        async with self.download_slot(d_artifact.get_artifact_attribute("size")):
+            await d_artifact.download()
+
+    @classmethod
+    async def _claim_downloads(cls, d_artifacts):
+        """
+        Claim the downloads of the artifacts of a content unit which have a known sha256.
+
+        The claims of a content unit are taken all at once or not at all, so a claim is never held
+        while waiting for another one, which could wait forever for a task waiting for it in turn.
+        If another task is downloading one of the artifacts, the artifacts it saved in the meantime
+        are used instead, and the others are claimed again. After ``_DOWNLOAD_CLAIM_TIMEOUT``
+        seconds, the artifacts are downloaded without claims.
+
+        Args:
+            d_artifacts (list): The :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects
+                to download.
+        """
+        d_artifacts = [
+            d_artifact for d_artifact in d_artifacts if d_artifact.get_artifact_attribute("sha256")
+        ]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _DOWNLOAD_CLAIM_TIMEOUT
+        interval, max_interval = _DOWNLOAD_CLAIM_POLL_INTERVAL
+        while d_artifacts:
+            sha256s = sorted(
+                {d_artifact.get_artifact_attribute("sha256") for d_artifact in d_artifacts}
+            )
+            if await cls._try_claim(sha256s):
+                for d_artifact in d_artifacts:
+                    d_artifact.download_claimed = True
+                return
+            if loop.time() >= deadline:
+                log.warning(
+                    _("Downloading {} without waiting for the other tasks downloading it.").format(
+                        ", ".join(d_artifact.urls[0] for d_artifact in d_artifacts)
+                    )
+                )
+                return
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, max_interval)
+            saved_artifacts = await cls._saved_artifacts(sha256s)
+            for d_artifact in d_artifacts:
+                artifact = saved_artifacts.get(d_artifact.get_artifact_attribute("sha256"))
+                if artifact is not None:
+                    d_artifact.artifact = artifact
+            d_artifacts = [
+                d_artifact for d_artifact in d_artifacts if not d_artifact.artifact_is_saved
+            ]
+
+    @staticmethod
+    async def _try_claim(sha256s):
+        return await sync_to_db(_try_claim_downloads, key=_DOWNLOAD_CLAIMS_KEY)(sha256s)
+
+    @staticmethod
+    async def _release_claims(sha256s):
+        await sync_to_db(_release_download_claims, key=_DOWNLOAD_CLAIMS_KEY)(sha256s)
+
+    @staticmethod
+    async def _saved_artifacts(sha256s):
+        return await sync_to_db(_saved_artifacts)(sha256s, get_domain())
 
 
 class ArtifactSaver(Stage):
@@ -257,7 +540,13 @@ class ArtifactSaver(Stage):
     :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects have been handled.
 
     This stage drains all available items from `self._in_q` and batches everything into one large
-    call to the db for efficiency.
+    call to the db for efficiency. With ``DOWNLOAD_DURABILITY = "batch"``, the files downloaded by
+    :meth:`~pulpcore.plugin.stages.DeclarativeArtifact.download` are not fsynced, and the files of
+    the batch are flushed to disk together before they are saved. If the domain stores its files in
+    S3, Azure or Google Cloud Storage, the files of the batch are uploaded in parallel, up to
+    ``ARTIFACT_UPLOAD_CONCURRENCY`` at a time, and the artifacts are only inserted once all of them
+    are uploaded. The download claims of the :class:`ArtifactDownloader` are released once the
+    artifacts are saved.
     """
 
     async def run(self):
@@ -267,32 +556,83 @@ class ArtifactSaver(Stage):
         Returns:
             The coroutine for this stage.
         """
+        domain = get_domain()
+        object_storage = None
+        if domain.storage_class in _OBJECT_STORAGE_CLASSES:
+            object_storage = domain.get_storage()
         async for batch in self.batches():
             da_to_save = []
             for d_content in batch:
                 for d_artifact in d_content.d_artifacts:
-                    if d_artifact.artifact._state.adding and not d_artifact.deferred_download:
+                    if not d_artifact.artifact_is_saved and not d_artifact.deferred_download:
                         d_artifact.artifact.file = str(d_artifact.artifact.file)
                         da_to_save.append(d_artifact)
             da_to_save_ordered = sorted(da_to_save, key=lambda x: x.artifact.sha256)
             da_tmp_files = [str(da.artifact.file) for da in da_to_save_ordered]
 
             if da_to_save:
+                if object_storage is not None:
+                    await self._upload_files(
+                        object_storage, [d_artifact.artifact for d_artifact in da_to_save_ordered]
+                    )
+                elif settings.DOWNLOAD_DURABILITY == "batch":
+                    await sync_to_async(sync_filesystems, thread_sensitive=False)(da_tmp_files)
                 for d_artifact, artifact, tmp_file_path in zip(
                     da_to_save_ordered,
-                    await sync_to_async(Artifact.objects.bulk_get_or_create)(
+                    await sync_to_db(Artifact.objects.bulk_get_or_create)(
                         d_artifact.artifact for d_artifact in da_to_save_ordered
                     ),
                     da_tmp_files,
                 ):
                     d_artifact.artifact = artifact
-                    # Delete the downloaded tmp file if it still exists to clear up space
-                    if await aos.path.exists(tmp_file_path):
+                    # Delete the downloaded tmp file if it still exists to clear up space, but not
+                    # the source files of file:// remotes, which are ingested in place
+                    if is_staged_path(tmp_file_path, domain) and await aos.path.exists(
+                        tmp_file_path
+                    ):
                         await aos.remove(tmp_file_path)
 
+                # The claims are taken once per distinct sha256 of each content unit
+                claimed_sha256s = []
+                for d_content in batch:
+                    claimed = [d_a for d_a in d_content.d_artifacts if d_a.download_claimed]
+                    claimed_sha256s.extend({d_artifact.artifact.sha256 for d_artifact in claimed})
+                    for d_artifact in claimed:
+                        d_artifact.download_claimed = False
+                if claimed_sha256s:
+                    await ArtifactDownloader._release_claims(claimed_sha256s)
+
             for d_content in batch:
                 await self.put(d_content)
 
+    @staticmethod
+    async def _upload_files(storage, artifacts):
+        """
+        Upload the files of unsaved artifacts to object storage in parallel.
+
+        The artifacts then reference their uploaded files, so saving them only inserts their rows.
+
+        Args:
+            storage (django.core.files.storage.Storage): The object storage of the domain.
+            artifacts (list): The unsaved :class:`~pulpcore.plugin.models.Artifact` objects.
+        """
+        loop = asyncio.get_running_loop()
+        executor = _get_upload_executor()
+        names = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    _upload_artifact_file,
+                    storage,
+                    artifact.file.name,
+                    artifact.storage_path(""),
+                )
+                for artifact in artifacts
+            )
+        )
+        for artifact, name in zip(artifacts, names):
+            artifact.file = name
+
 
 class RemoteArtifactSaver(Stage):
     """
@@ -340,7 +680,7 @@ class RemoteArtifactSaver(Stage):
                 if d_artifact.remote:
                     remotes_present.add(d_artifact.remote)
 
-        await sync_to_async(prefetch_related_objects)(
+        await sync_to_db(prefetch_related_objects)(
             [d_c.content for d_c in batch],
             Prefetch(
                 "contentartifact_set",
@@ -355,38 +695,42 @@ class RemoteArtifactSaver(Stage):
             ),
         )
 
+        # Index the prefetched data, so that matching is done with dictionary lookups.
+        remote_artifacts = {}  # { (<content_artifact.pk>, <remote.pk>): RemoteArtifact, ... }
+        for d_content in batch:
+            for content_artifact in d_content.content._remote_artifact_saver_cas:
+                for remote_artifact in content_artifact._remote_artifact_saver_ras:
+                    key = (content_artifact.pk, remote_artifact.remote_id)
+                    remote_artifacts[key] = remote_artifact
+
         # Now return the list of RemoteArtifacts that need to be saved.
         #
         # We can end up with duplicates (diff pks, same sha256) in the sequence below,
-        # so we store by-sha256 and then return the final values
-        ras_to_create = {}  # { str(<sha256>): RemoteArtifact, ... }
+        # so we store by-(content_artifact, remote) and then return the final values
+        ras_to_create = {}  # { (<content_artifact.pk>, <remote.pk>): RemoteArtifact, ... }
         ras_to_update = {}
         for d_content in batch:
+            content_artifacts = {
+                content_artifact.relative_path: content_artifact
+                for content_artifact in d_content.content._remote_artifact_saver_cas
+            }
             for d_artifact in d_content.d_artifacts:
                 if not d_artifact.remote:
                     continue
 
-                async for content_artifact in sync_to_async_iterable(
-                    d_content.content._remote_artifact_saver_cas
-                ):
-                    if d_artifact.relative_path == content_artifact.relative_path:
-                        break
-                else:
+                content_artifact = content_artifacts.get(d_artifact.relative_path)
+                if content_artifact is None:
                     if self.fix_mismatched_remote_artifacts:
                         # We couldn't match an DeclarativeArtifact to a ContentArtifact by rel_path.
                         # If there are any paths available (i.e., other ContentArtifacts for this
                         # Artifact), complain to the logs, pick the rel_path from the last
-                        # ContentArtifact we examined, and continue.
+                        # ContentArtifact available, and continue.
                         #
                         # If we can't find anything to choose from (can that even happen?), fail
                         # the process.
-                        avail_paths = ",".join(
-                            [
-                                ca.relative_path
-                                for ca in d_content.content._remote_artifact_saver_cas
-                            ]
-                        )
-                        if avail_paths:
+                        if content_artifacts:
+                            avail_paths = ",".join(content_artifacts)
+                            content_artifact = d_content.content._remote_artifact_saver_cas[-1]
                             msg = (
                                 "No declared artifact with relative path '{rp}' for content '{c}'"
                                 " from remote '{rname}'. Using last from available-paths : '{ap}'"
@@ -418,31 +762,23 @@ class RemoteArtifactSaver(Stage):
                             msg.format(rp=d_artifact.relative_path, c=d_content.content)
                         )
 
-                async for remote_artifact in sync_to_async_iterable(
-                    content_artifact._remote_artifact_saver_ras
-                ):
-                    if d_artifact.url == remote_artifact.url:
-                        break
-
-                    if d_artifact.remote.pk == remote_artifact.remote_id:
-                        key = f"{content_artifact.pk}-{remote_artifact.remote_id}"
-                        remote_artifact.url = d_artifact.url
-                        ras_to_update[key] = remote_artifact
-                        break
-                else:
-                    remote_artifact = self._create_remote_artifact(d_artifact, content_artifact)
-                    key = f"{content_artifact.pk}-{d_artifact.remote.pk}"
-                    ras_to_create[key] = remote_artifact
+                key = (content_artifact.pk, d_artifact.remote.pk)
+                remote_artifact = remote_artifacts.get(key)
+                if remote_artifact is None:
+                    ras_to_create[key] = self._create_remote_artifact(d_artifact, content_artifact)
+                elif remote_artifact.url != d_artifact.url:
+                    remote_artifact.url = d_artifact.url
+                    ras_to_update[key] = remote_artifact
 
         # Make sure we create/update RemoteArtifacts in a stable order, to help
         # prevent deadlocks in high-concurrency environments. We can rely on the
         # Artifact sha256 for our ordering.
         if ras_to_create:
             ras_to_create_ordered = sorted(list(ras_to_create.values()), key=lambda x: x.sha256)
-            await sync_to_async(RemoteArtifact.objects.bulk_create)(ras_to_create_ordered)
+            await sync_to_db(RemoteArtifact.objects.bulk_create)(ras_to_create_ordered)
         if ras_to_update:
             ras_to_update_ordered = sorted(list(ras_to_update.values()), key=lambda x: x.sha256)
-            await sync_to_async(RemoteArtifact.objects.bulk_update)(
+            await sync_to_db(RemoteArtifact.objects.bulk_update)(
                 ras_to_update_ordered, fields=["url"]
             )
 
@@ -450,13 +786,13 @@ class RemoteArtifactSaver(Stage):
     def _create_remote_artifact(d_artifact, content_artifact):
         ra = RemoteArtifact(
             url=d_artifact.url,
-            size=d_artifact.artifact.size,
-            md5=d_artifact.artifact.md5,
-            sha1=d_artifact.artifact.sha1,
-            sha224=d_artifact.artifact.sha224,
-            sha256=d_artifact.artifact.sha256,
-            sha384=d_artifact.artifact.sha384,
-            sha512=d_artifact.artifact.sha512,
+            size=d_artifact.get_artifact_attribute("size"),
+            md5=d_artifact.get_artifact_attribute("md5"),
+            sha1=d_artifact.get_artifact_attribute("sha1"),
+            sha224=d_artifact.get_artifact_attribute("sha224"),
+            sha256=d_artifact.get_artifact_attribute("sha256"),
+            sha384=d_artifact.get_artifact_attribute("sha384"),
+            sha512=d_artifact.get_artifact_attribute("sha512"),
             content_artifact=content_artifact,
             remote=d_artifact.remote,
         )
@@ -479,10 +815,10 @@ class ACSArtifactHandler(Stage):
                 batch_checksums = defaultdict(list)
                 for d_content in batch:
                     for d_artifact in d_content.d_artifacts:
-                        for cks_type in d_artifact.artifact.COMMON_DIGEST_FIELDS:
-                            if getattr(d_artifact.artifact, cks_type):
+                        for cks_type in Artifact.COMMON_DIGEST_FIELDS:
+                            if d_artifact.get_artifact_attribute(cks_type):
                                 batch_checksums[cks_type].append(
-                                    getattr(d_artifact.artifact, cks_type)
+                                    d_artifact.get_artifact_attribute(cks_type)
                                 )
 
                 batch_query = Q()
@@ -511,8 +847,8 @@ class ACSArtifactHandler(Stage):
                 for d_content in batch:
                     for d_artifact in d_content.d_artifacts:
                         for checksum_type in Artifact.COMMON_DIGEST_FIELDS:
-                            if getattr(d_artifact.artifact, checksum_type):
-                                checksum = getattr(d_artifact.artifact, checksum_type)
+                            if d_artifact.get_artifact_attribute(checksum_type):
+                                checksum = d_artifact.get_artifact_attribute(checksum_type)
                                 if checksum in existing_ras_dict:
                                     d_artifact.urls = [
                                         existing_ras_dict[checksum]["url"]
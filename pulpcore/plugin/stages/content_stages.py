@@ -1,15 +1,14 @@
 from collections import defaultdict
+from uuid import uuid4
 
-from asgiref.sync import sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
 from django.db.models import Q
+from django.db.models.expressions import RawSQL
 
-from pulpcore.plugin.sync import sync_to_async_iterable
+from pulpcore.plugin.models import Content, ContentArtifact, ContentManager, ProgressReport
 
-from pulpcore.plugin.models import Content, ContentArtifact, ProgressReport
-
-from .api import Stage
+from .api import Stage, sync_to_db
 
 
 class QueryExistingContents(Stage):
@@ -52,18 +51,67 @@ class QueryExistingContents(Stage):
 
             for model_type, content_q in content_q_by_type.items():
                 try:
-                    await sync_to_async(model_type.objects.filter(content_q).touch)()
+                    await sync_to_db(model_type.objects.filter(content_q).touch)()
                 except AttributeError:
                     raise TypeError(
                         "Plugins which declare custom ORM managers on their content classes "
                         "should have those managers inherit from "
                         "pulpcore.plugin.models.ContentManager."
                     )
-                async for result in sync_to_async_iterable(
-                    model_type.objects.filter(content_q).iterator()
+                for result in await sync_to_db(list)(model_type.objects.filter(content_q)):
+                    for d_content in d_content_by_nat_key[result.natural_key()]:
+                        d_content.content = result
+
+            for d_content in batch:
+                await self.put(d_content)
+
+
+class QueryAssociatedContents(Stage):
+    """
+    A Stages API stage that short-circuits content units already added to `new_version`.
+
+    This stage is used to resume an interrupted sync into the same incomplete `new_version`, whose
+    associated content serves as the checkpoint of the interrupted run. Each unsaved
+    :attr:`DeclarativeContent.content` matching a unit added to `new_version` by the interrupted run
+    is replaced by the saved unit, and its :class:`~pulpcore.plugin.stages.DeclarativeArtifact`
+    objects are dropped, since they were fully handled already. The later stages pass such units
+    along without querying, downloading or saving anything for them.
+
+    Args:
+        new_version (:class:`~pulpcore.plugin.models.RepositoryVersion`): The resumed repo version.
+        args: unused positional arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
+        kwargs: unused keyword arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
+    """
+
+    def __init__(self, new_version, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.new_version = new_version
+
+    async def run(self):
+        """
+        The coroutine for this stage.
+
+        Returns:
+            The coroutine for this stage.
+        """
+        added_pks = self.new_version.added().values("pk")
+        async for batch in self.batches():
+            content_q_by_type = defaultdict(lambda: Q(pk__in=[]))
+            d_content_by_nat_key = defaultdict(list)
+            for d_content in batch:
+                if d_content.content._state.adding:
+                    model_type = type(d_content.content)
+                    unit_q = d_content.content.q()
+                    content_q_by_type[model_type] = content_q_by_type[model_type] | unit_q
+                    d_content_by_nat_key[d_content.content.natural_key()].append(d_content)
+
+            for model_type, content_q in content_q_by_type.items():
+                for result in await sync_to_db(list)(
+                    model_type.objects.filter(content_q, pk__in=added_pks)
                 ):
                     for d_content in d_content_by_nat_key[result.natural_key()]:
                         d_content.content = result
+                        d_content.d_artifacts = []
 
             for d_content in batch:
                 await self.put(d_content)
@@ -108,8 +156,32 @@ class ContentSaver(Stage):
                     # This prevents deadlocks when we're processing the same/similar content
                     # in concurrent workers.
                     batch.sort(key=lambda x: "".join(map(str, x.content.natural_key())))
+
+                    # Save the new content units of the same type in one query where possible,
+                    # keeping the sort order from above.
+                    d_content_to_bulk_save = defaultdict(list)
+                    for d_content in batch:
+                        model_type = type(d_content.content)
+                        if d_content.content._state.adding and self._supports_bulk_save(model_type):
+                            d_content_to_bulk_save[model_type].append(d_content)
+                    created = set()
+                    for model_type, d_contents in d_content_to_bulk_save.items():
+                        for d_content, content in zip(
+                            d_contents,
+                            model_type.objects.bulk_get_or_create(
+                                d_content.content for d_content in d_contents
+                            ),
+                        ):
+                            if content is d_content.content:
+                                created.add(id(d_content))
+                            else:
+                                d_content.content = content
+
                     for d_content in batch:
                         # Are we saving to the database for the first time?
+                        if id(d_content) in created:
+                            content_artifact_bulk.extend(self._new_content_artifacts(d_content))
+                            continue
                         content_already_saved = not d_content.content._state.adding
                         if not content_already_saved:
                             try:
@@ -123,23 +195,12 @@ class ContentSaver(Stage):
                                 except ObjectDoesNotExist:
                                     raise e
                             else:
-                                for d_artifact in d_content.d_artifacts:
-                                    if not d_artifact.artifact._state.adding:
-                                        artifact = d_artifact.artifact
-                                    else:
-                                        # set to None for on-demand synced artifacts
-                                        artifact = None
-                                    content_artifact = ContentArtifact(
-                                        content=d_content.content,
-                                        artifact=artifact,
-                                        relative_path=d_artifact.relative_path,
-                                    )
-                                    content_artifact_bulk.append(content_artifact)
+                                content_artifact_bulk.extend(self._new_content_artifacts(d_content))
                                 continue
                         # When the Content already exists, check if ContentArtifacts need to be
                         # updated
                         for d_artifact in d_content.d_artifacts:
-                            if not d_artifact.artifact._state.adding:
+                            if d_artifact.artifact_is_saved:
                                 # the artifact is already present in the database; update references
                                 # Creating one large query and one large dictionary
                                 to_update_ca_query |= ContentArtifact.objects.filter(
@@ -195,10 +256,56 @@ class ContentSaver(Stage):
 
                     self._post_save(batch)
 
-            await sync_to_async(process_batch)()
+            await sync_to_db(process_batch)()
             for declarative_content in batch:
                 await self.put(declarative_content)
 
+    @staticmethod
+    def _supports_bulk_save(model_type):
+        """
+        Whether new units of `model_type` can be saved with `bulk_get_or_create()`.
+
+        Units of content types customizing `save()` or using lifecycle hooks are saved one by one.
+
+        Args:
+            model_type (type): A subclass of :class:`~pulpcore.plugin.models.Content`.
+
+        Returns:
+            bool: True if the units can be saved in bulk.
+        """
+        return (
+            isinstance(model_type.objects, ContentManager)
+            and model_type.save is Content.save
+            and not model_type._potentially_hooked_methods()
+        )
+
+    @staticmethod
+    def _new_content_artifacts(d_content):
+        """
+        Build the unsaved ContentArtifacts of a content unit saved for the first time.
+
+        Args:
+            d_content (:class:`~pulpcore.plugin.stages.DeclarativeContent`): The saved unit.
+
+        Returns:
+            list: Of unsaved :class:`~pulpcore.plugin.models.ContentArtifact`.
+        """
+        content_artifacts = []
+        for d_artifact in d_content.d_artifacts:
+            if d_artifact.artifact_is_saved:
+                artifact = d_artifact.artifact
+            else:
+                # set to None for on-demand synced artifacts
+                artifact = None
+            content_artifacts.append(
+                ContentArtifact(
+                    content=d_content.content,
+                    artifact=artifact,
+                    relative_path=d_artifact.relative_path,
+                )
+            )
+        return content_artifacts
+
     def _pre_save(self, batch):
         """
         A hook plugin-writers can override to save related objects prior to content unit saving.
@@ -273,16 +380,19 @@ class ContentAssociation(Stage):
     """
     A Stages API stage that associates content units with `new_version`.
 
-    This stage stores all content unit primary keys in memory before running. This is done to
-    compute the units already associated but not received from `self._in_q`. These units are passed
-    via `self._out_q` to the next stage as a :class:`django.db.models.query.QuerySet`.
+    Each batch of content units received from `self._in_q` is checked against the content of
+    `new_version`, and the units not yet associated are added to it. These units are passed via
+    `self._out_q` to the next stage.
 
     This stage creates a ProgressReport named 'Associating Content' that counts the number of units
     associated. Since it's a stream the total count isn't known until it's finished.
 
     If `mirror` was enabled, then content units may also be un-assocated (removed) from
     `new_version`. A ProgressReport named 'Un-Associating Content' is created that counts the number
-    of units un-associated.
+    of units un-associated. To compute the units already associated but not received from
+    `self._in_q`, the primary keys of all received units are staged in a temporary table using
+    ``COPY``, and the units to remove are selected in the database once the stream is finished.
+    This keeps the memory usage of this stage independent of the size of the repository.
 
     Args:
         new_version (:class:`~pulpcore.plugin.models.RepositoryVersion`): The repo version this
@@ -297,6 +407,7 @@ class ContentAssociation(Stage):
         super().__init__(*args, **kwargs)
         self.new_version = new_version
         self.allow_delete = mirror
+        self._staging_table = "pulp_content_association_{}".format(uuid4().hex)
 
     async def run(self):
         """
@@ -305,35 +416,88 @@ class ContentAssociation(Stage):
         Returns:
             The coroutine for this stage.
         """
-        async with ProgressReport(message="Associating Content", code="associating.content") as pb:
-            to_delete = {
-                i
-                async for i in sync_to_async_iterable(
-                    self.new_version.content.values_list("pk", flat=True)
-                )
-            }
-
-            async for batch in self.batches():
-                to_add = set()
-                for d_content in batch:
-                    try:
-                        to_delete.remove(d_content.content.pk)
-                    except KeyError:
-                        to_add.add(d_content.content.pk)
-                        await self.put(d_content)
-
-                if to_add:
-                    await sync_to_async(self.new_version.add_content)(
-                        Content.objects.filter(pk__in=to_add)
-                    )
-                    await pb.aincrease_by(len(to_add))
+        if self.allow_delete:
+            await sync_to_db(self._create_staging_table, key=self)()
+        try:
+            async with ProgressReport(
+                message="Associating Content", code="associating.content"
+            ) as pb:
+                async for batch in self.batches():
+                    to_add = await sync_to_db(self._handle_batch, key=self)(batch)
+                    for d_content in batch:
+                        if d_content.content.pk in to_add:
+                            await self.put(d_content)
+
+                    if to_add:
+                        await sync_to_db(self.new_version.add_content, key=self)(
+                            Content.objects.filter(pk__in=to_add)
+                        )
+                        await pb.aincrease_by(len(to_add))
 
             if self.allow_delete:
                 async with ProgressReport(
                     message="Un-Associating Content", code="unassociating.content"
                 ) as pb:
-                    if to_delete:
-                        await sync_to_async(self.new_version.remove_content)(
-                            Content.objects.filter(pk__in=to_delete)
+                    await sync_to_db(self._analyze_staging_table, key=self)()
+                    version_content_sql, params = (
+                        self.new_version._content_relationships()
+                        .values("content_id")
+                        .query.sql_with_params()
+                    )
+                    to_delete = Content.objects.filter(
+                        pk__in=RawSQL(
+                            "SELECT version_content.content_id FROM ({version_content})"
+                            " AS version_content WHERE NOT EXISTS (SELECT 1 FROM {table} AS staged"
+                            " WHERE staged.content_id = version_content.content_id)".format(
+                                version_content=version_content_sql, table=self._staging_table
+                            ),
+                            params,
                         )
-                        await pb.aincrease_by(len(to_delete))
+                    )
+                    to_delete_count = await sync_to_db(to_delete.count, key=self)()
+                    if to_delete_count:
+                        await sync_to_db(self.new_version.remove_content, key=self)(to_delete)
+                        await pb.aincrease_by(to_delete_count)
+        finally:
+            if self.allow_delete:
+                await sync_to_db(self._drop_staging_table, key=self)()
+
+    def _handle_batch(self, batch):
+        """
+        Find the units of a batch not yet associated with `new_version`.
+
+        When mirroring, the primary keys of the batch are also staged for the final removal.
+
+        Args:
+            batch (list of :class:`~pulpcore.plugin.stages.DeclarativeContent`): The batch.
+
+        Returns:
+            set: The primary keys of the units to add to `new_version`.
+        """
+        batch_pks = {d_content.content.pk for d_content in batch}
+        if self.allow_delete:
+            with connection.cursor() as cursor:
+                with cursor.copy(
+                    "COPY {table} (content_id) FROM STDIN".format(table=self._staging_table)
+                ) as copy:
+                    for pk in batch_pks:
+                        copy.write_row((pk,))
+        present_pks = self.new_version.content.filter(pk__in=batch_pks).values_list("pk", flat=True)
+        return batch_pks.difference(present_pks)
+
+    def _create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE {table} (content_id uuid NOT NULL)".format(
+                    table=self._staging_table
+                )
+            )
+
+    def _analyze_staging_table(self):
+        # Temporary tables are not analyzed automatically.
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE {table}".format(table=self._staging_table))
+
+    def _drop_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS {table}".format(table=self._staging_table))
@@ -1,5 +1,6 @@
 import asyncio
 import tempfile
+from contextlib import nullcontext
 
 from .api import create_pipeline, EndStage
 from .artifact_stages import (
@@ -12,13 +13,15 @@ from .artifact_stages import (
 from .content_stages import (
     ContentAssociation,
     ContentSaver,
+    QueryAssociatedContents,
     QueryExistingContents,
     ResolveContentFutures,
 )
+from .shard_stages import ShardedStages
 
 
 class DeclarativeVersion:
-    def __init__(self, first_stage, repository, mirror=False, acs=False):
+    def __init__(self, first_stage, repository, mirror=False, acs=False, resumable=False, shards=1):
         """
         A pipeline that creates a new :class:`~pulpcore.plugin.models.RepositoryVersion` from a
         stream of :class:`~pulpcore.plugin.stages.DeclarativeContent` objects.
@@ -104,12 +107,25 @@ class DeclarativeVersion:
                 'False' is the default.
             acs (bool): When set to 'True' a new stage is added to look for
                 Alternate Content Sources.
+            resumable (bool): When set to 'True' the incomplete
+                :class:`~pulpcore.plugin.models.RepositoryVersion` is kept if the sync fails, and
+                an incomplete version kept by a failed sync is resumed. Content units already
+                associated with it are then passed along by
+                :class:`~pulpcore.plugin.stages.QueryAssociatedContents` without being processed
+                again. 'False' is the default.
+            shards (int): When set to more than 1, the stages following the `first_stage` are run
+                in this number of subprocesses by :class:`~pulpcore.plugin.stages.ShardedStages`,
+                to use more than one CPU core. The
+                :class:`~pulpcore.plugin.stages.DeclarativeContent` objects of the `first_stage`
+                must be picklable. 1 is the default.
 
         """
         self.first_stage = first_stage
         self.repository = repository
         self.mirror = mirror
         self.acs = acs
+        self.resumable = resumable
+        self.shards = shards
 
     def pipeline_stages(self, new_version):
         """
@@ -127,10 +143,10 @@ class DeclarativeVersion:
             list: List of :class:`~pulpcore.plugin.stages.Stage` instances
 
         """
-        pipeline = [
-            self.first_stage,
-            QueryExistingArtifacts(),
-        ]
+        pipeline = [self.first_stage]
+        if self.resumable and new_version.added().exists():
+            pipeline.append(QueryAssociatedContents(new_version))
+        pipeline.append(QueryExistingArtifacts())
         if self.acs:
             pipeline.append(ACSArtifactHandler())
         pipeline.extend(
@@ -152,12 +168,17 @@ class DeclarativeVersion:
         Returns: The created RepositoryVersion or None if it represents no change from the latest.
         """
         with tempfile.TemporaryDirectory(dir="."):
-            with self.repository.new_version() as new_version:
+            with self.repository.new_version(resume=self.resumable) as new_version:
                 loop = asyncio.get_event_loop()
                 stages = self.pipeline_stages(new_version)
-                stages.append(ContentAssociation(new_version, self.mirror))
-                stages.append(EndStage())
-                pipeline = create_pipeline(stages)
-                loop.run_until_complete(pipeline)
+                sharded_stages = nullcontext()
+                if self.shards > 1:
+                    sharded_stages = ShardedStages(stages[1:], self.shards)
+                    stages = [stages[0], sharded_stages]
+                with sharded_stages:
+                    stages.append(ContentAssociation(new_version, self.mirror))
+                    stages.append(EndStage())
+                    pipeline = create_pipeline(stages)
+                    loop.run_until_complete(pipeline)
 
         return new_version if new_version.complete else None
@@ -2,6 +2,8 @@ from gettext import gettext as _
 
 import asyncio
 
+from django.conf import settings
+
 from pulpcore.constants import ALL_KNOWN_CONTENT_CHECKSUMS
 from pulpcore.plugin.models import Artifact
 
@@ -17,6 +19,13 @@ class DeclarativeArtifact:
     may be incomplete because not all digest information can be computed until the
     :class:`~pulpcore.plugin.models.Artifact` is downloaded.
 
+    Instead of an `artifact`, the size and known digests can be passed as `artifact_attributes`.
+    The unsaved :class:`~pulpcore.plugin.models.Artifact` is then only built when the `artifact`
+    attribute is accessed. The stages of the pipeline avoid doing so until a real
+    :class:`~pulpcore.plugin.models.Artifact` is needed, which keeps in-flight
+    :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects small. This is particularly
+    useful when the artifacts are never downloaded, e.g. for `deferred_download`.
+
     Attributes:
         artifact (:class:`~pulpcore.plugin.models.Artifact`): An
             :class:`~pulpcore.plugin.models.Artifact` either saved or unsaved. If unsaved, it
@@ -31,21 +40,30 @@ class DeclarativeArtifact:
         extra_data (dict): A dictionary available for additional data to be stored in.
         deferred_download (bool): Whether this artifact should be downloaded and saved
             in the artifact stages. Defaults to `False`. See :ref:`on-demand-support`.
+        artifact_attributes (dict): The size and digests of the unsaved
+            :class:`~pulpcore.plugin.models.Artifact`, to be used instead of `artifact`.
+        download_claimed (bool): Whether this task holds the cluster-wide claim on the download
+            of the :class:`~pulpcore.plugin.models.Artifact`, until it is saved.
 
     Raises:
-        ValueError: If `artifact`, `url`, or `relative_path` are not specified. If `remote` is not
-        specified and `artifact` doesn't have a file.
+        ValueError: If `url` or `relative_path` are not specified. If neither or both of `artifact`
+        and `artifact_attributes` are specified. If `remote` is not specified and `artifact`
+        doesn't have a file.
     """
 
     __slots__ = (
-        "artifact",
+        "_artifact",
+        "_artifact_attributes",
         "urls",
         "relative_path",
         "remote",
         "extra_data",
         "deferred_download",
+        "download_claimed",
     )
 
+    ARTIFACT_ATTRIBUTES = frozenset(("size", *ALL_KNOWN_CONTENT_CHECKSUMS))
+
     def __init__(
         self,
         artifact=None,
@@ -55,6 +73,7 @@ class DeclarativeArtifact:
         remote=None,
         extra_data=None,
         deferred_download=False,
+        artifact_attributes=None,
     ):
         if not (url or urls):
             raise ValueError(_("DeclarativeArtifact must have a at least one 'url' provided"))
@@ -62,21 +81,66 @@ class DeclarativeArtifact:
             raise ValueError(_("DeclarativeArtifact must not provide both 'url' and 'urls'"))
         if not relative_path:
             raise ValueError(_("DeclarativeArtifact must have a 'relative_path'"))
-        if not artifact:
+        if artifact is None and artifact_attributes is None:
             raise ValueError(_("DeclarativeArtifact must have a 'artifact'"))
-        if not remote and not artifact.file:
+        if artifact is not None and artifact_attributes is not None:
+            raise ValueError(
+                _("DeclarativeArtifact must not provide both 'artifact' and 'artifact_attributes'")
+            )
+        if artifact_attributes is not None:
+            unknown = set(artifact_attributes).difference(self.ARTIFACT_ATTRIBUTES)
+            if unknown:
+                raise ValueError(
+                    _("DeclarativeArtifact got unknown 'artifact_attributes': {}").format(
+                        ", ".join(sorted(unknown))
+                    )
+                )
+        if not remote and (artifact is None or not artifact.file):
             raise ValueError(
                 _(
                     "DeclarativeArtifact must have a 'remote' if the Artifact doesn't "
                     "have a file backing it."
                 )
             )
-        self.artifact = artifact
+        self._artifact = artifact
+        self._artifact_attributes = artifact_attributes
         self.urls = [url] if url else urls
         self.relative_path = relative_path
         self.remote = remote
         self.extra_data = extra_data or {}
         self.deferred_download = deferred_download
+        self.download_claimed = False
+
+    @property
+    def artifact(self):
+        if self._artifact is None:
+            self._artifact = Artifact(**self._artifact_attributes)
+            self._artifact_attributes = None
+        return self._artifact
+
+    @artifact.setter
+    def artifact(self, artifact):
+        self._artifact = artifact
+        self._artifact_attributes = None
+
+    @property
+    def artifact_is_saved(self):
+        """Whether the artifact is saved to the database, without building it."""
+        return self._artifact is not None and not self._artifact._state.adding
+
+    def get_artifact_attribute(self, name):
+        """
+        Get an attribute of the artifact, without building it.
+
+        Args:
+            name (str): The name of the attribute, e.g. "sha256", "size" or "file".
+
+        Returns:
+            The value of the attribute, or None if it is not known.
+        """
+        if self._artifact is None:
+            return self._artifact_attributes.get(name)
+        return getattr(self._artifact, name)
 
     @property
     def url(self):
@@ -92,13 +156,13 @@ class DeclarativeArtifact:
         expected_digests = {}
         validation_kwargs = {}
         for digest_name in ALL_KNOWN_CONTENT_CHECKSUMS:
-            digest_value = getattr(self.artifact, digest_name)
+            digest_value = self.get_artifact_attribute(digest_name)
             if digest_value:
                 expected_digests[digest_name] = digest_value
         if expected_digests:
             validation_kwargs["expected_digests"] = expected_digests
-        if self.artifact.size:
-            expected_size = self.artifact.size
+        expected_size = self.get_artifact_attribute("size")
+        if expected_size:
             validation_kwargs["expected_size"] = expected_size
 
         urls = iter(self.urls)
@@ -106,6 +170,8 @@ class DeclarativeArtifact:
 
         while True:
             downloader = self.remote.get_downloader(url=url, **validation_kwargs)
+            # The ArtifactSaver flushes the files of a whole batch at once
+            downloader.defer_fsync = settings.DOWNLOAD_DURABILITY == "batch"
             try:
                 # Custom downloaders may need extra information to complete the request.
                 download_result = await downloader.run(extra_data=self.extra_data)
@@ -0,0 +1,363 @@
+import asyncio
+import copy
+import pickle
+import socket
+import struct
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from gettext import gettext as _
+from itertools import count
+from multiprocessing import Process
+
+from asgiref.sync import SyncToAsync
+from django.db import connection
+
+from pulpcore.constants import TASK_STATES
+from pulpcore.download import telemetry
+from pulpcore.plugin.models import ProgressReport
+
+from .api import create_pipeline, EndStage, Stage
+
+_HEADER = struct.Struct("!I")
+# The state of a summed up progress report is the first of these states of the shards
+_STATE_PRECEDENCE = (
+    TASK_STATES.RUNNING,
+    TASK_STATES.WAITING,
+    TASK_STATES.FAILED,
+    TASK_STATES.CANCELED,
+    TASK_STATES.COMPLETED,
+)
+
+
+async def _read_message(reader):
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+def _write_message(writer, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(data)))
+    writer.write(data)
+
+
+class _ShardThaw:
+    """
+    Stands in for the thaw event of a :class:`~pulpcore.plugin.stages.DeclarativeContent` handed
+    over to a shard, and forwards the request to stop batching it to that shard.
+    """
+
+    __slots__ = ("_callback",)
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def set(self):
+        self._callback()
+
+
+class _ProgressForwarder:
+    """
+    Forwards the progress reports saved in a shard to :class:`ShardedStages`, see
+    :attr:`~pulpcore.app.models.ProgressReport._forward`.
+
+    Only the count a report is done with since it was last forwarded is sent, so the counts of the
+    shards can be summed up. The totals of the downloads of the shard are forwarded once it is done,
+    see :meth:`forward_downloads`.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.forwarded_done = {}
+
+    def __call__(self, report):
+        done = report.done - self.forwarded_done.get(report.pk, 0)
+        self.forwarded_done[report.pk] = report.done
+        message = (
+            "progress",
+            report.pk,
+            report.message,
+            report.code,
+            done,
+            report.total,
+            report.state,
+            report.suffix,
+        )
+        # Reports may be saved from the threads running the database work of the stages
+        self.loop.call_soon_threadsafe(_write_message, self.writer, message)
+
+    def forward_downloads(self):
+        """
+        Forward the totals of the downloads of the shard, to be summed up with those of the task.
+        This must be called from the event loop of the shard.
+        """
+        downloads = telemetry.take(telemetry.current_task_id())
+        if downloads:
+            _write_message(self.writer, ("downloads", downloads))
+
+
+class _ShardProgress:
+    """
+    Sums up the progress reports of the shards into one progress report per message and code.
+    """
+
+    def __init__(self):
+        self.reports = {}
+        # The total and state of the progress report of each shard, keyed by message and code
+        self.shard_reports = {}
+
+    async def update(self, shard, pk, message, code, done, total, state, suffix):
+        """
+        Apply the progress forwarded by a shard and save the summed up progress report.
+        """
+        key = (message, code)
+        shard_reports = self.shard_reports.setdefault(key, {})
+        shard_reports[(shard, pk)] = (total, state)
+        report = self.reports.get(key)
+        if report is None:
+            report = self.reports[key] = ProgressReport(message=message, code=code)
+        report.done += done
+        totals = [total for total, _state in shard_reports.values() if total is not None]
+        report.total = sum(totals) if totals else None
+        report.suffix = suffix
+        states = {state for _total, state in shard_reports.values()}
+        report.state = next(state for state in _STATE_PRECEDENCE if state in states)
+        # Rate limit the saves until the reports of all the shards are final
+        report._using_context_manager = report.state in (TASK_STATES.RUNNING, TASK_STATES.WAITING)
+        await report.asave()
+
+
+class ShardedStages(Stage):
+    """
+    A Stages API stage that runs a list of stages in several subprocesses.
+
+    Each :class:`~pulpcore.plugin.stages.DeclarativeContent` received from `self._in_q` is handed
+    over to one of `shards` subprocesses, chosen by the hash of the natural key of its content, so
+    the same content unit is always handled by the same shard. Every shard runs its own pipeline of
+    `stages` with its own event loop and database connection, which lets the CPU-bound work of
+    these stages use more than one core. Once a shard is done with a content unit, its saved
+    content and artifacts are sent back, the content is resolved and passed via `self._out_q`.
+    The progress reports of the shards are summed up into one progress report per message and code,
+    and the statistics of their downloads are added to those of the task.
+
+    The subprocesses are forked when entering the context manager, which must happen before the
+    event loop runs::
+
+        with ShardedStages([QueryExistingArtifacts(), ...], shards=4) as sharded_stages:
+            loop.run_until_complete(create_pipeline([first_stage, sharded_stages, ...]))
+
+    All objects passed between the processes are pickled, so the `DeclarativeContent`, its
+    content and its :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects must be picklable.
+
+    Args:
+        stages (list of :class:`~pulpcore.plugin.stages.Stage`): The stages run by every shard.
+        shards (int): The number of subprocesses to run the stages in.
+        args: unused positional arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
+        kwargs: unused keyword arguments passed along to :class:`~pulpcore.plugin.stages.Stage`.
+    """
+
+    def __init__(self, stages, shards, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stages = stages
+        self.shards = shards
+        self._sockets = []
+        self._processes = []
+
+    def __enter__(self):
+        """
+        Fork the subprocesses running the shards.
+
+        Returns:
+            ShardedStages: self
+        """
+        for _shard in range(self.shards):
+            parent_socket, child_socket = socket.socketpair()
+            process = Process(
+                target=_run_shard,
+                args=(child_socket, self.stages, [*self._sockets, parent_socket]),
+                daemon=True,
+            )
+            process.start()
+            child_socket.close()
+            self._sockets.append(parent_socket)
+            self._processes.append(process)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        """
+        Wait for the subprocesses to finish, or terminate them if an error occurred.
+        """
+        for parent_socket in self._sockets:
+            parent_socket.close()
+        for process in self._processes:
+            if exc_value:
+                process.terminate()
+            process.join()
+
+    async def run(self):
+        """
+        The coroutine for this stage.
+
+        Returns:
+            The coroutine for this stage.
+        """
+        streams = [await asyncio.open_connection(sock=sock) for sock in self._sockets]
+        in_flight = {}
+        progress = _ShardProgress()
+
+        async def dispatch():
+            sequence = count()
+            async for d_content in self.items():
+                seq = next(sequence)
+                writer = streams[hash(d_content.content.natural_key()) % self.shards][1]
+                shard_content = copy.copy(d_content)
+                shard_content._future = None
+                shard_content._thaw_queue_event = None
+                _write_message(
+                    writer, ("content", seq, shard_content, d_content._future is not None)
+                )
+                in_flight[seq] = d_content
+                d_content._thaw_queue_event = _ShardThaw(
+                    partial(_write_message, writer, ("thaw", seq))
+                )
+                await writer.drain()
+            for _reader, writer in streams:
+                _write_message(writer, ("end",))
+                await writer.drain()
+
+        async def collect(shard, reader):
+            while True:
+                message = await _read_message(reader)
+                if message[0] == "end":
+                    return
+                if message[0] == "error":
+                    raise RuntimeError(_("A shard of the pipeline failed:\n{}").format(message[1]))
+                if message[0] == "progress":
+                    await progress.update(shard, *message[1:])
+                    continue
+                if message[0] == "downloads":
+                    telemetry.merge(message[1], telemetry.current_task_id())
+                    continue
+                _kind, seq, content, artifacts, forward = message
+                d_content = in_flight.pop(seq)
+                d_content.content = content
+                for d_artifact, artifact in zip(d_content.d_artifacts, artifacts):
+                    if artifact is not None:
+                        d_artifact.artifact = artifact
+                d_content._thaw_queue_event = None
+                d_content.resolve()
+                if forward:
+                    await self.put(d_content)
+
+        try:
+            await asyncio.gather(
+                dispatch(),
+                *(collect(shard, reader) for shard, (reader, _writer) in enumerate(streams)),
+            )
+        finally:
+            for _reader, writer in streams:
+                writer.close()
+
+
+class _ShardReceiver(Stage):
+    """
+    The first stage of a shard, receiving the content units from :class:`ShardedStages`.
+    """
+
+    def __init__(self, reader, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reader = reader
+        self.in_flight = {}
+        self.seqs = {}
+        self.remotes = {}
+
+    async def run(self):
+        while True:
+            message = await _read_message(self.reader)
+            if message[0] == "end":
+                break
+            if message[0] == "thaw":
+                d_content = self.in_flight.get(message[1])
+                if d_content is not None:
+                    asyncio.ensure_future(d_content.resolution())
+                continue
+            _kind, seq, d_content, awaited = message
+            for d_artifact in d_content.d_artifacts:
+                # Share the downloader factory of each remote across the content units
+                if d_artifact.remote is not None:
+                    d_artifact.remote = self.remotes.setdefault(
+                        d_artifact.remote.pk, d_artifact.remote
+                    )
+            self.in_flight[seq] = d_content
+            self.seqs[id(d_content)] = seq
+            if awaited:
+                asyncio.ensure_future(d_content.resolution())
+            await self.put(d_content)
+
+
+class _ShardSender(Stage):
+    """
+    The last stage of a shard, sending the handled content units back to :class:`ShardedStages`.
+    """
+
+    def __init__(self, writer, receiver, forwarder, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        self.receiver = receiver
+        self.forwarder = forwarder
+
+    async def run(self):
+        async for d_content in self.items():
+            seq = self.receiver.seqs.pop(id(d_content))
+            del self.receiver.in_flight[seq]
+            self._send(seq, d_content, forward=True)
+            await self.writer.drain()
+            await self.put(d_content)
+        # Content units dropped from the pipeline by one of the stages
+        for seq, d_content in self.receiver.in_flight.items():
+            self._send(seq, d_content, forward=False)
+        self.forwarder.forward_downloads()
+        _write_message(self.writer, ("end",))
+        await self.writer.drain()
+
+    def _send(self, seq, d_content, forward):
+        artifacts = [
+            d_artifact.artifact if d_artifact.artifact_is_saved else None
+            for d_artifact in d_content.d_artifacts
+        ]
+        _write_message(self.writer, ("content", seq, d_content.content, artifacts, forward))
+
+
+async def _run_shard_pipeline(sock, stages):
+    reader, writer = await asyncio.open_connection(sock=sock)
+    forwarder = ProgressReport._forward = _ProgressForwarder(asyncio.get_running_loop(), writer)
+    receiver = _ShardReceiver(reader)
+    try:
+        await create_pipeline(
+            [receiver, *stages, _ShardSender(writer, receiver, forwarder), EndStage()]
+        )
+    except Exception:
+        _write_message(writer, ("error", traceback.format_exc()))
+        await writer.drain()
+        raise
+    finally:
+        writer.close()
+
+
+def _run_shard(sock, stages, parent_sockets):
+    """
+    Run the pipeline of a shard. This is the target of the forked subprocess.
+    """
+    for parent_socket in parent_sockets:
+        parent_socket.close()
+    # All processes need to create their own postgres connection
+    connection.connection = None
+    # The thread of the executor running the database work is not forked along
+    SyncToAsync.single_thread_executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_run_shard_pipeline(sock, stages))
+    finally:
+        connection.close()
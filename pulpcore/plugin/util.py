@@ -25,4 +25,5 @@ from pulpcore.app.util import (  # noqa: F401
     get_current_user,
     get_current_authenticated_user,
     set_current_user,
+    sync_filesystems,
 )
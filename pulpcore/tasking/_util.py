@@ -10,7 +10,7 @@ import time
 from gettext import gettext as _
 
 from django.conf import settings
-from django.db import connection, transaction
+from django.db import connection, connections, transaction
 from django.db.models import Q
 from django.utils import timezone
 from django_guid import set_guid
@@ -19,11 +19,16 @@ from pulpcore.app.models import Task, TaskSchedule
 from pulpcore.app.role_util import get_users_with_perms
 from pulpcore.app.util import set_current_user, set_domain, configure_analytics, configure_cleanup
 from pulpcore.constants import TASK_FINAL_STATES, TASK_STATES, VAR_TMP_PULP
+from pulpcore.download.factory import close_connectors
+from pulpcore.download.shared_limits import release_held_slots
 from pulpcore.exceptions import AdvisoryLockError
 from pulpcore.tasking.tasks import dispatch, execute_task
 
 _logger = logging.getLogger(__name__)
 
+# Number of seconds between the checks of a task executor on its worker while waiting for a task
+EXECUTOR_POLL_INTERVAL = 5
+
 
 class PGAdvisoryLock:
     """
@@ -107,13 +112,62 @@ def child_signal_handler(sig, frame):
         sys.exit()
 
 
+def run_task_executor(task_pipe, max_tasks, max_memory):
+    """Run the tasks sent by the worker over `task_pipe`, one after the other.
+
+    The executor is forked by the worker ahead of its tasks, and connects to the database while it
+    waits for the first one. Each task is sent as its primary key and working directory. Once the
+    task is over, the executor answers whether it retires, which it does after `max_tasks` tasks or
+    once its memory usage exceeded `max_memory` megabytes. It also exits when the worker sends None
+    or goes away. The database connections of a task are closed after it, so the next task starts
+    with a new database session."""
+    worker_pid = os.getppid()
+    working_dir = os.getcwd()
+    # The signals are handled by the worker, which shuts the executors down
+    signal.set_wakeup_fd(-1)
+    # All processes need to create their own postgres connection
+    connection.connection = None
+    for tasks_run in range(1, max_tasks + 1):
+        # Connect ahead of the task
+        connection.ensure_connection()
+        # Neither the handlers of the worker nor the ones of the previous task apply while idle
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        while not task_pipe.poll(EXECUTOR_POLL_INTERVAL):
+            if os.getppid() != worker_pid:
+                return
+        message = task_pipe.recv()
+        if message is None:
+            return
+        task_pk, task_working_dir_rel_path = message
+        # Every task starts out like in a new process
+        signal.signal(signal.SIGINT, child_signal_handler)
+        signal.signal(signal.SIGTERM, child_signal_handler)
+        signal.signal(signal.SIGHUP, child_signal_handler)
+        signal.signal(signal.SIGUSR1, child_signal_handler)
+        # The connection may have been closed by the server while waiting
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+        try:
+            perform_task(task_pk, task_working_dir_rel_path)
+        finally:
+            os.chdir(working_dir)
+            # The download slots of an aborted task must not restrict the next one
+            release_held_slots()
+            # Neither the session state nor the connections of other databases outlive the task
+            connections.close_all()
+        memory_in_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        retiring = tasks_run == max_tasks or bool(max_memory and memory_in_mb > max_memory)
+        task_pipe.send(retiring)
+        if retiring:
+            return
+
+
 def perform_task(task_pk, task_working_dir_rel_path):
     """Setup the environment to handle a task and execute it.
-    This must be called as a subprocess, while the parent holds the advisory lock of the task."""
-    signal.signal(signal.SIGINT, child_signal_handler)
-    signal.signal(signal.SIGTERM, child_signal_handler)
-    signal.signal(signal.SIGHUP, child_signal_handler)
-    signal.signal(signal.SIGUSR1, child_signal_handler)
+    This must be called in a task executor, while the worker holds the advisory lock of the task."""
     if settings.TASK_DIAGNOSTICS:
         diagnostics_dir = VAR_TMP_PULP / str(task_pk)
         diagnostics_dir.mkdir(parents=True, exist_ok=True)
@@ -124,31 +178,37 @@ def perform_task(task_pk, task_working_dir_rel_path):
             target=write_memory_usage, args=(mem_diagnostics_path,), daemon=True
         )
         mem_diagnostics_thread.start()
-    # All processes need to create their own postgres connection
-    connection.connection = None
     task = Task.objects.select_related("pulp_domain").get(pk=task_pk)
     user = get_users_with_perms(task, with_group_users=False).first()
-    # Isolate from the parent asyncio.
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    # Set current contexts
-    set_guid(task.logging_cid)
-    set_current_user(user)
-    set_domain(task.pulp_domain)
-    os.chdir(task_working_dir_rel_path)
-
-    # set up profiling
-    if settings.TASK_DIAGNOSTICS and importlib.util.find_spec("pyinstrument") is not None:
-        from pyinstrument import Profiler
-
-        with Profiler() as profiler:
+    # Isolate from the parent asyncio, and from the previous tasks of the executor.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # Set current contexts
+        set_guid(task.logging_cid)
+        set_current_user(user)
+        set_domain(task.pulp_domain)
+        os.chdir(task_working_dir_rel_path)
+
+        # set up profiling
+        if settings.TASK_DIAGNOSTICS and importlib.util.find_spec("pyinstrument") is not None:
+            from pyinstrument import Profiler
+
+            with Profiler() as profiler:
+                execute_task(task)
+
+            profile_file = diagnostics_dir / "pyinstrument.html"
+            _logger.info("Writing task profile data to {}".format(profile_file))
+            with open(profile_file, "w+") as f:
+                f.write(profiler.output_html())
+        else:
             execute_task(task)
-
-        profile_file = diagnostics_dir / "pyinstrument.html"
-        _logger.info("Writing task profile data to {}".format(profile_file))
-        with open(profile_file, "w+") as f:
-            f.write(profiler.output_html())
-    else:
-        execute_task(task)
+    finally:
+        # The pooled connections of the downloads are bound to the loop of the task
+        close_connectors(loop)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        asyncio.set_event_loop(None)
+        loop.close()
 
 
 def dispatch_scheduled_tasks():
@@ -18,8 +18,15 @@ _logger = logging.getLogger(__name__)
 @click.option(
     "--burst/--no-burst", help="Run in burst mode; terminate when no more tasks are available."
 )
+@click.option(
+    "--slots",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="The maximum number of tasks to run at the same time.",
+)
 @click.command()
-def worker(pid, burst):
+def worker(pid, burst, slots):
     """A Pulp worker."""
 
     if pid:
@@ -28,4 +35,4 @@ def worker(pid, burst):
 
     _logger.info("Starting distributed type worker")
 
-    PulpcoreWorker().run(burst=burst)
+    PulpcoreWorker(slots=slots).run(burst=burst)
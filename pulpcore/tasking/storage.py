@@ -93,7 +93,7 @@ class _WorkingDir:
         self.delete()
 
 
-def get_worker_path(hostname):
+def get_worker_path(hostname, root=None):
     """
     Get the root directory path for a worker by hostname.
 
@@ -101,11 +101,12 @@ def get_worker_path(hostname):
 
     Args:
         hostname (str): The worker hostname.
+        root (str): The directory of the worker directories, the ``WORKING_DIRECTORY`` by default.
 
     Returns:
         str: The absolute path to a worker's root directory.
     """
-    return os.path.join(settings.WORKING_DIRECTORY, hostname)
+    return os.path.join(root or settings.WORKING_DIRECTORY, hostname)
 
 
 class WorkerDirectory(_WorkingDir):
@@ -115,12 +116,14 @@ class WorkerDirectory(_WorkingDir):
     Path format: <root>/<worker-hostname>
     """
 
-    def __init__(self, hostname):
+    def __init__(self, hostname, root=None):
         """
         Args:
             hostname (str): The worker hostname.
+            root (str): The directory of the worker directories, e.g. the staging directory of a
+                storage. The ``WORKING_DIRECTORY`` by default.
         """
-        self._path = get_worker_path(hostname)
+        self._path = get_worker_path(hostname, root)
 
     def create(self):
         """
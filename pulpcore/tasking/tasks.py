@@ -15,6 +15,7 @@ from pulpcore.app.loggers import deprecation_logger
 from pulpcore.app.models import Task
 from pulpcore.app.util import current_task, get_domain, get_url
 from pulpcore.constants import TASK_FINAL_STATES, TASK_INCOMPLETE_STATES, TASK_STATES
+from pulpcore.download import telemetry
 
 _logger = logging.getLogger(__name__)
 
@@ -40,6 +41,22 @@ def wakeup_worker():
         cursor.execute("NOTIFY pulp_worker_wakeup")
 
 
+def _save_download_stats(task):
+    """
+    Save the statistics of the downloads of a task on the task.
+    """
+    downloads = telemetry.summary(task.pk)
+    telemetry.reset(task.pk)
+    if not downloads:
+        return
+    try:
+        Task.objects.filter(pk=task.pk).update(download_stats=downloads)
+    except Exception:
+        _logger.exception(_("Failed to save the download statistics of task %s"), task.pk)
+    else:
+        task.download_stats = downloads
+
+
 def execute_task(task):
     # This extra stack is needed to isolate the current_task ContextVar
     contextvars.copy_context().run(_execute_task, task)
@@ -66,10 +83,12 @@ def _execute_task(task):
 
     except Exception:
         exc_type, exc, tb = sys.exc_info()
+        _save_download_stats(task)
         task.set_failed(exc, tb)
         _logger.info(_("Task %s failed (%s)"), task.pk, exc)
         _logger.info("\n".join(traceback.format_list(traceback.extract_tb(tb))))
     else:
+        _save_download_stats(task)
         task.set_completed()
         _logger.info(_("Task completed %s"), task.pk)
 
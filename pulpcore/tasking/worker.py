@@ -7,25 +7,28 @@ import select
 import signal
 import socket
 import contextlib
+import gc
+import shutil
 from datetime import timedelta
-from multiprocessing import Process
+from multiprocessing import Pipe, Process
 from tempfile import TemporaryDirectory
 from packaging.version import parse as parse_version
 
 from django.conf import settings
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import timezone
 
 from pulpcore.constants import TASK_STATES, TASK_INCOMPLETE_STATES
 from pulpcore.exceptions import AdvisoryLockError
 from pulpcore.app.apps import pulp_plugin_configs
 from pulpcore.app.models import Worker, Task, ApiAppStatus, ContentAppStatus
+from pulpcore.app.models.storage import get_staging_directory
 
 from pulpcore.tasking.storage import WorkerDirectory
 from pulpcore.tasking._util import (
     delete_incomplete_resources,
     dispatch_scheduled_tasks,
-    perform_task,
+    run_task_executor,
     startup_hook,
     PGAdvisoryLock,
 )
@@ -42,16 +45,112 @@ TASK_KILL_INTERVAL = 1
 WORKER_CLEANUP_INTERVAL = 100
 # Randomly chosen
 TASK_SCHEDULING_LOCK = 42
+# The fields of the incomplete tasks read by the worker while scanning them
+TASK_SCAN_FIELDS = (
+    "pk",
+    "pulp_created",
+    "state",
+    "worker",
+    "reserved_resources_record",
+    "versions",
+    "pulp_domain",
+)
+
+
+class TaskExecutor:
+    """
+    A subprocess forked by a worker ahead of the tasks it runs, see :func:`run_task_executor`.
+
+    Args:
+        max_tasks (int): The number of tasks the executor runs before it retires.
+        max_memory (int): The memory usage in megabytes above which the executor retires after its
+            task, or None.
+    """
+
+    def __init__(self, max_tasks, max_memory):
+        self.retiring = False
+        self.pipe, executor_pipe = Pipe()
+        self.process = Process(
+            target=run_task_executor, args=(executor_pipe, max_tasks, max_memory)
+        )
+        # Keep the garbage collector of the executor off the objects inherited from the worker, so
+        # their memory pages stay shared instead of being copied
+        gc.freeze()
+        try:
+            self.process.start()
+        finally:
+            gc.unfreeze()
+        executor_pipe.close()
+
+    def run(self, task_pk, working_directory):
+        """Send a task to the executor."""
+        self.pipe.send((task_pk, working_directory))
+
+    def poll(self):
+        """Check whether the task sent to the executor is over.
+
+        Returns:
+            None while the task runs, 0 once it completed, or else the exitcode of the executor.
+        """
+        try:
+            if self.pipe.poll():
+                self.retiring = self.pipe.recv()
+                return 0
+        except EOFError:
+            self.process.join()
+        if self.process.is_alive():
+            return None
+        self.retiring = True
+        return self.process.exitcode
+
+    def stop(self):
+        """Let the executor exit and wait for it."""
+        with contextlib.suppress(OSError):
+            self.pipe.send(None)
+        self.pipe.close()
+        self.process.join()
+
+
+class SupervisedTask:
+    """A task run in a task executor by a worker, and the state of its cancellation."""
+
+    def __init__(self, task, executor, working_directory):
+        self.task = task
+        self.executor = executor
+        self.working_directory = working_directory
+        self.cancel_requested = False
+        self.cancel_state = None
+        self.cancel_reason = None
+        # The number of heartbeats until the executor is signalled again to abort the task
+        self.kill_countdown = 0
 
 
 class PulpcoreWorker:
-    def __init__(self):
+    """
+    A worker running up to `slots` tasks at a time, each in a task executor subprocess.
+
+    The executors are forked ahead of the tasks and run up to ``TASK_EXECUTOR_MAX_TASKS`` tasks.
+
+    Args:
+        slots (int): The maximum number of tasks run at the same time.
+    """
+
+    def __init__(self, slots=1):
         # Notification states from several signal handlers
         self.shutdown_requested = False
         self.wakeup = False
-        self.cancel_task = False
 
-        self.task = None
+        self.slots = slots
+        # The tasks run by this worker, keyed by their primary key
+        self.supervised_tasks = {}
+        # The executors waiting for a task
+        self.idle_executors = []
+        # The directories of this worker in the staging directories of the storages
+        self.staging_worker_directories = {}
+        # The diagnostics are recorded for the whole process of a task
+        self.executor_max_tasks = (
+            1 if settings.TASK_DIAGNOSTICS else settings.TASK_EXECUTOR_MAX_TASKS
+        )
         self.name = f"{os.getpid()}@{socket.getfqdn()}"
         self.heartbeat_period = settings.WORKER_TTL / 3
         self.versions = {app.label: app.version for app in pulp_plugin_configs()}
@@ -88,9 +187,10 @@ class PulpcoreWorker:
     def _pg_notify_handler(self, notification):
         if notification.channel == "pulp_worker_wakeup":
             self.wakeup = True
-        elif self.task and notification.channel == "pulp_worker_cancel":
-            if notification.payload == str(self.task.pk):
-                self.cancel_task = True
+        elif notification.channel == "pulp_worker_cancel":
+            for supervised_task in self.supervised_tasks.values():
+                if notification.payload == str(supervised_task.task.pk):
+                    supervised_task.cancel_requested = True
 
     def handle_worker_heartbeat(self):
         """
@@ -122,6 +222,8 @@ class PulpcoreWorker:
         return worker
 
     def shutdown(self):
+        for worker_directory in self.staging_worker_directories.values():
+            worker_directory.delete()
         self.worker.delete()
         _logger.info(_("Worker %s was shut down."), self.name)
 
@@ -136,12 +238,46 @@ class PulpcoreWorker:
                 for app_worker in qs:
                     _logger.info(_("Clean missing %s worker %s."), cls_name, app_worker.name)
                 qs.delete()
+        for staging_directory in self.staging_worker_directories:
+            self.delete_stale_worker_directories(staging_directory)
+
+    def get_staging_worker_directory(self, staging_directory):
+        """Get the directory of this worker in a staging directory, and create it on first use.
+
+        Like the directory of the worker in the ``WORKING_DIRECTORY``, it is emptied when the
+        worker starts and deleted when it shuts down."""
+        worker_directory = self.staging_worker_directories.get(staging_directory)
+        if worker_directory is None:
+            worker_directory = WorkerDirectory(self.name, root=staging_directory)
+            worker_directory.create()
+            self.staging_worker_directories[staging_directory] = worker_directory
+            self.delete_stale_worker_directories(staging_directory)
+        return worker_directory.path
+
+    def delete_stale_worker_directories(self, staging_directory):
+        """Delete the directories left in a staging directory by the workers which are gone.
+
+        The storage may be shared by the workers of several hosts, so only the directories of the
+        workers cleaned up by :meth:`worker_cleanup` are deleted."""
+        worker_names = set(Worker.objects.values_list("name", flat=True))
+        with os.scandir(staging_directory) as entries:
+            for entry in entries:
+                if (
+                    "@" in entry.name
+                    and entry.name not in worker_names
+                    and entry.is_dir(follow_symlinks=False)
+                ):
+                    _logger.info(_("Clean staging directory of missing worker %s."), entry.name)
+                    shutil.rmtree(entry.path, ignore_errors=True)
 
     def beat(self):
         if self.worker.last_heartbeat < timezone.now() - timedelta(seconds=self.heartbeat_period):
             self.worker = self.handle_worker_heartbeat()
             if self.task_grace_timeout > 0:
                 self.task_grace_timeout -= 1
+            for supervised_task in self.supervised_tasks.values():
+                if supervised_task.kill_countdown > 0:
+                    supervised_task.kill_countdown -= 1
             self.worker_cleanup_countdown -= 1
             if self.worker_cleanup_countdown <= 0:
                 self.worker_cleanup_countdown = WORKER_CLEANUP_INTERVAL
@@ -197,33 +333,80 @@ class PulpcoreWorker:
             return False
         return True
 
-    def iter_tasks(self):
-        """Iterate over ready tasks and yield each task while holding the lock."""
+    def claim_task(self, candidates):
+        """Claim the oldest of the waiting `candidates` no other worker claimed, and lock it.
 
-        while not self.shutdown_requested:
-            taken_exclusive_resources = set()
-            taken_shared_resources = set()
-            # When batching this query, be sure to use "pulp_created" as a cursor
-            for task in Task.objects.filter(state__in=TASK_INCOMPLETE_STATES).order_by(
-                "pulp_created"
-            ):
-                reserved_resources_record = task.reserved_resources_record or []
-                exclusive_resources = [
-                    resource
-                    for resource in reserved_resources_record
-                    if not resource.startswith("shared:")
-                ]
-                shared_resources = [
-                    resource[7:]
-                    for resource in reserved_resources_record
-                    if resource.startswith("shared:") and resource[7:] not in exclusive_resources
-                ]
+        The rows of the candidates are locked with ``SKIP LOCKED``, so the workers claiming at the
+        same time each get another task instead of contending for the oldest one. The claimed task
+        is assigned to this worker, and its advisory lock is held to show this worker is alive.
+
+        Returns:
+            The claimed task holding its lock, or None if all the candidates were claimed.
+        """
+        while candidates:
+            with transaction.atomic():
+                task = (
+                    Task.objects.select_for_update(skip_locked=True, of=("self",))
+                    .select_related("pulp_domain")
+                    .filter(pk__in=candidates, state=TASK_STATES.WAITING, worker__isnull=True)
+                    .order_by("pulp_created")
+                    .first()
+                )
+                if task is None:
+                    return None
+                try:
+                    task.__enter__()
+                except AdvisoryLockError:
+                    # Someone else is checking on the task
+                    candidates.remove(task.pk)
+                    continue
+                task.worker = self.worker
+                task.save(update_fields=["worker"])
+                return task
+        return None
+
+    def next_task(self):
+        """Find and claim the next task to run.
+
+        The incomplete tasks are scanned in a single query in the order they were dispatched, while
+        the resources reserved by the tasks ahead are tracked in memory. The waiting tasks with free
+        resources are the candidates to be claimed by :meth:`claim_task`. The tasks assigned to
+        other workers are locked and refreshed to detect abandoned tasks.
+
+        Returns:
+            The claimed task holding its lock, or None if there is nothing to do.
+        """
+        taken_exclusive_resources = set()
+        taken_shared_resources = set()
+        candidates = []
+        # When batching this query, be sure to use "pulp_created" as a cursor
+        # Only the fields read by the worker are loaded, any other one would cost a query per task
+        for task in (
+            Task.objects.filter(state__in=TASK_INCOMPLETE_STATES)
+            .order_by("pulp_created")
+            .only(*TASK_SCAN_FIELDS)
+        ):
+            reserved_resources_record = task.reserved_resources_record or []
+            exclusive_resources = [
+                resource
+                for resource in reserved_resources_record
+                if not resource.startswith("shared:")
+            ]
+            shared_resources = [
+                resource[7:]
+                for resource in reserved_resources_record
+                if resource.startswith("shared:") and resource[7:] not in exclusive_resources
+            ]
+            if task.pk in self.supervised_tasks:
+                # This worker runs the task and holds its lock
+                pass
+            elif task.state != TASK_STATES.WAITING or task.worker_id is not None:
                 with contextlib.suppress(AdvisoryLockError), task:
                     # This code will only be called if we acquired the lock successfully
                     # The lock will be automatically be released at the end of the block
                     # Check if someone else changed the task before we got the lock
                     task.refresh_from_db()
-                    if task.state == TASK_STATES.CANCELING and task.worker is None:
+                    if task.state == TASK_STATES.CANCELING and task.worker_id is None:
                         # No worker picked this task up before being canceled
                         if self.cancel_abandoned_task(task, TASK_STATES.CANCELED):
                             # Continue looking for the next task
@@ -239,118 +422,203 @@ class PulpcoreWorker:
                             # without considering this tasks resources
                             # as we just released them
                             continue
-                    # This statement is using lazy evaluation
-                    if (
-                        task.state == TASK_STATES.WAITING
-                        and self.is_compatible(task)
-                        # No exclusive resource taken?
-                        and not any(
-                            resource in taken_exclusive_resources
-                            or resource in taken_shared_resources
-                            for resource in exclusive_resources
+                    if task.state == TASK_STATES.WAITING and task.worker_id is not None:
+                        # The worker claiming the task has gone missing before running it
+                        _logger.info(_("Releasing the claim on task %s."), task.pk)
+                        Task.objects.filter(pk=task.pk, state=TASK_STATES.WAITING).update(
+                            worker=None
                         )
-                        # No shared resource exclusively taken?
-                        and not any(
-                            resource in taken_exclusive_resources for resource in shared_resources
-                        )
-                    ):
-                        yield task
-                        # Start from the top of the Task list
-                        break
-
-                # Record the resources of the pending task we didn't get
-                taken_exclusive_resources.update(exclusive_resources)
-                taken_shared_resources.update(shared_resources)
-            else:
-                # If we got here, there is nothing to do
+                        task.worker = None
+            # This statement is using lazy evaluation
+            if (
+                task.state == TASK_STATES.WAITING
+                and task.worker_id is None
+                # No exclusive resource taken?
+                and not any(
+                    resource in taken_exclusive_resources or resource in taken_shared_resources
+                    for resource in exclusive_resources
+                )
+                # No shared resource exclusively taken?
+                and not any(resource in taken_exclusive_resources for resource in shared_resources)
+                and self.is_compatible(task)
+            ):
+                candidates.append(task.pk)
+
+            # Record the resources of the pending task
+            taken_exclusive_resources.update(exclusive_resources)
+            taken_shared_resources.update(shared_resources)
+
+        return self.claim_task(candidates)
+
+    def prefork_executors(self):
+        """Fork the executors of the free slots ahead of their tasks."""
+        while len(self.idle_executors) + len(self.supervised_tasks) < self.slots:
+            self.idle_executors.append(
+                TaskExecutor(self.executor_max_tasks, settings.TASK_EXECUTOR_MAX_MEMORY)
+            )
+
+    def start_task(self, task):
+        """Send a claimed task to an idle executor.
+
+        This function must only be called while holding the lock for that task."""
+
+        # Work on the filesystem of the storage, so the downloaded files are moved into it
+        staging_directory = get_staging_directory(task.pulp_domain)
+        if staging_directory:
+            staging_directory = self.get_staging_worker_directory(staging_directory)
+        working_directory = TemporaryDirectory(dir=staging_directory or ".")
+        if self.idle_executors:
+            executor = self.idle_executors.pop()
+        else:
+            executor = TaskExecutor(self.executor_max_tasks, settings.TASK_EXECUTOR_MAX_MEMORY)
+        executor.run(task.pk, working_directory.name)
+        self.supervised_tasks[task.pk] = SupervisedTask(task, executor, working_directory)
+
+    def start_tasks(self):
+        """Claim and start tasks until all the slots are busy or there is nothing to do."""
+        while len(self.supervised_tasks) < self.slots:
+            task = self.next_task()
+            if task is None:
                 break
+            self.start_task(task)
+
+    def abort_canceled_tasks(self):
+        """Signal the executors of the canceled tasks to abort them.
+
+        Each executor is signalled again every ``TASK_KILL_INTERVAL`` heartbeats until its task
+        is over, independently of the other tasks."""
+        for supervised_task in self.supervised_tasks.values():
+            if not supervised_task.cancel_state:
+                continue
+            if supervised_task.kill_countdown != 0:
+                _logger.info("Wait for canceled task %s to abort.", supervised_task.task.pk)
+            else:
+                supervised_task.kill_countdown = TASK_KILL_INTERVAL
+                _logger.info(
+                    "Aborting current task %s due to cancelation.", supervised_task.task.pk
+                )
+                os.kill(supervised_task.executor.process.pid, signal.SIGUSR1)
+
+    def finish_task(self, supervised_task, exitcode):
+        """Clean up after the task of an executor is over, and release the lock of the task.
+
+        The executor is kept for the next task, unless it retires or exited with `exitcode`."""
+
+        task = supervised_task.task
+        executor = supervised_task.executor
+        cancel_state = supervised_task.cancel_state
+        cancel_reason = supervised_task.cancel_reason
+        if not cancel_state and exitcode != 0:
+            _logger.warning(
+                "Task process for %s exited with non zero exitcode %i.",
+                task.pk,
+                exitcode,
+            )
+            cancel_state = TASK_STATES.FAILED
+            if exitcode < 0:
+                cancel_reason = "Killed by signal {sig_num}.".format(sig_num=-exitcode)
+            else:
+                cancel_reason = "Task process died unexpectedly with exitcode {code}.".format(
+                    code=exitcode
+                )
+        if cancel_state:
+            self.cancel_abandoned_task(task, cancel_state, cancel_reason)
+        if executor.retiring:
+            executor.stop()
+        else:
+            self.idle_executors.append(executor)
+        supervised_task.working_directory.cleanup()
+        del self.supervised_tasks[task.pk]
+        task.__exit__(None, None, None)
+        if task.reserved_resources_record:
+            self.notify_workers()
 
-    def sleep(self):
-        """Wait for signals on the wakeup channel while heart beating."""
+    def supervise_tasks(self, burst=False):
+        """Run tasks in up to `self.slots` task executors while heart beating.
+
+        New tasks are looked for whenever a slot is free and a task finished or the workers were
+        notified, and then executors are forked for the remaining free slots. Without tasks to run,
+        the worker sleeps until notified, or returns in burst mode. Returns once the worker was
+        requested to shut down and its tasks exited."""
+
+        look_for_tasks = True
+        while True:
+            if look_for_tasks and not self.shutdown_requested:
+                look_for_tasks = False
+                self.start_tasks()
+                if not self.supervised_tasks and not burst:
+                    _logger.debug(_("Worker %s entering sleep state."), self.name)
+                if self.supervised_tasks or not burst:
+                    self.prefork_executors()
+            if not self.supervised_tasks and (burst or self.shutdown_requested):
+                for executor in self.idle_executors:
+                    executor.stop()
+                self.idle_executors.clear()
+                return
+
+            self.abort_canceled_tasks()
 
-        _logger.debug(_("Worker %s entering sleep state."), self.name)
-        while not self.shutdown_requested and not self.wakeup:
             r, w, x = select.select(
-                [self.sentinel, connection.connection], [], [], self.heartbeat_period
+                [self.sentinel, connection.connection]
+                + [
+                    supervised_task.executor.pipe
+                    for supervised_task in self.supervised_tasks.values()
+                ]
+                + [
+                    supervised_task.executor.process.sentinel
+                    for supervised_task in self.supervised_tasks.values()
+                ]
+                + [executor.process.sentinel for executor in self.idle_executors],
+                [],
+                [],
+                self.heartbeat_period,
             )
             self.beat()
             if connection.connection in r:
                 connection.connection.execute("SELECT 1")
+                for supervised_task in self.supervised_tasks.values():
+                    if supervised_task.cancel_requested:
+                        _logger.info(
+                            _("Received signal to cancel current task %s."),
+                            supervised_task.task.pk,
+                        )
+                        supervised_task.cancel_state = TASK_STATES.CANCELED
+                        supervised_task.cancel_requested = False
+            if self.wakeup:
+                self.wakeup = False
+                look_for_tasks = True
+            for supervised_task in list(self.supervised_tasks.values()):
+                executor = supervised_task.executor
+                if executor.pipe in r or executor.process.sentinel in r:
+                    exitcode = executor.poll()
+                    if exitcode is not None:
+                        self.finish_task(supervised_task, exitcode)
+                        look_for_tasks = True
+            for executor in list(self.idle_executors):
+                if executor.process.sentinel in r:
+                    self.idle_executors.remove(executor)
+                    executor.stop()
+                    _logger.info(
+                        _("Idle task executor %s exited with exitcode %i."),
+                        executor.process.pid,
+                        executor.process.exitcode,
+                    )
             if self.sentinel in r:
                 os.read(self.sentinel, 256)
-        self.wakeup = False
-
-    def supervise_task(self, task):
-        """Call and supervise the task process while heart beating.
-
-        This function must only be called while holding the lock for that task."""
-
-        self.cancel_task = False
-        self.task = task
-        task.worker = self.worker
-        task.save(update_fields=["worker"])
-        cancel_state = None
-        cancel_reason = None
-        with TemporaryDirectory(dir=".") as task_working_dir_rel_path:
-            task_process = Process(target=perform_task, args=(task.pk, task_working_dir_rel_path))
-            task_process.start()
-            while True:
-                if cancel_state:
-                    if self.task_grace_timeout != 0:
-                        _logger.info("Wait for canceled task to abort.")
-                    else:
-                        self.task_grace_timeout = TASK_KILL_INTERVAL
-                        _logger.info("Aborting current task %s due to cancelation.", task.pk)
-                        os.kill(task_process.pid, signal.SIGUSR1)
-
-                r, w, x = select.select(
-                    [self.sentinel, connection.connection, task_process.sentinel],
-                    [],
-                    [],
-                    self.heartbeat_period,
-                )
-                self.beat()
-                if connection.connection in r:
-                    connection.connection.execute("SELECT 1")
-                    if self.cancel_task:
-                        _logger.info(_("Received signal to cancel current task %s."), task.pk)
-                        cancel_state = TASK_STATES.CANCELED
-                        self.cancel_task = False
-                if task_process.sentinel in r:
-                    if not task_process.is_alive():
-                        break
-                if self.sentinel in r:
-                    os.read(self.sentinel, 256)
-                if self.shutdown_requested:
+            if self.shutdown_requested:
+                for supervised_task in self.supervised_tasks.values():
                     if self.task_grace_timeout != 0:
                         _logger.info(
-                            "Worker shutdown requested, waiting for task %s to finish.", task.pk
+                            "Worker shutdown requested, waiting for task %s to finish.",
+                            supervised_task.task.pk,
                         )
-                    else:
-                        _logger.info("Aborting current task %s due to worker shutdown.", task.pk)
-                        cancel_state = TASK_STATES.FAILED
-                        cancel_reason = "Aborted during worker shutdown."
-            task_process.join()
-            if not cancel_state and task_process.exitcode != 0:
-                _logger.warning(
-                    "Task process for %s exited with non zero exitcode %i.",
-                    task.pk,
-                    task_process.exitcode,
-                )
-                cancel_state = TASK_STATES.FAILED
-                if task_process.exitcode < 0:
-                    cancel_reason = "Killed by signal {sig_num}.".format(
-                        sig_num=-task_process.exitcode
-                    )
-                else:
-                    cancel_reason = "Task process died unexpectedly with exitcode {code}.".format(
-                        code=task_process.exitcode
-                    )
-            if cancel_state:
-                self.cancel_abandoned_task(task, cancel_state, cancel_reason)
-        if task.reserved_resources_record:
-            self.notify_workers()
-        self.task = None
+                    elif not supervised_task.cancel_state:
+                        _logger.info(
+                            "Aborting current task %s due to worker shutdown.",
+                            supervised_task.task.pk,
+                        )
+                        supervised_task.cancel_state = TASK_STATES.FAILED
+                        supervised_task.cancel_reason = "Aborted during worker shutdown."
 
     def run(self, burst=False):
         with WorkerDirectory(self.name):
@@ -360,16 +628,10 @@ class PulpcoreWorker:
             # Subscribe to pgsql channels
             connection.connection.add_notify_handler(self._pg_notify_handler)
             self.cursor.execute("LISTEN pulp_worker_cancel")
-            if burst:
-                for task in self.iter_tasks():
-                    self.supervise_task(task)
-            else:
+            if not burst:
                 self.cursor.execute("LISTEN pulp_worker_wakeup")
-                while not self.shutdown_requested:
-                    for task in self.iter_tasks():
-                        self.supervise_task(task)
-                    if not self.shutdown_requested:
-                        self.sleep()
+            self.supervise_tasks(burst=burst)
+            if not burst:
                 self.cursor.execute("UNLISTEN pulp_worker_wakeup")
             self.cursor.execute("UNLISTEN pulp_worker_cancel")
             self.shutdown()
@@ -9,3 +9,5 @@ from pulpcore.app.util import set_domain
 def fake_domain():
     """A fixture to prevent `get_domain` to call out to the database."""
     set_domain(Domain(pk=uuid4(), name=uuid4()))
+    yield
+    set_domain(None)
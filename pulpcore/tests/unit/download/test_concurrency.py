@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from pulpcore.download import AdaptiveSemaphore
+from pulpcore.download.http import parse_retry_after
+
+
+@pytest.mark.asyncio
+async def test_additive_increase():
+    semaphore = AdaptiveSemaphore("example.org", initial=2, maximum=3)
+    for _i in range(2):
+        async with semaphore:
+            semaphore.record_success(semaphore.loop_time())
+    assert semaphore.limit == pytest.approx(2.9, abs=0.1)
+    for _i in range(10):
+        async with semaphore:
+            semaphore.record_success(semaphore.loop_time())
+    assert semaphore.limit == 3
+
+
+@pytest.mark.asyncio
+async def test_parent_semaphore():
+    parent = asyncio.Semaphore(1)
+    semaphore_a = AdaptiveSemaphore("a.example.org", initial=2, maximum=2, parent=parent)
+    semaphore_b = AdaptiveSemaphore("b.example.org", initial=2, maximum=2, parent=parent)
+    async with semaphore_a:
+        assert semaphore_b.locked()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(semaphore_b.acquire(), 0.05)
+        assert semaphore_b._in_flight == 0
+    async with semaphore_b:
+        assert parent.locked()
+    assert not parent.locked()
+
+
+@pytest.mark.asyncio
+async def test_multiplicative_decrease_once_per_burst():
+    semaphore = AdaptiveSemaphore("example.org", initial=8, maximum=10)
+    started = semaphore.loop_time()
+    semaphore.record_failure(started)
+    semaphore.record_failure(started)
+    assert semaphore.limit == 4
+    semaphore.record_failure(semaphore.loop_time())
+    assert semaphore.limit == 2
+    semaphore.record_failure(semaphore.loop_time())
+    semaphore.record_failure(semaphore.loop_time())
+    assert semaphore.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_limit_restricts_concurrency():
+    semaphore = AdaptiveSemaphore("example.org", initial=2, maximum=2)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def request():
+        nonlocal in_flight, max_in_flight
+        async with semaphore:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+
+    await asyncio.gather(*(request() for _i in range(10)))
+    assert max_in_flight == 2
+    assert not semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_requests():
+    semaphore = AdaptiveSemaphore("example.org", initial=2, maximum=2)
+    semaphore.record_failure(semaphore.loop_time(), retry_after=0.2)
+    assert semaphore.locked()
+    started = semaphore.loop_time()
+    async with semaphore:
+        pass
+    assert semaphore.loop_time() - started >= 0.2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
@@ -1,3 +1,8 @@
+import hashlib
+import os
+import threading
+from unittest import mock
+
 import pytest
 
 from pulpcore.app.models import Artifact
@@ -10,6 +15,11 @@ def _patch_digest_fields(monkeypatch):
     monkeypatch.setattr(Artifact, "DIGEST_FIELDS", {"sha512", "sha256"})
 
 
+@pytest.fixture
+def allow_sha512(settings):
+    settings.ALLOWED_CONTENT_CHECKSUMS = ["sha256", "sha512"]
+
+
 def test_no_trusted_digest():
     url = "http://example.com"
     with pytest.raises(UnsupportedDigestValidationError):
@@ -45,3 +55,48 @@ def test_expected_digests():
         semaphore=None,
     )
     assert downloader.expected_digests == digests
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("allow_sha512")
+async def test_handle_data_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    threads = set()
+    record_size_and_digests_for_data = BaseDownloader._record_size_and_digests_for_data
+
+    def _record_size_and_digests_for_data(self, data):
+        threads.add(threading.current_thread().name)
+        record_size_and_digests_for_data(self, data)
+
+    monkeypatch.setattr(
+        BaseDownloader, "_record_size_and_digests_for_data", _record_size_and_digests_for_data
+    )
+    chunks = [bytes([i]) * 100000 for i in range(10)]
+    data = b"".join(chunks)
+    downloader = BaseDownloader(
+        "http://example.com/file",
+        expected_digests={"sha256": hashlib.sha256(data).hexdigest()},
+        expected_size=len(data),
+    )
+    for chunk in chunks:
+        await downloader.handle_data(chunk)
+    await downloader.finalize()
+
+    with open(downloader.path, "rb") as f:
+        assert f.read() == data
+    assert downloader.artifact_attributes["sha512"] == hashlib.sha512(data).hexdigest()
+    assert threads and all(name.startswith("pulp-download-data") for name in threads)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("allow_sha512")
+@pytest.mark.parametrize("defer_fsync,fsyncs", [(False, 1), (True, 0)])
+async def test_finalize_defer_fsync(monkeypatch, tmp_path, defer_fsync, fsyncs):
+    monkeypatch.chdir(tmp_path)
+    fsync = mock.Mock(wraps=os.fsync)
+    monkeypatch.setattr(os, "fsync", fsync)
+    downloader = BaseDownloader("http://example.com/file")
+    downloader.defer_fsync = defer_fsync
+    await downloader.handle_data(b"data")
+    await downloader.finalize()
+    assert fsync.call_count == fsyncs
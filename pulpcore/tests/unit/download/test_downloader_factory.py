@@ -1,6 +1,10 @@
+import asyncio
+
 import pytest
 
-from pulpcore.download.factory import DownloaderFactory
+from pulpcore.download import factory
+from pulpcore.download.factory import DownloaderFactory, close_connectors
+from pulpcore.download.shared_limits import SharedThrottler
 from pulpcore.plugin.models import Remote
 
 
@@ -29,3 +33,76 @@ async def test_custom_headers():
     factory = DownloaderFactory(remote)
     downloader = factory.build(remote.url)
     assert downloader.session.headers["Connection"] == "keep-alive"
+
+
+@pytest.mark.asyncio
+async def test_http_downloads_share_semaphore_per_host(fake_domain):
+    remote = Remote(url="http://example.org/", name="foo", download_concurrency=5)
+    factory = DownloaderFactory(remote)
+    downloader_a = factory.build("http://example.org/a")
+    downloader_b = factory.build("http://example.org/b")
+    downloader_c = factory.build("http://mirror.example.org/c")
+    assert downloader_a.semaphore is downloader_b.semaphore
+    assert downloader_a.semaphore is not downloader_c.semaphore
+    assert downloader_a.semaphore.maximum == 5
+
+
+@pytest.mark.asyncio
+async def test_remotes_share_connector_per_tls_config(fake_domain):
+    remote_a = Remote(url="http://example.org/", name="a")
+    remote_b = Remote(url="http://example.org/", name="b", headers=[{"Foo": "bar"}])
+    remote_c = Remote(url="http://example.org/", name="c", tls_validation=False)
+    session_a = DownloaderFactory(remote_a).build(remote_a.url).session
+    session_b = DownloaderFactory(remote_b).build(remote_b.url).session
+    session_c = DownloaderFactory(remote_c).build(remote_c.url).session
+    assert session_a is not session_b
+    assert session_a.connector is session_b.connector
+    assert session_a.connector is not session_c.connector
+    assert session_a.connector.limit_per_host == 100
+
+
+def test_close_connectors(fake_domain):
+    remote = Remote(url="http://example.org/", name="a")
+
+    async def build_connector():
+        return DownloaderFactory(remote).build(remote.url).session.connector
+
+    loop = asyncio.new_event_loop()
+    try:
+        connector = loop.run_until_complete(build_connector())
+        close_connectors(loop)
+        assert connector.closed
+        assert loop not in factory._connectors
+    finally:
+        loop.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_download_limits(fake_domain, settings):
+    settings.DOWNLOAD_SHARED_LIMITS = True
+    remote = Remote(url="http://example.org/", name="foo", download_concurrency=5, rate_limit=10)
+    downloader = DownloaderFactory(remote).build(remote.url)
+    assert isinstance(downloader.download_throttler, SharedThrottler)
+    assert downloader.shared_semaphore.limit == 5
+    assert downloader.shared_semaphore.remote_pk == remote.pk
+
+
+@pytest.mark.asyncio
+async def test_http_downloads_keep_remote_concurrency(fake_domain):
+    remote = Remote(url="http://example.org/", name="foo")
+    factory = DownloaderFactory(remote)
+    downloader_a = factory.build("http://example.org/a")
+    downloader_b = factory.build("http://mirror.example.org/b")
+    assert downloader_a.semaphore.maximum == Remote.DEFAULT_DOWNLOAD_CONCURRENCY
+    # The hosts share the limit of the remote
+    assert downloader_a.semaphore.parent is downloader_b.semaphore.parent
+
+
+@pytest.mark.asyncio
+async def test_limits(fake_domain):
+    remote = Remote(url="http://example.org/", name="foo", download_concurrency=5)
+    factory = DownloaderFactory(remote)
+    assert factory.limits() == {}
+    factory.build("http://example.org/a")
+    factory.build("http://mirror.example.org/b")
+    assert factory.limits() == {"example.org": 5, "mirror.example.org": 5}
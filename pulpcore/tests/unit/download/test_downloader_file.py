@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+import pytest
+
+from pulpcore.app import settings as app_settings
+from pulpcore.app.models import Artifact
+from pulpcore.app.models.storage import _copy_file_in_kernel
+from pulpcore.download import FileDownloader
+from pulpcore.exceptions import DigestValidationError
+
+
+@pytest.fixture(autouse=True)
+def _patch_digest_fields(monkeypatch, settings, tmp_path):
+    monkeypatch.setattr(Artifact, "DIGEST_FIELDS", {"sha512", "sha256"})
+    settings.ALLOWED_CONTENT_CHECKSUMS = ["sha256", "sha512"]
+    monkeypatch.setattr(app_settings, "ALLOWED_IMPORT_PATHS", [str(tmp_path)])
+
+
+@pytest.fixture
+def source(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    (tmp_path / "source").mkdir()
+    path = tmp_path / "source" / "file"
+    path.write_bytes(data)
+    return path, data
+
+
+@pytest.mark.asyncio
+async def test_file_hashed_in_place(monkeypatch, tmp_path, source):
+    path, data = source
+    (tmp_path / "work").mkdir()
+    monkeypatch.chdir(tmp_path / "work")
+    downloader = FileDownloader(
+        "file://{}".format(path),
+        expected_digests={"sha256": hashlib.sha256(data).hexdigest()},
+        expected_size=len(data),
+        in_place=True,
+    )
+    result = await downloader.run()
+
+    assert result.path == str(path)
+    assert result.artifact_attributes["size"] == len(data)
+    assert result.artifact_attributes["sha512"] == hashlib.sha512(data).hexdigest()
+    assert os.listdir(tmp_path / "work") == []
+
+    downloader = FileDownloader(
+        "file://{}".format(path),
+        expected_digests={"sha256": hashlib.sha256(b"").hexdigest()},
+        in_place=True,
+    )
+    with pytest.raises(DigestValidationError):
+        await downloader.run()
+
+
+@pytest.mark.asyncio
+async def test_file_copied(monkeypatch, tmp_path, source):
+    path, data = source
+    (tmp_path / "work").mkdir()
+    monkeypatch.chdir(tmp_path / "work")
+    result = await FileDownloader("file://{}".format(path)).run()
+
+    # The result is a copy in the working directory, which can be moved into the storage
+    assert os.path.dirname(result.path) == str(tmp_path / "work")
+    with open(result.path, "rb") as f:
+        assert f.read() == data
+    assert result.artifact_attributes["sha512"] == hashlib.sha512(data).hexdigest()
+    assert path.read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_file_through_handle_data(monkeypatch, tmp_path, source):
+    path, data = source
+    monkeypatch.chdir(tmp_path)
+    chunks = []
+
+    class StreamingDownloader(FileDownloader):
+        async def handle_data(self, data):
+            chunks.append(data)
+            await super().handle_data(data)
+
+    result = await StreamingDownloader("file://{}".format(path)).run()
+
+    assert b"".join(chunks) == data
+    assert result.path != str(path)
+    assert result.artifact_attributes["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_copy_file_in_kernel(tmp_path, source):
+    path, data = source
+    with open(tmp_path / "copy", "wb") as copy:
+        copied = _copy_file_in_kernel(str(path), copy.fileno())
+    if copied:
+        assert (tmp_path / "copy").read_bytes() == data
+    else:
+        assert (tmp_path / "copy").read_bytes() == b""
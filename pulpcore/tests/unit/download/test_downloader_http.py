@@ -0,0 +1,295 @@
+from collections import defaultdict
+import asyncio
+import hashlib
+import os
+import time
+from unittest import mock
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from pulpcore.app.models import Artifact
+from pulpcore.app.util import current_task
+from pulpcore.download import DownloadCache, HttpDownloader
+from pulpcore.download import telemetry
+from pulpcore.download.http import parse_content_range
+from pulpcore.download.telemetry import DownloadStats, DownloadTelemetry
+
+
+@pytest.fixture(autouse=True)
+def _patch_digest_fields(monkeypatch, settings):
+    monkeypatch.setattr(Artifact, "DIGEST_FIELDS", {"sha512", "sha256"})
+    settings.ALLOWED_CONTENT_CHECKSUMS = ["sha256", "sha512"]
+
+
+@pytest.fixture
+def data():
+    return bytes(range(256)) * 4000 + b"end"
+
+
+@pytest_asyncio.fixture
+async def server(tmp_path, data):
+    (tmp_path / "file").write_bytes(data)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get("Range"))
+        if request.query.get("ranges") == "no":
+            return web.Response(body=data)
+        return web.FileResponse(tmp_path / "file")
+
+    app = web.Application()
+    app.router.add_get("/file", handler)
+    server = TestServer(app)
+    await server.start_server()
+    server.requests = requests
+    yield server
+    await server.close()
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1000") == (0, 99, 1000)
+    assert parse_content_range("bytes 100-199/*") == (100, 199, None)
+    assert parse_content_range("bytes */1000") is None
+    assert parse_content_range(None) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "query,slots,ranges", [("", 4, 4), ("", 2, 2), ("", 1, 1), ("?ranges=no", 4, 1)]
+)
+async def test_segmented_download(monkeypatch, tmp_path, server, data, query, slots, ranges):
+    monkeypatch.chdir(tmp_path)
+    semaphore = asyncio.Semaphore(slots)
+    async with aiohttp.ClientSession() as session:
+        downloader = HttpDownloader(
+            str(server.make_url("/file")) + query,
+            session=session,
+            semaphore=semaphore,
+            expected_digests={"sha256": hashlib.sha256(data).hexdigest()},
+            expected_size=len(data),
+            segments=4,
+            min_segment_size=100000,
+        )
+        result = await downloader.run()
+
+    with open(result.path, "rb") as f:
+        assert f.read() == data
+    assert result.artifact_attributes["size"] == len(data)
+    assert result.artifact_attributes["sha512"] == hashlib.sha512(data).hexdigest()
+    assert len(server.requests) == ranges
+    if ranges > 1:
+        assert server.requests[0] == "bytes=0-{}".format(-(-len(data) // ranges) - 1)
+    # The slots of the segments are released
+    assert semaphore._value == slots
+
+
+@pytest_asyncio.fixture
+async def flaky_server(data):
+    requests = []
+
+    async def handler(request):
+        requests.append((request.headers.get("Range"), request.headers.get("If-Range")))
+        if len(requests) > 1:
+            start = int(request.headers["Range"][len("bytes=") : -1])
+            return web.Response(
+                status=206,
+                body=data[start:],
+                headers={"Content-Range": "bytes {}-{}/{}".format(start, len(data) - 1, len(data))},
+            )
+        response = web.StreamResponse(headers={"ETag": '"v1"', "Content-Length": str(len(data))})
+        await response.prepare(request)
+        await response.write(data[: len(data) // 2])
+        request.transport.close()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/file", handler)
+    server = TestServer(app)
+    await server.start_server()
+    server.requests = requests
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_resume_download(monkeypatch, tmp_path, flaky_server, data):
+    monkeypatch.chdir(tmp_path)
+    async with aiohttp.ClientSession() as session:
+        downloader = HttpDownloader(
+            str(flaky_server.make_url("/file")),
+            session=session,
+            expected_digests={"sha256": hashlib.sha256(data).hexdigest()},
+            expected_size=len(data),
+            max_retries=1,
+        )
+        result = await downloader.run()
+
+    with open(result.path, "rb") as f:
+        assert f.read() == data
+    assert result.artifact_attributes["sha512"] == hashlib.sha512(data).hexdigest()
+    assert flaky_server.requests[0] == (None, None)
+    resumed_from = int(flaky_server.requests[1][0][len("bytes=") : -1])
+    assert 0 < resumed_from < len(data)
+    assert flaky_server.requests[1][1] == '"v1"'
+
+
+def test_discarded_file_is_not_resumed():
+    downloader = HttpDownloader("http://example.org/file")
+    downloader._resume_from = 100
+    downloader._resume_validator = '"v1"'
+    downloader._ensure_no_broken_file()
+    assert downloader._resume_from == 0
+    assert downloader._resume_validator is None
+
+
+@pytest.mark.asyncio
+async def test_download_telemetry(monkeypatch, tmp_path, flaky_server, data):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(telemetry, "_totals", defaultdict(telemetry._totals.default_factory))
+    async with aiohttp.ClientSession() as session:
+        downloader = HttpDownloader(
+            str(flaky_server.make_url("/file")),
+            session=session,
+            max_retries=1,
+            telemetry=DownloadTelemetry("remote"),
+        )
+        await downloader.run()
+
+    stats = downloader.stats
+    assert stats.host == flaky_server.host
+    assert stats.status == 206
+    assert stats.retries == 1
+    assert stats.size == len(data)
+    assert 0 < stats.time_to_first_byte <= stats.duration
+    (summary,) = telemetry.summary()
+    assert summary["remote"] == "remote"
+    assert summary["host"] == flaky_server.host
+    assert (summary["downloads"], summary["failures"], summary["retries"]) == (1, 0, 1)
+    assert summary["bytes"] == len(data)
+    assert summary["time_to_first_byte"] == stats.time_to_first_byte
+
+
+@pytest.mark.asyncio
+async def test_download_telemetry_per_task(monkeypatch):
+    monkeypatch.setattr(telemetry, "_totals", defaultdict(telemetry._totals.default_factory))
+    stats = DownloadStats("example.com")
+    stats.duration = 1.0
+    stats.status = 200
+    task = mock.Mock()
+    token = current_task.set(task)
+    try:
+        DownloadTelemetry("remote").record(stats)
+    finally:
+        current_task.reset(token)
+
+    assert telemetry.summary() == []
+    (summary,) = telemetry.summary(task.pk)
+    assert summary["downloads"] == 1
+    telemetry.reset(task.pk)
+    assert telemetry.summary(task.pk) == []
+
+
+def test_download_telemetry_merge(monkeypatch):
+    monkeypatch.setattr(telemetry, "_totals", defaultdict(telemetry._totals.default_factory))
+    totals = {("remote", "example.com"): dict.fromkeys(telemetry._FIELDS, 0)}
+    totals[("remote", "example.com")].update(downloads=2, max_time_to_first_byte=0.5)
+    telemetry.merge(totals)
+    totals[("remote", "example.com")]["max_time_to_first_byte"] = 0.2
+    telemetry.merge(totals)
+
+    taken = telemetry.take()
+    assert taken[("remote", "example.com")]["downloads"] == 4
+    assert taken[("remote", "example.com")]["max_time_to_first_byte"] == 0.5
+    assert telemetry.summary() == []
+
+
+@pytest.mark.asyncio
+async def test_conditional_download(monkeypatch, tmp_path, data):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.Response(body=data, headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/repomd.xml", handler)
+    server = TestServer(app)
+    await server.start_server()
+    url = str(server.make_url("/repomd.xml"))
+    cache = DownloadCache(tmp_path / "cache", namespace="remote")
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for _ in range(2):
+                downloader = HttpDownloader(url, session=session, cache=cache)
+                results.append(await downloader.run())
+    finally:
+        await server.close()
+
+    assert requests == [None, '"v1"']
+    assert results[0].path != results[1].path
+    assert results[0].artifact_attributes == results[1].artifact_attributes
+    with open(results[1].path, "rb") as f:
+        assert f.read() == data
+    # The restored file is a copy, which the cache is not affected by
+    cache_path = cache._data_path(cache.lookup(url))
+    assert os.stat(results[1].path).st_ino != os.stat(cache_path).st_ino
+    assert not [name for name in os.listdir(os.path.dirname(cache_path)) if name.endswith(".tmp")]
+
+
+def test_download_cache_replace(tmp_path):
+    cache = DownloadCache(tmp_path / "cache", max_size=1000)
+    url = "http://example.com/repomd.xml"
+    source = tmp_path / "source"
+    source.write_bytes(b"v1")
+    cache.store(url, {"ETag": "v1"}, str(source), {"size": 2})
+    old_data_path = cache._data_path(cache.lookup(url))
+    source.write_bytes(b"v2")
+    cache.store(url, {"ETag": "v2"}, str(source), {"size": 2})
+
+    # The entry refers to a new file, the file of the replaced entry is deleted
+    entry = cache.lookup(url)
+    assert entry["etag"] == "v2"
+    assert not os.path.exists(old_data_path)
+    restored = tmp_path / "restored"
+    restored.write_bytes(b"")
+    cache.restore(entry, str(restored))
+    assert restored.read_bytes() == b"v2"
+
+    # A file left over by a crash before its entry was written is pruned once it is stale
+    orphan = os.path.join(os.path.dirname(cache._path(url)), "orphan.data")
+    with open(orphan, "wb") as f:
+        f.write(b"v3")
+    cache.prune()
+    assert os.path.exists(orphan)
+    stale = time.time() - cache.STALE_TEMPORARY_FILE_AGE - 1
+    os.utime(orphan, (stale, stale))
+    cache.prune()
+    assert not os.path.exists(orphan)
+    assert cache.lookup(url) is not None
+
+
+def test_download_cache_prune(tmp_path):
+    cache = DownloadCache(tmp_path / "cache", max_size=250)
+    source = tmp_path / "source"
+    source.write_bytes(b"x" * 100)
+    for number in range(2):
+        url = "http://example.com/{}".format(number)
+        cache.store(url, {"ETag": "v1"}, str(source), {"size": 100})
+        # Stored a while ago, the first entry first
+        last_used = time.time() - 100 * (2 - number)
+        os.utime(cache._path(url) + ".json", (last_used, last_used))
+    assert cache.lookup("http://example.com/0") is not None
+    cache.store("http://example.com/2", {"ETag": "v1"}, str(source), {"size": 100})
+
+    # The least recently used entry was deleted, the entry looked up in the meantime was kept
+    assert cache.lookup("http://example.com/0") is not None
+    assert cache.lookup("http://example.com/1") is None
+    assert cache.lookup("http://example.com/2") is not None
@@ -0,0 +1,150 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from django.db import connection, connections
+
+from pulpcore.app.models import Remote
+from pulpcore.download import shared_limits
+from pulpcore.download.shared_limits import (
+    SHARED_SEMAPHORE_LOCK_GROUP,
+    SharedSemaphore,
+    _get_limits_executor,
+    _reserve_request,
+    _try_lock_slot,
+    _unlock_held_slots,
+)
+
+
+@pytest.fixture
+def limits_thread():
+    yield
+    # Let the test database go
+    _get_limits_executor().submit(connections.close_all).result()
+
+
+@pytest.mark.django_db
+def test_reserve_request():
+    remote = Remote.objects.create(name=uuid4(), url="http://example.com")
+    waits = [_reserve_request(remote.pk, 1 / 5) for _i in range(7)]
+
+    # A burst of up to the rate limit, then one request every 1 / 5 seconds
+    assert waits[:5] == [0.0] * 5
+    assert waits[5] == pytest.approx(0.2, abs=0.05)
+    assert waits[6] == pytest.approx(0.4, abs=0.05)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_shared_semaphore(monkeypatch, limits_thread):
+    monkeypatch.setattr(SharedSemaphore, "POLL_INTERVAL", (0.01, 0.01))
+    semaphore = SharedSemaphore(uuid4(), 2)
+    held = []
+    max_held = 0
+
+    async def download():
+        nonlocal max_held
+        async with semaphore.lease():
+            held.append(None)
+            max_held = max(max_held, len(held))
+            await asyncio.sleep(0.05)
+            held.pop()
+
+    await asyncio.gather(*(download() for _i in range(5)))
+
+    assert max_held == 2
+    assert not shared_limits._held_slots
+
+
+@pytest.mark.django_db
+def test_try_lock_slot():
+    def lock(function, slot):
+        # Another session, e.g. another worker, holds the slot
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT {}(%s, %s)".format(function), [SHARED_SEMAPHORE_LOCK_GROUP, slot]
+            )
+
+    other_session = ThreadPoolExecutor(max_workers=1)
+    try:
+        other_session.submit(lock, "pg_advisory_lock", 1).result()
+        # The first free slot is locked, and only that one
+        assert _try_lock_slot([1, 2, 3]) == 2
+        assert _try_lock_slot([1, 2, 3]) == 3
+        assert _try_lock_slot([1, 2, 3]) is None
+        assert shared_limits._held_slots == {2, 3}
+    finally:
+        _unlock_held_slots()
+        other_session.submit(connections.close_all).result()
+        other_session.shutdown()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_shared_semaphore_wakes_local_waiters(monkeypatch, limits_thread):
+    # The waiters don't poll the database for the slots released in this process
+    monkeypatch.setattr(SharedSemaphore, "POLL_INTERVAL", (60, 60))
+    semaphore = SharedSemaphore(uuid4(), 1)
+    lease = semaphore.lease()
+    await lease.__aenter__()
+    waiter = asyncio.ensure_future(semaphore.lease().__aenter__())
+    await asyncio.sleep(0.05)
+    assert not waiter.done()
+
+    await lease.__aexit__(None, None, None)
+    assert await asyncio.wait_for(waiter, 1)
+    assert shared_limits._held_slots == {semaphore._slots[0]}
+    shared_limits.release_held_slots()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_shared_semaphore_across_sessions(monkeypatch, limits_thread):
+    monkeypatch.setattr(SharedSemaphore, "POLL_INTERVAL", (0.01, 0.01))
+    semaphore = SharedSemaphore(uuid4(), 1)
+
+    def lock(function):
+        # Another session, e.g. another worker, holds the slot
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT {}(%s, %s)".format(function),
+                [SHARED_SEMAPHORE_LOCK_GROUP, semaphore._slots[0]],
+            )
+
+    other_session = ThreadPoolExecutor(max_workers=1)
+    try:
+        other_session.submit(lock, "pg_advisory_lock").result()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(semaphore.lease().__aenter__(), 0.2)
+        other_session.submit(lock, "pg_advisory_unlock").result()
+        async with semaphore.lease():
+            assert shared_limits._held_slots == {semaphore._slots[0]}
+    finally:
+        other_session.submit(connections.close_all).result()
+        other_session.shutdown()
+    assert not shared_limits._held_slots
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_shared_semaphore_lease_without_blocking(limits_thread):
+    semaphore = SharedSemaphore(uuid4(), 1)
+    async with semaphore.lease() as held:
+        assert held
+        async with semaphore.lease(blocking=False) as held_too:
+            assert not held_too
+    assert not shared_limits._held_slots
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_release_held_slots(limits_thread):
+    semaphore = SharedSemaphore(uuid4(), 1)
+    # The lease of an aborted task is never left
+    await semaphore.lease().__aenter__()
+    assert shared_limits._held_slots
+    shared_limits.release_held_slots()
+    assert not shared_limits._held_slots
+    async with semaphore.lease(blocking=False) as held:
+        assert held
@@ -1,5 +1,6 @@
 import pytest
 from collections import namedtuple
+from uuid import uuid4
 
 from django.core.files.storage import default_storage as storage
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -13,9 +14,12 @@ from pulpcore.plugin.models import (
     Artifact,
     Content,
     ContentArtifact,
+    Publication,
+    PublishedMetadata,
     PulpTemporaryFile,
     Remote,
     RemoteArtifact,
+    Repository,
 )
 
 
@@ -181,3 +185,27 @@ def test_remoteartifact_with_forbidden_checksums(remote_artifact_setup):
             remote=remote_artifact_setup.remote,
         )
         ra.validate_checksums()
+
+
+@pytest.mark.django_db
+def test_content_bulk_get_or_create():
+    repository = Repository.objects.create(name=str(uuid4()))
+    publication = Publication.objects.create(repository_version=repository.latest_version())
+    existing = PublishedMetadata.objects.create(publication=publication, relative_path="a")
+
+    result = PublishedMetadata.objects.bulk_get_or_create(
+        [
+            PublishedMetadata(publication=publication, relative_path=relative_path)
+            for relative_path in ("a", "b", "c", "b")
+        ]
+    )
+
+    assert [content.relative_path for content in result] == ["a", "b", "c", "b"]
+    assert result[0].pk == existing.pk
+    assert result[1].pk == result[3].pk
+    assert not any(content._state.adding for content in result)
+    assert PublishedMetadata.objects.filter(publication=publication).count() == 3
+    master = Content.objects.get(pk=result[2].pk)
+    assert master.pulp_type == PublishedMetadata.get_pulp_type()
+    assert master.timestamp_of_interest is not None
+    assert master.cast().relative_path == "c"
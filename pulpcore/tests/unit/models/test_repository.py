@@ -258,3 +258,32 @@ def test_next_version_with_multiple_versions():
 
     assert repository.next_version == 4
     assert repository.latest_version().number == 1
+
+
+@pytest.mark.django_db
+def test_resume_new_version(repository, content_pks, add_content, verify_content_sets):
+    with pytest.raises(RuntimeError):
+        with repository.new_version(resume=True) as version:
+            add_content(version, [1, 1, 0, 0, 0])
+            raise RuntimeError()
+
+    # The failed version is kept and resumed with the content it already has.
+    with repository.new_version(resume=True) as resumed_version:
+        assert resumed_version.pk == version.pk
+        add_content(resumed_version, [0, 0, 1, 0, 0])
+
+    verify_content_sets(resumed_version, [1, 1, 1, 0, 0], [1, 1, 1, 0, 0], [0, 0, 0, 0, 0])
+    assert resumed_version.complete
+    assert repository.latest_version() == resumed_version
+
+
+@pytest.mark.django_db
+def test_new_version_discards_resumable_version(repository, add_content):
+    with pytest.raises(RuntimeError):
+        with repository.new_version(resume=True) as version:
+            add_content(version, [1, 1, 0, 0, 0])
+            raise RuntimeError()
+
+    with repository.new_version() as new_version:
+        assert new_version.pk != version.pk
+        assert not repository.versions.filter(pk=version.pk).exists()
@@ -0,0 +1,65 @@
+import os
+
+from django.core.files import File
+
+from pulpcore.app.models import Domain, storage
+from pulpcore.app.models.storage import FileSystem, get_staging_directory, is_staged_path
+
+
+def _domain(location):
+    return Domain(
+        name="staging",
+        storage_class="pulpcore.app.models.storage.FileSystem",
+        storage_settings={"location": str(location)},
+    )
+
+
+def test_get_staging_directory(monkeypatch, settings, tmp_path):
+    settings.WORKING_DIRECTORY = tmp_path / "work"
+    (tmp_path / "work").mkdir()
+    domain = _domain(tmp_path / "media")
+    (tmp_path / "media").mkdir()
+    assert get_staging_directory(domain) is None
+
+    stat = os.stat
+
+    def stat_on_other_filesystem(path):
+        result = stat(path)
+        if str(path) == str(tmp_path / "media"):
+            return os.stat_result(result[:2] + (result.st_dev + 1,) + result[3:])
+        return result
+
+    monkeypatch.setattr(storage.os, "stat", stat_on_other_filesystem)
+    assert get_staging_directory(domain) == str(tmp_path / "media" / "tmp" / "staging")
+    assert get_staging_directory(_domain(tmp_path / "missing")) is None
+
+
+def test_is_staged_path(monkeypatch, settings, tmp_path):
+    settings.WORKING_DIRECTORY = tmp_path / "work"
+    domain = _domain(tmp_path / "media")
+    monkeypatch.setattr(
+        storage, "get_staging_directory", lambda domain: str(tmp_path / "media" / "staging")
+    )
+    assert is_staged_path(str(tmp_path / "work" / "task" / "file"), domain)
+    assert is_staged_path(str(tmp_path / "media" / "staging" / "file"), domain)
+    assert not is_staged_path(str(tmp_path / "source" / "file"), domain)
+    assert not is_staged_path(str(tmp_path / "workspace" / "file"), domain)
+
+
+def test_save_moves_staged_file(settings, tmp_path):
+    settings.WORKING_DIRECTORY = tmp_path / "work"
+    file_storage = FileSystem(location=str(tmp_path / "media"))
+    staging_directory = tmp_path / "media" / "tmp" / "staging"
+    staging_directory.mkdir(parents=True)
+    staged = staging_directory / "download"
+    staged.write_bytes(b"data")
+
+    class StagedFile(File):
+        def temporary_file_path(self):
+            return self.name
+
+    with open(staged, "rb") as f:
+        file_storage.save("artifact/ab/cd", StagedFile(f))
+
+    assert not staged.exists()
+    assert (tmp_path / "media" / "artifact" / "ab" / "cd").read_bytes() == b"data"
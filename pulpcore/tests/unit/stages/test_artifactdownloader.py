@@ -1,14 +1,23 @@
 import asyncio
+import hashlib
 import pytest
 import pytest_asyncio
 from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from aiotools.timer import VirtualClock
 
 from unittest import mock
 
+from django.db import connections
+
 from pulpcore.plugin.stages import DeclarativeContent, DeclarativeArtifact
-from pulpcore.plugin.stages.artifact_stages import ArtifactDownloader
+from pulpcore.plugin.stages import artifact_stages
+from pulpcore.plugin.stages.artifact_stages import (
+    ArtifactDownloader,
+    _release_download_claims,
+    _try_claim_downloads,
+)
 
 pytestmark = pytest.mark.usefixtures("fake_domain")
 
@@ -87,7 +96,7 @@ def downloader_mock():
 
 @pytest.fixture
 def queue_dc(in_q, downloader_mock):
-    def _queue_dc(delays=[], artifact_path=None):
+    def _queue_dc(delays=[], artifact_path=None, size=None, sha256=None):
         """Put a DeclarativeContent instance into `in_q`
 
         For each `delay` in `delays`, associate a DeclarativeArtifact
@@ -95,17 +104,23 @@ def queue_dc(in_q, downloader_mock):
         None` means that the artifact is already present (pk is set)
         and no download is required. `artifact_path != None` means
         that the Artifact already has a file associated with it and a
-        download does not need to be scheduled.
+        download does not need to be scheduled. `size` and `sha256` are
+        the expected size and sha256 of the artifacts, `sha256` may also
+        be a list of one sha256 per artifact.
         """
         das = []
-        for delay in delays:
+        sha256s = sha256 if isinstance(sha256, list) else [sha256] * len(delays)
+        for delay, sha256 in zip(delays, sha256s):
             artifact = mock.Mock()
             artifact.pk = uuid4()
             artifact._state.adding = delay is not None
             artifact.DIGEST_FIELDS = []
             artifact.file = artifact_path
+            artifact.size = size
+            artifact.sha256 = sha256
             remote = mock.Mock()
             remote.get_downloader = downloader_mock
+            remote.download_factory.limits.return_value = {"example.org": 3}
             das.append(
                 DeclarativeArtifact(
                     artifact=artifact, url=str(delay), relative_path="path", remote=remote
@@ -411,3 +426,192 @@ async def test_download_artifact_with_file(
     assert downloader_mock.running == 0
 
     assert download_task.result() == 3
+
+
+async def run_downloader(in_q, out_q, **kwargs):
+    with mock.patch("pulpcore.plugin.stages.artifact_stages.ProgressReport"):
+        ad = ArtifactDownloader(**kwargs)
+        ad._connect(in_q, out_q)
+        await ad()
+
+
+@pytest.mark.asyncio
+async def test_large_downloads_lane(advance, downloader_mock, in_q, out_q, queue_dc):
+    # Four large downloads of 10 seconds, then four small ones of 1 second
+    for _ in range(4):
+        queue_dc(delays=[10], size=100)
+    for _ in range(4):
+        queue_dc(delays=[1], size=1)
+    in_q.put_nowait(None)
+    task = asyncio.ensure_future(
+        run_downloader(
+            in_q,
+            out_q,
+            max_concurrent_content=8,
+            large_download_size=100,
+            max_concurrent_large_downloads=2,
+        )
+    )
+
+    # At 0.5 seconds, only two large downloads run next to the small ones
+    await advance(0.5)
+    assert downloader_mock.running == 6
+    # At 1.5 seconds, the small downloads are done
+    await advance(1.0)
+    assert downloader_mock.running == 2
+    assert out_q.qsize() == 4
+    # At 20.5 seconds, all downloads are done
+    await advance(19.0)
+    assert downloader_mock.downloads == 8
+    assert out_q.qsize() == 9
+    await task
+
+
+@pytest.mark.asyncio
+async def test_max_bytes_in_flight(advance, downloader_mock, in_q, out_q, queue_dc):
+    queue_dc(delays=[5], size=60)
+    queue_dc(delays=[5], size=80)
+    queue_dc(delays=[1], size=20)
+    queue_dc(delays=[1], size=30)
+    in_q.put_nowait(None)
+    task = asyncio.ensure_future(run_downloader(in_q, out_q, max_bytes_in_flight=100))
+
+    # At 0.5 seconds, the downloads of 60 and 20 bytes fit the budget
+    await advance(0.5)
+    assert downloader_mock.running == 2
+    # At 1.5 seconds, the smaller download of 30 bytes is started before the one of 80 bytes
+    await advance(1.0)
+    assert downloader_mock.running == 2
+    assert downloader_mock.downloads == 1
+    # At 5.5 seconds, the download of 80 bytes is started with nothing else in flight
+    await advance(4.0)
+    assert downloader_mock.running == 1
+    assert downloader_mock.downloads == 3
+    await advance(5.0)
+    assert downloader_mock.downloads == 4
+    assert out_q.qsize() == 5
+    await task
+
+
+@pytest.fixture
+def deduplication(settings):
+    settings.DOWNLOAD_DEDUPLICATION = True
+
+
+@pytest.mark.asyncio
+async def test_downloads_not_claimed(advance, downloader_mock, in_q, out_q, queue_dc):
+    queue_dc(delays=[1], sha256="aa")
+    in_q.put_nowait(None)
+    with mock.patch.object(ArtifactDownloader, "_try_claim") as try_claim:
+        task = asyncio.ensure_future(run_downloader(in_q, out_q))
+        await advance(2)
+        await task
+
+    try_claim.assert_not_called()
+    assert downloader_mock.downloads == 1
+    assert not out_q.get_nowait().d_artifacts[0].download_claimed
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("deduplication")
+async def test_claimed_downloads(advance, downloader_mock, in_q, out_q, queue_dc):
+    saved_artifact = mock.Mock()
+    saved_artifact._state.adding = False
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def try_claim(sha256s):
+        # The download of "aa" is claimed, "bb" is downloaded by another task
+        return sha256s == ["aa"]
+
+    async def saved_artifacts(sha256s):
+        # "bb" is saved by the other task after 2 seconds
+        if loop.time() - start < 2:
+            return {}
+        return {"bb": saved_artifact}
+
+    queue_dc(delays=[1], sha256="aa")
+    queue_dc(delays=[1], sha256="bb")
+    in_q.put_nowait(None)
+    with mock.patch.object(
+        ArtifactDownloader, "_try_claim", side_effect=try_claim
+    ), mock.patch.object(ArtifactDownloader, "_saved_artifacts", side_effect=saved_artifacts):
+        task = asyncio.ensure_future(run_downloader(in_q, out_q))
+        await advance(3)
+        await task
+
+    assert downloader_mock.downloads == 1
+    claimed, saved = out_q.get_nowait(), out_q.get_nowait()
+    assert claimed.d_artifacts[0].download_claimed
+    assert not saved.d_artifacts[0].download_claimed
+    assert saved.d_artifacts[0].artifact is saved_artifact
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("deduplication")
+async def test_claims_of_content_taken_at_once(advance, downloader_mock, in_q, out_q, queue_dc):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def try_claim(sha256s):
+        # Another task downloads "bb" for 2 seconds
+        return loop.time() - start >= 2
+
+    queue_dc(delays=[1, 1, 1], sha256=["bb", "aa", "bb"])
+    in_q.put_nowait(None)
+    with mock.patch.object(
+        ArtifactDownloader, "_try_claim", side_effect=try_claim
+    ) as claim, mock.patch.object(ArtifactDownloader, "_saved_artifacts", return_value={}):
+        task = asyncio.ensure_future(run_downloader(in_q, out_q))
+        await advance(1)
+        # The distinct downloads of the content unit are claimed in one go
+        claim.assert_called_with(["aa", "bb"])
+        assert downloader_mock.running == 0
+        await advance(3)
+        await task
+
+    assert downloader_mock.downloads == 3
+    assert all(d_artifact.download_claimed for d_artifact in out_q.get_nowait().d_artifacts)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("deduplication")
+async def test_claim_timeout(advance, downloader_mock, in_q, out_q, queue_dc):
+    queue_dc(delays=[1], sha256="aa")
+    in_q.put_nowait(None)
+    with mock.patch.object(ArtifactDownloader, "_try_claim", return_value=False), mock.patch.object(
+        ArtifactDownloader, "_saved_artifacts", return_value={}
+    ), mock.patch.object(artifact_stages, "_DOWNLOAD_CLAIM_TIMEOUT", 10):
+        task = asyncio.ensure_future(run_downloader(in_q, out_q))
+        await advance(5)
+        assert downloader_mock.running == 0
+        # The task gives up waiting for the other one and downloads the artifact itself
+        await advance(10)
+        await task
+
+    assert downloader_mock.downloads == 1
+    assert not out_q.get_nowait().d_artifacts[0].download_claimed
+
+
+@pytest.mark.django_db
+def test_try_claim_downloads():
+    aa, bb, cc = (hashlib.sha256(data).hexdigest() for data in (b"a", b"b", b"c"))
+    with ThreadPoolExecutor(max_workers=1) as other_session:
+        assert other_session.submit(_try_claim_downloads, [aa, bb]).result()
+        assert not _try_claim_downloads([bb, cc])
+        # The claim of "cc" was not kept since "bb" could not be claimed
+        assert other_session.submit(_try_claim_downloads, [cc]).result()
+        other_session.submit(_release_download_claims, [aa, bb, cc]).result()
+        other_session.submit(connections.close_all).result()
+    assert _try_claim_downloads([aa, bb, cc])
+    _release_download_claims([aa, bb, cc])
+
+
+def test_concurrency_suffix():
+    ad = ArtifactDownloader()
+    assert ad._concurrency_suffix() is None
+    for limits in ({"a.example.org": 4}, {"a.example.org": 2, "b.example.org": 10}):
+        download_factory = mock.Mock()
+        download_factory.limits.return_value = limits
+        ad._download_factories.add(download_factory)
+    assert ad._concurrency_suffix() == "a.example.org: 4 concurrent, b.example.org: 10 concurrent"
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+import time
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+
+from pulpcore.plugin.models import Artifact
+from pulpcore.plugin.stages import ArtifactSaver
+
+pytestmark = pytest.mark.usefixtures("fake_domain")
+
+
+class ObjectStorage(Storage):
+    """An in-memory stand-in for an object storage, tracking its parallel uploads."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploading = 0
+        self.max_uploading = 0
+        self._lock = threading.Lock()
+
+    def _save(self, name, content):
+        with self._lock:
+            self.uploading += 1
+            self.max_uploading = max(self.max_uploading, self.uploading)
+        time.sleep(0.05)
+        self.objects[name] = content.read()
+        with self._lock:
+            self.uploading -= 1
+        return name
+
+    def exists(self, name):
+        return False
+
+    def _open(self, name, mode="rb"):
+        return ContentFile(self.objects[name], name=name)
+
+
+@pytest.mark.asyncio
+async def test_upload_files(tmp_path):
+    storage = ObjectStorage()
+    artifacts = []
+    for i in range(4):
+        data = str(i).encode()
+        path = tmp_path / str(i)
+        path.write_bytes(data)
+        artifacts.append(Artifact(file=str(path), sha256=hashlib.sha256(data).hexdigest()))
+
+    await ArtifactSaver._upload_files(storage, artifacts)
+
+    assert storage.max_uploading > 1
+    for i, artifact in enumerate(artifacts):
+        assert artifact.file.name == artifact.storage_path("")
+        assert artifact.file._committed
+        assert storage.objects[artifact.file.name] == str(i).encode()
@@ -0,0 +1,86 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+
+from pulpcore.app.util import current_task
+from pulpcore.plugin.models import Content, Repository, Task
+from pulpcore.plugin.stages import ContentAssociation, DeclarativeContent
+
+
+@pytest.fixture
+def repository(db):
+    repository = Repository.objects.create(name=uuid4())
+    repository.CONTENT_TYPES = [Content]
+    return repository
+
+
+@pytest.fixture
+def task(db):
+    return Task.objects.create(name="sync")
+
+
+@pytest.fixture
+def contents(db):
+    contents = [Content(pulp_type="core.content") for _ in range(0, 4)]
+    Content.objects.bulk_create(contents)
+    return contents
+
+
+def associate(task, new_version, mirror, contents):
+    """Run ContentAssociation on a stream and return the content passed to the next stage."""
+
+    async def run():
+        in_q = asyncio.Queue()
+        out_q = asyncio.Queue()
+        for content in contents:
+            await in_q.put(DeclarativeContent(content=content))
+        await in_q.put(None)
+        stage = ContentAssociation(new_version, mirror)
+        stage._connect(in_q, out_q)
+        await stage()
+        passed = []
+        while (d_content := await out_q.get()) is not None:
+            passed.append(d_content.content)
+        return stage, passed
+
+    # The progress reports of the stage are saved on the current task
+    token = current_task.set(task)
+    try:
+        return async_to_sync(run)()
+    finally:
+        current_task.reset(token)
+
+
+def staging_table_exists(stage):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [stage._staging_table])
+        return cursor.fetchone()[0] is not None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mirror", [False, True])
+def test_associate_content(task, repository, contents, mirror):
+    with repository.new_version() as version:
+        version.add_content(Content.objects.filter(pk__in=[c.pk for c in contents[:3]]))
+
+    with repository.new_version() as version:
+        stage, passed = associate(task, version, mirror, contents[1:])
+
+    assert passed == contents[3:]
+    assert set(version.added().values_list("pk", flat=True)) == {contents[3].pk}
+    if mirror:
+        assert set(version.removed().values_list("pk", flat=True)) == {contents[0].pk}
+        assert set(version.content.values_list("pk", flat=True)) == {c.pk for c in contents[1:]}
+    else:
+        assert not version.removed().exists()
+        assert set(version.content.values_list("pk", flat=True)) == {c.pk for c in contents}
+    assert not staging_table_exists(stage)
+    reports = {report.code: report.done for report in task.progress_reports.all()}
+    assert reports == (
+        {"associating.content": 1, "unassociating.content": 1}
+        if mirror
+        else {"associating.content": 1}
+    )
@@ -0,0 +1,91 @@
+import hashlib
+from uuid import uuid4
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from pulpcore.plugin.models import Content, ContentArtifact, Remote, RemoteArtifact
+from pulpcore.plugin.stages import DeclarativeArtifact, DeclarativeContent, RemoteArtifactSaver
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def remote():
+    return Remote.objects.create(name=str(uuid4()), url="http://example.com/")
+
+
+@pytest.fixture
+def content():
+    content = Content.objects.create(pulp_type="core.content")
+    for relative_path in ("a", "b", "c"):
+        ContentArtifact.objects.create(content=content, relative_path=relative_path)
+    return content
+
+
+def declare(content, remote, relative_paths):
+    return DeclarativeContent(
+        content=content,
+        d_artifacts=[
+            DeclarativeArtifact(
+                url="http://example.com/{}".format(relative_path),
+                relative_path=relative_path,
+                remote=remote,
+                artifact_attributes={"sha256": hashlib.sha256(relative_path.encode()).hexdigest()},
+            )
+            for relative_path in relative_paths
+        ],
+    )
+
+
+def remote_artifact_urls(content):
+    return dict(
+        RemoteArtifact.objects.filter(content_artifact__content=content).values_list(
+            "content_artifact__relative_path", "url"
+        )
+    )
+
+
+def test_match_remote_artifacts(content, remote):
+    content_artifacts = {ca.relative_path: ca for ca in content.contentartifact_set.all()}
+    # "a" is known with the same URL, "b" with an outdated one, and "c" is missing
+    RemoteArtifact.objects.create(
+        url="http://example.com/a", content_artifact=content_artifacts["a"], remote=remote
+    )
+    outdated = RemoteArtifact.objects.create(
+        url="http://example.com/old/b", content_artifact=content_artifacts["b"], remote=remote
+    )
+
+    async_to_sync(RemoteArtifactSaver()._handle_remote_artifacts)([declare(content, remote, "abc")])
+
+    assert remote_artifact_urls(content) == {
+        "a": "http://example.com/a",
+        "b": "http://example.com/b",
+        "c": "http://example.com/c",
+    }
+    assert RemoteArtifact.objects.get(pk=outdated.pk).url == "http://example.com/b"
+
+
+def test_match_duplicate_remote_artifacts(content, remote):
+    # The same artifact declared twice in a batch is only created once
+    batch = [declare(content, remote, "a"), declare(content, remote, "aa")]
+
+    async_to_sync(RemoteArtifactSaver()._handle_remote_artifacts)(batch)
+
+    assert RemoteArtifact.objects.filter(content_artifact__content=content).count() == 1
+    assert remote_artifact_urls(content) == {"a": "http://example.com/a"}
+
+
+def test_match_missing_content_artifact(content, remote):
+    with pytest.raises(ValueError):
+        async_to_sync(RemoteArtifactSaver()._handle_remote_artifacts)(
+            [declare(content, remote, ["d"])]
+        )
+
+    d_content = declare(content, remote, ["d"])
+    saver = RemoteArtifactSaver(fix_mismatched_remote_artifacts=True)
+    async_to_sync(saver._handle_remote_artifacts)([d_content])
+
+    # The relative path of one of the content artifacts of the content is used instead
+    (relative_path,) = remote_artifact_urls(content)
+    assert d_content.d_artifacts[0].relative_path == relative_path
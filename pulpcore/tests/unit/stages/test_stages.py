@@ -1,9 +1,25 @@
 import asyncio
+import os
+from collections import defaultdict
+import threading
 import pytest
 
 import mock
 
-from pulpcore.plugin.stages import Stage, EndStage, DeclarativeContent
+from pulpcore.constants import TASK_STATES
+from pulpcore.download import telemetry
+from pulpcore.download.telemetry import DownloadStats, DownloadTelemetry
+from pulpcore.plugin.models import ProgressReport
+from pulpcore.plugin.stages import (
+    create_pipeline,
+    Stage,
+    EndStage,
+    DeclarativeArtifact,
+    DeclarativeContent,
+    ShardedStages,
+    sync_to_db,
+)
+from pulpcore.plugin.stages.api import DatabaseExecutor
 
 
 pytestmark = pytest.mark.usefixtures("fake_domain")
@@ -154,3 +170,206 @@ async def test_batch_queue_and_min_sizes():
                 last_stage._connect(queues[1], queues[2])
                 end_stage._connect(queues[2], None)
                 await asyncio.gather(last_stage(), middle_stage(), first_stage(), end_stage())
+
+
+def test_declarative_artifact_attributes():
+    remote = mock.Mock()
+    da = DeclarativeArtifact(
+        artifact_attributes={"sha256": "abc", "size": 3},
+        url="http://example.org/a",
+        relative_path="a",
+        remote=remote,
+    )
+    assert not da.artifact_is_saved
+    assert da.get_artifact_attribute("sha256") == "abc"
+    assert da.get_artifact_attribute("sha512") is None
+    assert da.get_artifact_attribute("file") is None
+    assert da._artifact is None
+
+    artifact = da.artifact
+    assert artifact._state.adding
+    assert artifact.sha256 == "abc"
+    assert artifact.size == 3
+    assert da.artifact is artifact
+    assert da.get_artifact_attribute("size") == 3
+
+
+@pytest.mark.parametrize("durability,defer_fsync", [("file", False), ("batch", True)])
+def test_declarative_artifact_download_durability(settings, durability, defer_fsync):
+    settings.DOWNLOAD_DURABILITY = durability
+    downloader = mock.Mock()
+    downloader.run = mock.AsyncMock(
+        return_value=mock.Mock(artifact_attributes={"sha256": "abc", "size": 3}, path="a")
+    )
+    remote = mock.Mock()
+    remote.get_downloader.return_value = downloader
+    da = DeclarativeArtifact(
+        artifact_attributes={"sha256": "abc", "size": 3},
+        url="http://example.org/a",
+        relative_path="a",
+        remote=remote,
+    )
+    asyncio.run(da.download())
+    # Only the downloads saved by the ArtifactSaver are flushed in batches
+    assert downloader.defer_fsync is defer_fsync
+
+
+def test_declarative_artifact_attributes_validation():
+    remote = mock.Mock()
+    with pytest.raises(ValueError):
+        DeclarativeArtifact(url="http://example.org/a", relative_path="a", remote=remote)
+    with pytest.raises(ValueError):
+        DeclarativeArtifact(
+            artifact=mock.Mock(),
+            artifact_attributes={},
+            url="http://example.org/a",
+            relative_path="a",
+            remote=remote,
+        )
+    with pytest.raises(ValueError):
+        DeclarativeArtifact(
+            artifact_attributes={"file": "/tmp/a"},
+            url="http://example.org/a",
+            relative_path="a",
+            remote=remote,
+        )
+    with pytest.raises(ValueError):
+        DeclarativeArtifact(artifact_attributes={}, url="http://example.org/a", relative_path="a")
+
+
+class ShardContent:
+    def __init__(self, value):
+        self.value = value
+        self.pid = None
+
+    def natural_key(self):
+        return (self.value,)
+
+
+class ShardFirstStage(Stage):
+    def __init__(self, num, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num = num
+        self.resolved = None
+
+    async def run(self):
+        d_contents = [DeclarativeContent(ShardContent(i)) for i in range(self.num)]
+        for d_content in d_contents:
+            await self.put(d_content)
+        # Awaiting an item after handing it over must thaw the batches in the shard
+        self.resolved = await d_contents[0].resolution()
+
+
+class ShardStage(Stage):
+    async def run(self):
+        async for batch in self.batches(minsize=1000):
+            for d_content in batch:
+                d_content.content.pid = os.getpid()
+                await self.put(d_content)
+
+
+class CollectStage(Stage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.contents = []
+
+    async def run(self):
+        async for d_content in self.items():
+            self.contents.append(d_content.content)
+
+
+def test_sharded_stages():
+    first_stage = ShardFirstStage(20)
+    collect_stage = CollectStage()
+    with ShardedStages([ShardStage()], shards=3) as sharded_stages:
+        asyncio.run(create_pipeline([first_stage, sharded_stages, collect_stage, EndStage()]))
+
+    assert sorted(content.value for content in collect_stage.contents) == list(range(20))
+    pids = {content.pid for content in collect_stage.contents}
+    assert len(pids) > 1
+    assert os.getpid() not in pids
+    assert first_stage.resolved.value == 0
+    assert first_stage.resolved.pid in pids
+
+
+class ShardProgressStage(Stage):
+    async def run(self):
+        async with ProgressReport(message="Handling", code="handling") as pb:
+            async for d_content in self.items():
+                await pb.aincrement()
+                await self.put(d_content)
+
+
+def test_sharded_stages_progress_reports():
+    saved = []
+
+    async def asave(report, *args, **kwargs):
+        saved.append((report.pk, report.done, report.state))
+
+    with mock.patch("django.db.models.Model.asave", asave):
+        with ShardedStages([ShardProgressStage()], shards=3) as sharded_stages:
+            asyncio.run(
+                create_pipeline([ShardFirstStage(20), sharded_stages, CollectStage(), EndStage()])
+            )
+
+    # The progress reports of the shards are saved as one by the parent process
+    assert len({pk for pk, _done, _state in saved}) == 1
+    assert saved[-1][1:] == (20, TASK_STATES.COMPLETED)
+
+
+class ShardDownloadStage(Stage):
+    async def run(self):
+        telemetry = DownloadTelemetry("remote")
+        async for d_content in self.items():
+            stats = DownloadStats("example.org")
+            stats.duration = 1.0
+            stats.status = 200
+            telemetry.record(stats)
+            await self.put(d_content)
+
+
+def test_sharded_stages_download_stats(monkeypatch):
+    monkeypatch.setattr(telemetry, "_totals", defaultdict(telemetry._totals.default_factory))
+    with ShardedStages([ShardDownloadStage()], shards=3) as sharded_stages:
+        asyncio.run(
+            create_pipeline([ShardFirstStage(20), sharded_stages, CollectStage(), EndStage()])
+        )
+
+    # The downloads of the shards are summed up by the parent process
+    (summary,) = telemetry.summary()
+    assert (summary["remote"], summary["host"], summary["downloads"]) == (
+        "remote",
+        "example.org",
+        20,
+    )
+    assert summary["duration"] == 20.0
+
+
+def test_database_executor():
+    db_executor = DatabaseExecutor(3)
+
+    async def run():
+        keyed = [db_executor.run(threading.get_ident, key="key") for _i in range(6)]
+        unkeyed = [db_executor.run(threading.get_ident) for _i in range(6)]
+        return await asyncio.gather(*keyed), await asyncio.gather(*unkeyed)
+
+    try:
+        keyed_threads, unkeyed_threads = asyncio.run(run())
+    finally:
+        db_executor.shutdown()
+    assert len(set(keyed_threads)) == 1
+    assert len(set(unkeyed_threads)) == 3
+    assert threading.get_ident() not in keyed_threads + unkeyed_threads
+
+
+def test_sync_to_db_in_pipeline():
+    threads = []
+
+    class DatabaseStage(Stage):
+        async def run(self):
+            threads.append(await sync_to_db(lambda: threading.current_thread().name)())
+
+    asyncio.run(create_pipeline([DatabaseStage(), EndStage()], db_workers=2))
+    asyncio.run(create_pipeline([DatabaseStage(), EndStage()], db_workers=0))
+    assert threads[0].startswith("pulp-stages-db")
+    assert not threads[1].startswith("pulp-stages-db")
@@ -0,0 +1,83 @@
+import os
+import signal
+from multiprocessing import Pipe
+from unittest import mock
+
+import pytest
+
+from pulpcore.tasking import _util
+from pulpcore.tasking._util import run_task_executor
+
+# The signals handled by the tasks, which the executor restores while it is idle
+_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGUSR1)
+
+
+@pytest.fixture
+def executor():
+    """Run a task executor in this process, recording the tasks and the database connections."""
+    events = []
+    worker_pipe, executor_pipe = Pipe()
+    wakeup_fd = signal.set_wakeup_fd(-1)
+    handlers = {sig: signal.getsignal(sig) for sig in _SIGNALS}
+
+    def perform_task(task_pk, working_directory):
+        events.append(("task", task_pk))
+        # A task leaves its working directory, which must not be the one of the next task
+        os.chdir(working_directory)
+
+    def run(tasks, max_tasks, max_memory=None):
+        for task in tasks:
+            worker_pipe.send(task)
+        with mock.patch.object(_util, "connection") as connection, mock.patch.object(
+            _util, "connections"
+        ) as connections, mock.patch.object(
+            _util, "perform_task", side_effect=perform_task
+        ), mock.patch.object(
+            _util, "release_held_slots"
+        ):
+            connection.ensure_connection.side_effect = lambda: events.append("connect")
+            connections.close_all.side_effect = lambda: events.append("close")
+            run_task_executor(executor_pipe, max_tasks, max_memory)
+        retiring = []
+        while worker_pipe.poll():
+            retiring.append(worker_pipe.recv())
+        return retiring
+
+    yield events, run
+    signal.set_wakeup_fd(wakeup_fd)
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+    worker_pipe.close()
+    executor_pipe.close()
+
+
+def test_run_tasks_until_max_tasks(executor, tmp_path):
+    events, run = executor
+    cwd = os.getcwd()
+
+    retiring = run([("a", str(tmp_path)), ("b", str(tmp_path)), ("c", str(tmp_path))], 2)
+
+    # Every task gets new database connections, and the executor retires after two tasks
+    assert events == ["connect", ("task", "a"), "close", "connect", ("task", "b"), "close"]
+    assert retiring == [False, True]
+    assert os.getcwd() == cwd
+
+
+def test_retire_on_max_memory(executor, tmp_path):
+    events, run = executor
+    usage = mock.Mock(ru_maxrss=2048 * 1024)
+
+    with mock.patch.object(_util.resource, "getrusage", return_value=usage):
+        retiring = run([("a", str(tmp_path)), ("b", str(tmp_path))], 10, max_memory=1024)
+
+    assert events == ["connect", ("task", "a"), "close"]
+    assert retiring == [True]
+
+
+def test_stop_idle_executor(executor):
+    events, run = executor
+
+    retiring = run([None], 10)
+
+    assert events == ["connect"]
+    assert retiring == []
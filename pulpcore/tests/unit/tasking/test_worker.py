@@ -0,0 +1,215 @@
+import pytest
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+from uuid import uuid4
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from pulpcore.app.models import Task, Worker
+from pulpcore.app.models.task import _uuid_to_advisory_lock
+from pulpcore.constants import TASK_STATES
+from pulpcore.tasking.worker import PulpcoreWorker, SupervisedTask
+
+
+@pytest.fixture
+def worker(db):
+    """A worker scanning the task queue, without its processes and heartbeats."""
+    worker = PulpcoreWorker.__new__(PulpcoreWorker)
+    worker.name = str(uuid4())
+    worker.worker = Worker.objects.create(name=worker.name)
+    worker.slots = 1
+    worker.supervised_tasks = {}
+    worker.versions = {}
+    worker.cursor = connection.cursor()
+    worker.heartbeat_period = 0
+    worker.task_grace_timeout = 0
+    worker.worker_cleanup_countdown = 100
+    return worker
+
+
+@pytest.fixture
+def started(worker):
+    """The tasks started by the worker, each supervised with a mocked executor."""
+    tasks = []
+
+    def start_task(task):
+        tasks.append(task)
+        executor = mock.Mock()
+        executor.process.pid = len(tasks)
+        worker.supervised_tasks[task.pk] = SupervisedTask(task, executor, mock.Mock())
+
+    worker.start_task = start_task
+    yield tasks
+    for task in tasks:
+        if task.pk in worker.supervised_tasks:
+            task.__exit__(None, None, None)
+
+
+@pytest.fixture
+def claimed(worker):
+    """The tasks claimed in a test, whose locks are released afterwards."""
+    tasks = []
+    yield tasks
+    for task in tasks:
+        if task is not None:
+            task.__exit__(None, None, None)
+
+
+@pytest.fixture
+def other_worker(db):
+    """The database session of another worker, holding the locks of the tasks it claimed."""
+    session = ThreadPoolExecutor(max_workers=1)
+
+    def execute(function, task):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT {}(%s)".format(function), [_uuid_to_advisory_lock(task.pk.int)])
+
+    @contextmanager
+    def run(task):
+        # Move the lock of a task claimed in this session over to the other worker
+        task.__exit__(None, None, None)
+        session.submit(execute, "pg_advisory_lock", task).result()
+        try:
+            yield
+        finally:
+            session.submit(execute, "pg_advisory_unlock", task).result()
+
+    yield run
+    session.submit(connections.close_all).result()
+    session.shutdown()
+
+
+def create_task(*resources, state=TASK_STATES.WAITING, **kwargs):
+    return Task.objects.create(
+        name="test", state=state, reserved_resources_record=list(resources), **kwargs
+    )
+
+
+def test_next_task_scan(worker, claimed):
+    runnable = create_task("a")
+    # Tasks blocked by the resources of the runnable one
+    for _i in range(3):
+        create_task("a")
+        create_task("shared:a", "b")
+
+    with CaptureQueriesContext(connection) as few_tasks:
+        task = worker.next_task()
+    claimed.append(task)
+    assert task.pk == runnable.pk
+    assert task.worker_id == worker.worker.pk
+    # The domain of the claimed task is loaded along with it
+    assert "pulp_domain" in task._state.fields_cache
+
+    Task.objects.filter(pk=task.pk).update(worker=None)
+    task.__exit__(None, None, None)
+    claimed.clear()
+    for _i in range(10):
+        create_task("a")
+        create_task("shared:a", "b")
+
+    # The blocked tasks don't cost a query each
+    with CaptureQueriesContext(connection) as many_tasks:
+        claimed.append(worker.next_task())
+    assert claimed[0].pk == runnable.pk
+    assert len(many_tasks) == len(few_tasks)
+
+
+def test_claim_different_candidates(worker, claimed, other_worker):
+    first = create_task("a")
+    second = create_task("b")
+    other = PulpcoreWorker.__new__(PulpcoreWorker)
+    other.__dict__.update(worker.__dict__, worker=Worker.objects.create(name=str(uuid4())))
+
+    task = other.next_task()
+    assert task.pk == first.pk
+    with other_worker(task):
+        # The task claimed by the other worker is skipped, although it still waits
+        claimed.append(worker.next_task())
+        assert claimed[0].pk == second.pk
+        assert claimed[0].worker_id == worker.worker.pk
+        assert Task.objects.get(pk=first.pk).worker_id == other.worker.pk
+        worker.supervised_tasks[second.pk] = claimed[0]
+        assert worker.next_task() is None
+
+
+def test_claimed_task_blocks_resources(worker, claimed, other_worker):
+    first = create_task("a", "shared:b")
+    create_task("a")
+    create_task("shared:a")
+    runnable = create_task("shared:b", "c")
+    create_task("b")
+    first.worker = Worker.objects.create(name=str(uuid4()))
+    first.save()
+
+    first.__enter__()
+    with other_worker(first):
+        # The resources of the claimed task are taken until it ran
+        claimed.append(worker.next_task())
+        assert claimed[0].pk == runnable.pk
+        worker.supervised_tasks[runnable.pk] = claimed[0]
+        assert worker.next_task() is None
+
+
+def test_release_claim_of_missing_worker(worker, claimed):
+    # The worker claiming the task died before running it, so no session holds its lock
+    task = create_task("a", worker=Worker.objects.create(name=str(uuid4())))
+    create_task("a")
+
+    claimed.append(worker.next_task())
+    assert claimed[0].pk == task.pk
+    assert claimed[0].worker_id == worker.worker.pk
+    assert Task.objects.get(pk=task.pk).state == TASK_STATES.WAITING
+
+
+@pytest.mark.parametrize(
+    "resources,started_indexes",
+    [
+        ([["a"], ["b"], ["c"]], [0, 1]),
+        ([["a"], ["a"], ["b"]], [0, 2]),
+        ([["shared:a"], ["shared:a"], ["a"]], [0, 1]),
+        ([["a"], ["shared:a"], ["a"]], [0]),
+    ],
+)
+def test_slots(worker, started, resources, started_indexes):
+    worker.slots = 2
+    tasks = [create_task(*task_resources) for task_resources in resources]
+
+    worker.start_tasks()
+
+    assert [task.pk for task in started] == [tasks[index].pk for index in started_indexes]
+
+
+def test_abort_one_of_two_tasks(worker, started):
+    worker.slots = 2
+    create_task("a")
+    create_task("b")
+    worker.start_tasks()
+    first, second = worker.supervised_tasks.values()
+
+    with mock.patch("pulpcore.tasking.worker.os.kill") as kill:
+        second.cancel_state = TASK_STATES.CANCELED
+        worker.abort_canceled_tasks()
+        kill.assert_called_once_with(2, signal.SIGUSR1)
+
+        # The executor of the first task is signalled on cancelation, while the second one aborts
+        kill.reset_mock()
+        first.cancel_state = TASK_STATES.CANCELED
+        worker.abort_canceled_tasks()
+        kill.assert_called_once_with(1, signal.SIGUSR1)
+        kill.reset_mock()
+        worker.abort_canceled_tasks()
+        kill.assert_not_called()
+
+        # Each executor is signalled again after its own countdown
+        first.kill_countdown = 2
+        worker.beat()
+        worker.abort_canceled_tasks()
+        kill.assert_called_once_with(2, signal.SIGUSR1)
+
+    worker.finish_task(second, 0)
+    assert Task.objects.get(pk=second.task.pk).state == TASK_STATES.CANCELED
+    assert list(worker.supervised_tasks.values()) == [first]
+    assert Task.objects.get(pk=first.task.pk).state == TASK_STATES.WAITING
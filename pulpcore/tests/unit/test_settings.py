@@ -52,3 +52,13 @@ def test_api_root(settings):
     settings.set("API_ROOT", "hi/there/")
     with pytest.raises(ValidationError):
         settings.validators.validate()
+
+
+def test_download_durability(settings):
+    """Test that DOWNLOAD_DURABILITY only accepts the known modes."""
+    settings.set("DOWNLOAD_DURABILITY", "batch")
+    settings.validators.validate(only=["DOWNLOAD_DURABILITY"])
+
+    settings.set("DOWNLOAD_DURABILITY", "never")
+    with pytest.raises(ValidationError):
+        settings.validators.validate(only=["DOWNLOAD_DURABILITY"])
@@ -30,3 +30,16 @@ def test_get_view_name_for_model_not_found(monkeypatch):
     monkeypatch.setattr(util, "get_viewset_for_model", mock.Mock())
     with pytest.raises(LookupError):
         util.get_view_name_for_model(mock.Mock(), "foo")
+
+
+def test_sync_filesystems(monkeypatch, tmp_path):
+    """
+    Each filesystem holding the files is flushed once.
+    """
+    syncfs = mock.Mock(return_value=0)
+    monkeypatch.setattr(util, "_syncfs", lambda: syncfs)
+    paths = [tmp_path / "a", tmp_path / "b", tmp_path / "c"]
+    for path in paths:
+        path.write_bytes(b"data")
+    util.sync_filesystems(str(path) for path in paths)
+    assert syncfs.call_count == 1